@@ -1,10 +1,100 @@
+import argparse
+import csv
+import json
+import os
 import sqlite3
+import time
+from itertools import islice
 
+import booking
+import migrations
 
-def create_database():
-    """Создает базу данных и необходимые таблицы"""
-    # Подключаемся к базе данных (если файл базы данных не существует, он будет создан)
-    conn = sqlite3.connect("theater.db")
+# Размер пачки строк для одного executemany
+BATCH_SIZE = 1000
+
+# Колонки каждой таблицы сезона в порядке вставки
+SEASON_COLUMNS = {
+    "plays": ("name", "description"),
+    "showtimes": ("play_name", "date", "start_time", "duration"),
+    # Для зоны с местами задаются seat_rows и seats_per_row, available_tickets тогда можно не указывать
+    "zones": ("play_name", "date", "zone_name", "available_tickets", "seat_rows", "seats_per_row"),
+}
+
+# Вставка с обновлением по естественному ключу. Остаток билетов в существующей зоне не трогаем,
+# чтобы повторный импорт не "возвращал" уже проданные билеты.
+# Сеанс находит спектакль по названию, зона — первый сеанс спектакля на дату; сеансы неизвестных
+# спектаклей и зоны несуществующих сеансов пропускаются.
+UPSERT_SQL = {
+    "plays": "INSERT INTO plays (name, description) VALUES (?, ?) "
+             "ON CONFLICT (name) DO UPDATE SET description = excluded.description",
+    "showtimes": "INSERT INTO showtimes (play_id, date, start_time, duration) "
+                 "SELECT id, ?2, ?3, ?4 FROM plays WHERE name = ?1 "
+                 "ON CONFLICT (play_id, date, start_time) DO UPDATE SET duration = excluded.duration",
+    "zones": "INSERT INTO zones (showtime_id, zone_name, available_tickets, seat_rows, seats_per_row, seat_map) "
+             "SELECT s.id, ?3, COALESCE(?4, ?5 * ?6), ?5, ?6, "
+             "CASE WHEN ?5 IS NULL THEN NULL ELSE zeroblob((?5 * ?6 + 7) / 8) END "
+             "FROM showtimes s JOIN plays p ON p.id = s.play_id WHERE p.name = ?1 AND s.date = ?2 "
+             "ORDER BY s.start_time, s.id LIMIT 1 "
+             "ON CONFLICT (showtime_id, zone_name) DO NOTHING",
+}
+
+# Тестовый сезон
+TEST_SEASON = {
+    "plays": [
+        ('Гамлет', 'Трагедия Шекспира о датском принце'),
+        ('Ромео и Джульетта', 'Романтическая трагедия о любви и трагедии двух влюбленных'),
+        ('Три сестры', 'Драма Чехова о трех сестрах, мечтающих уехать в Москву'),
+        ('Макбет', 'Трагедия Шекспира о амбициозном лорде Макбете'),
+        ('Отелло', 'Трагедия Шекспира о ревности и манипуляциях'),
+        ('Король Лир', 'Трагедия о старом короле, который делит свое королевство между дочерьми'),
+    ],
+    # По несколько спектаклей на одну дату
+    "showtimes": [
+        ('Гамлет', '2024-11-20', '19:00', 150),
+        ('Ромео и Джульетта', '2024-11-20', '21:30', 120),
+        ('Три сестры', '2024-11-21', '18:00', 130),
+        ('Макбет', '2024-11-21', '20:30', 140),
+        ('Отелло', '2024-11-22', '19:00', 135),
+        ('Король Лир', '2024-11-22', '21:00', 160),
+        ('Гамлет', '2024-11-23', '18:30', 150),
+        ('Ромео и Джульетта', '2024-11-23', '20:45', 120),
+        ('Макбет', '2024-11-24', '19:15', 140),
+        ('Отелло', '2024-11-24', '21:00', 130),
+    ],
+    # Зоны и количество доступных билетов (разные зоны для каждого спектакля).
+    # В партере места именные: рядов × мест в ряду
+    "zones": [
+        ('Гамлет', '2024-11-20', 'Партер', 50, 5, 10),
+        ('Гамлет', '2024-11-20', 'Балкон', 30),
+        ('Ромео и Джульетта', '2024-11-20', 'Партер', 40, 5, 8),
+        ('Ромео и Джульетта', '2024-11-20', 'Балкон', 25),
+        ('Три сестры', '2024-11-21', 'Партер', 35, 5, 7),
+        ('Три сестры', '2024-11-21', 'Балкон', 20),
+        ('Макбет', '2024-11-21', 'Партер', 60, 6, 10),
+        ('Макбет', '2024-11-21', 'Балкон', 40),
+        ('Отелло', '2024-11-22', 'Партер', 55, 5, 11),
+        ('Отелло', '2024-11-22', 'Балкон', 30),
+        ('Король Лир', '2024-11-22', 'Партер', 50, 5, 10),
+        ('Король Лир', '2024-11-22', 'Балкон', 25),
+        ('Гамлет', '2024-11-23', 'Партер', 55, 5, 11),
+        ('Гамлет', '2024-11-23', 'Балкон', 35),
+        ('Ромео и Джульетта', '2024-11-23', 'Партер', 40, 5, 8),
+        ('Ромео и Джульетта', '2024-11-23', 'Балкон', 30),
+        ('Макбет', '2024-11-24', 'Партер', 60, 6, 10),
+        ('Макбет', '2024-11-24', 'Балкон', 40),
+        ('Отелло', '2024-11-24', 'Партер', 50, 5, 10),
+        ('Отелло', '2024-11-24', 'Балкон', 30),
+    ],
+}
+
+TEST_ORDERS = [
+    ('example@example.com', 'Гамлет', '2024-11-20', 'Партер', 2),
+    ('user@domain.com', 'Ромео и Джульетта', '2024-11-20', 'Балкон', 3),
+]
+
+
+def create_tables(conn):
+    """Создает таблицы, если их еще нет, и применяет миграции схемы"""
     cursor = conn.cursor()
 
     # Создаем таблицу спектаклей
@@ -55,96 +145,26 @@ def create_database():
         )
     """)
 
-    # Вставляем тестовые данные для спектаклей
-    cursor.execute("INSERT INTO plays (name, description) VALUES ('Гамлет', 'Трагедия Шекспира о датском принце')")
-    cursor.execute(
-        "INSERT INTO plays (name, description) VALUES ('Ромео и Джульетта', 'Романтическая трагедия о любви и трагедии двух влюбленных')")
-    cursor.execute(
-        "INSERT INTO plays (name, description) VALUES ('Три сестры', 'Драма Чехова о трех сестрах, мечтающих уехать в Москву')")
-    cursor.execute(
-        "INSERT INTO plays (name, description) VALUES ('Макбет', 'Трагедия Шекспира о амбициозном лорде Макбете')")
-    cursor.execute(
-        "INSERT INTO plays (name, description) VALUES ('Отелло', 'Трагедия Шекспира о ревности и манипуляциях')")
-    cursor.execute(
-        "INSERT INTO plays (name, description) VALUES ('Король Лир', 'Трагедия о старом короле, который делит свое королевство между дочерьми')")
-
-    # Вставляем временные слоты для спектаклей (по несколько спектаклей на одну дату)
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Гамлет', '2024-11-20', '19:00', 150)")
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Ромео и Джульетта', '2024-11-20', '21:30', 120)")
-
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Три сестры', '2024-11-21', '18:00', 130)")
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Макбет', '2024-11-21', '20:30', 140)")
-
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Отелло', '2024-11-22', '19:00', 135)")
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Король Лир', '2024-11-22', '21:00', 160)")
-
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Гамлет', '2024-11-23', '18:30', 150)")
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Ромео и Джульетта', '2024-11-23', '20:45', 120)")
-
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Макбет', '2024-11-24', '19:15', 140)")
-    cursor.execute(
-        "INSERT INTO showtimes (play_name, date, start_time, duration) VALUES ('Отелло', '2024-11-24', '21:00', 130)")
-
-    # Вставляем зоны и количество доступных билетов (разные зоны для каждого спектакля)
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Гамлет', '2024-11-20', 'Партер', 50)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Гамлет', '2024-11-20', 'Балкон', 30)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Ромео и Джульетта', '2024-11-20', 'Партер', 40)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Ромео и Джульетта', '2024-11-20', 'Балкон', 25)")
-
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Три сестры', '2024-11-21', 'Партер', 35)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Три сестры', '2024-11-21', 'Балкон', 20)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Макбет', '2024-11-21', 'Партер', 60)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Макбет', '2024-11-21', 'Балкон', 40)")
-
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Отелло', '2024-11-22', 'Партер', 55)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Отелло', '2024-11-22', 'Балкон', 30)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Король Лир', '2024-11-22', 'Партер', 50)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Король Лир', '2024-11-22', 'Балкон', 25)")
-
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Гамлет', '2024-11-23', 'Партер', 55)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Гамлет', '2024-11-23', 'Балкон', 35)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Ромео и Джульетта', '2024-11-23', 'Партер', 40)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Ромео и Джульетта', '2024-11-23', 'Балкон', 30)")
-
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Макбет', '2024-11-24', 'Партер', 60)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Макбет', '2024-11-24', 'Балкон', 40)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Отелло', '2024-11-24', 'Партер', 50)")
-    cursor.execute(
-        "INSERT INTO zones (play_name, date, zone_name, available_tickets) VALUES ('Отелло', '2024-11-24', 'Балкон', 30)")
-
-    # Вставляем несколько заказов
-    cursor.execute(
-        "INSERT INTO orders (email, play_name, date, zone_name, ticket_count) VALUES ('example@example.com', 'Гамлет', '2024-11-20', 'Партер', 2)")
-    cursor.execute(
-        "INSERT INTO orders (email, play_name, date, zone_name, ticket_count) VALUES ('user@domain.com', 'Ромео и Джульетта', '2024-11-20', 'Балкон', 3)")
+    # Создаем индексы и естественные ключи, нужные для импорта
+    conn.commit()
+    migrations.migrate(conn)
+
+
+def create_database(path=booking.DB_PATH):
+    """Создает базу данных и необходимые таблицы"""
+    # Подключаемся к базе данных (если файл базы данных не существует, он будет создан)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    create_tables(conn)
+
+    # Заполняем каталог тестовым сезоном
+    import_season(conn, TEST_SEASON)
+
+    # Оформляем несколько заказов (только в пустую базу, чтобы не плодить дубликаты) обычным путем,
+    # чтобы остатки и карты мест учитывали проданные билеты
+    if cursor.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 0:
+        for order in TEST_ORDERS:
+            booking.book_tickets(conn, *order)
 
     # Подтверждаем изменения и закрываем соединение
     conn.commit()
@@ -153,5 +173,88 @@ def create_database():
     print("База данных создана и заполнена тестовыми данными.")
 
 
+def _as_tuple(row, columns):
+    """Приводит строку сезона (кортеж или словарь из CSV/JSON) к кортежу в порядке колонок."""
+    if isinstance(row, dict):
+        # Пустая ячейка CSV означает отсутствующее значение
+        return tuple(None if row.get(column) == "" else row.get(column) for column in columns)
+    # Необязательные последние колонки можно опустить
+    return tuple(row) + (None,) * (len(columns) - len(row))
+
+
+def batches(rows, size=BATCH_SIZE):
+    """Нарезает поток строк на пачки, не читая его целиком."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_season(conn, season):
+    """Импортирует сезон одной транзакцией пачками executemany.
+    Возвращает (число добавленных или обновленных строк по таблицам, число пропущенных строк по таблицам,
+    затраченное время в секундах). Пропускаются сеансы неизвестных спектаклей, зоны несуществующих
+    сеансов и уже существующие зоны."""
+    counts = {}
+    skipped = {}
+    started = time.perf_counter()
+
+    with booking.immediate_transaction(conn):
+        # Порядок важен: сначала спектакли, затем их сеансы и зоны
+        for table, columns in SEASON_COLUMNS.items():
+            counts[table] = skipped[table] = 0
+            for batch in batches(season.get(table, ())):
+                # rowcount executemany — сумма изменений по всем строкам пачки, без изменений триггеров
+                changed = conn.executemany(UPSERT_SQL[table], [_as_tuple(row, columns) for row in batch]).rowcount
+                counts[table] += changed
+                skipped[table] += len(batch) - changed
+
+    return counts, skipped, time.perf_counter() - started
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def read_season(path):
+    """Читает сезон из JSON-файла или из папки с plays.csv, showtimes.csv и zones.csv.
+    CSV-файлы читаются потоково, по мере вставки."""
+    if os.path.isdir(path):
+        return {table: _read_csv(os.path.join(path, f"{table}.csv"))
+                for table in SEASON_COLUMNS if os.path.exists(os.path.join(path, f"{table}.csv"))}
+
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def import_season_file(path, db_path=booking.DB_PATH):
+    """Импортирует сезон из файла и печатает скорость загрузки."""
+    conn = booking.connect(db_path)
+    create_tables(conn)
+    counts, skipped, elapsed = import_season(conn, read_season(path))
+    conn.close()
+
+    total = sum(counts.values())
+    details = ", ".join(f"{table}: {count}" for table, count in counts.items())
+    print(f"Импортировано {total} строк ({details}) за {elapsed:.2f} с — "
+          f"{total / max(elapsed, 1e-9):.0f} строк/с.")
+    if sum(skipped.values()):
+        details = ", ".join(f"{table}: {count}" for table, count in skipped.items() if count)
+        print(f"Пропущено {sum(skipped.values())} строк ({details}): неизвестный спектакль или сеанс "
+              "либо зона уже есть.")
+
+
 if __name__ == "__main__":
-    create_database()
+    parser = argparse.ArgumentParser(description="Создание базы театра и импорт сезона.")
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--import", dest="season", metavar="PATH",
+                        help="JSON-файл или папка с CSV-файлами сезона")
+    args = parser.parse_args()
+
+    if args.season:
+        import_season_file(args.season, args.db)
+    else:
+        create_database(args.db)
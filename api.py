@@ -0,0 +1,367 @@
+"""HTTP API продаж для сайта и партнеров поверх service.py.
+
+Сервер на asyncio без сторонних зависимостей. Запросы к SQLite выполняются в пуле потоков,
+у каждого потока — подключение из общего пула, поэтому чтения идут параллельно (WAL),
+а цикл событий не блокируется, пока запись ждет блокировку.
+
+    GET    /dates
+    GET    /plays?date=...
+    GET    /zones?play=...&date=...
+    GET    /availability?play=...&date=...&zone=...
+    GET    /search?q=...      спектакли по словам из названия и описания с ближайшими сеансами
+    POST   /orders            {"email", "play_name", "date", "zone_name", "ticket_count"}
+    GET    /orders?email=...&before_id=...
+    DELETE /orders/<id>
+    POST   /cancellations     {"order_ids": [...]} | {"email"} | {"play_name" | "all_plays": true,
+                                                                   "date" | "all_dates": true}
+                              → отчет о возвратах
+    POST   /holds             {"email", "play_name", "date", "zone_name", "ticket_count"}
+    POST   /holds/<id>/confirm
+    DELETE /holds/<id>
+
+Бронь (/holds) держит билеты booking.HOLD_TTL секунд (--hold-ttl), пока сайт проводит оплату;
+неподтвержденные брони снимает holds.HoldScheduler. Ответы на заказ и подтверждение брони содержат
+ticket_code — подписанный код билета для проверки на входе (checkin.py).
+
+С --group-commit заказы, брони и подтверждения броней идут через очередь групповой фиксации
+(groupcommit.py): запросы, пришедшие почти одновременно, фиксируются одной транзакцией.
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import backup
+import booking
+import checkin
+import groupcommit
+import holds
+import service
+
+POOL_SIZE = 8
+
+# Ограничения на размер запроса
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 64 * 1024
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 410: "Gone", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    """Ошибка, которая отдается клиенту с указанным кодом ответа."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ConnectionPool:
+    """Пул подключений SQLite. Каждый запрос берет подключение и выполняется в потоке пула."""
+
+    def __init__(self, path=booking.DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+        self.connections = asyncio.Queue()
+        for _ in range(size):
+            # Подключение переходит между потоками пула, но в каждый момент используется одним из них
+            self.connections.put_nowait(booking.connect(path, check_same_thread=False))
+
+    async def run(self, func, *args):
+        """Выполняет func(conn, *args) в потоке пула со свободным подключением."""
+        conn = await self.connections.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, conn, *args)
+        finally:
+            self.connections.put_nowait(conn)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+def _param(query, name, required=True):
+    values = query.get(name)
+    if not values:
+        if required:
+            raise HttpError(400, f"Не указан параметр {name}")
+        return None
+    return values[0]
+
+
+def _int_param(query, name):
+    """Необязательный целочисленный параметр: None, если его нет, и 400, если это не число."""
+    value = _param(query, name, required=False)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HttpError(400, f"Параметр {name} должен быть целым числом")
+
+
+def _order_args(body):
+    """Разбирает тело запроса заказа или брони в аргументы service.place_order."""
+    try:
+        order = json.loads(body or b"{}")
+        return order["email"], order["play_name"], order["date"], order["zone_name"], int(order["ticket_count"])
+    except (ValueError, KeyError, TypeError):
+        raise HttpError(400, "Ожидается JSON с полями email, play_name, date, zone_name, ticket_count")
+
+
+class BookingApi:
+    """Маршрутизация запросов к функциям service.py."""
+
+    def __init__(self, pool, scheduler=None, hold_ttl=booking.HOLD_TTL, write_queue=None):
+        self.pool = pool
+        self.scheduler = scheduler
+        self.hold_ttl = hold_ttl
+        self.write_queue = write_queue
+
+    async def handle(self, method, path, query, body):
+        """Возвращает (код ответа, тело ответа для JSON)."""
+        if path == "/dates" and method == "GET":
+            return 200, await self.pool.run(service.list_dates)
+
+        if path == "/plays" and method == "GET":
+            return 200, await self.pool.run(service.list_plays, _param(query, "date"))
+
+        if path == "/zones" and method == "GET":
+            zones = await self.pool.run(service.list_zones, _param(query, "play"), _param(query, "date"))
+            return 200, [{"zone_name": zone, "available_tickets": tickets} for zone, tickets in zones]
+
+        if path == "/availability" and method == "GET":
+            tickets = await self.pool.run(service.get_available_tickets, _param(query, "play"),
+                                          _param(query, "date"), _param(query, "zone"))
+            if tickets is None:
+                raise HttpError(404, "Зона не найдена")
+            return 200, {"available_tickets": tickets}
+
+        if path == "/search" and method == "GET":
+            results = await self.pool.run(service.search_plays, _param(query, "q"))
+            return 200, [{"play_name": play, "showtimes": [{"date": date, "start_time": start_time}
+                                                           for date, start_time in showtimes]}
+                         for play, showtimes in results]
+
+        if path == "/orders" and method == "POST":
+            return await self.create_order(body)
+
+        if path == "/orders" and method == "GET":
+            page = await self.pool.run(service.load_history_page, _param(query, "email"),
+                                       _int_param(query, "before_id"))
+            keys = ("id", "play_name", "date", "zone_name", "ticket_count", "seats", "order_date")
+            return 200, [dict(zip(keys, row)) for row in page]
+
+        if path.startswith("/orders/") and method == "DELETE":
+            try:
+                order_id = int(path.rsplit("/", 1)[1])
+            except ValueError:
+                raise HttpError(404, "Заказ не найден")
+            result = await self.pool.run(service.cancel_order, order_id)
+            if result is None:
+                raise HttpError(404, "Заказ не найден")
+            play_name, date, zone_name, tickets = result
+            return 200, {"play_name": play_name, "date": date, "zone_name": zone_name, "available_tickets": tickets}
+
+        if path == "/cancellations" and method == "POST":
+            return await self.cancel_orders(body)
+
+        if path == "/holds" and method == "POST":
+            return await self.create_hold(body)
+
+        if path.startswith("/holds/"):
+            hold_id, _, action = path[len("/holds/"):].partition("/")
+            try:
+                hold_id = int(hold_id)
+            except ValueError:
+                raise HttpError(404, "Бронь не найдена")
+            if action == "confirm" and method == "POST":
+                try:
+                    if self.write_queue is not None:
+                        order_id, seats = await asyncio.wrap_future(self.write_queue.confirm_hold(hold_id))
+                    else:
+                        order_id, seats = await self.pool.run(service.confirm_hold, hold_id)
+                except booking.HoldExpiredError as e:
+                    raise HttpError(410, str(e))
+                return 201, {"order_id": order_id, "seats": seats,
+                             "ticket_code": checkin.ticket_code(self.pool.path, order_id)}
+            if not action and method == "DELETE":
+                result = await self.pool.run(service.release_hold, hold_id)
+                if result is None:
+                    raise HttpError(404, "Бронь не найдена")
+                play_name, date, zone_name, tickets = result
+                return 200, {"play_name": play_name, "date": date, "zone_name": zone_name,
+                             "available_tickets": tickets}
+
+        if path in ("/dates", "/plays", "/zones", "/availability", "/search", "/orders", "/holds", "/cancellations") \
+                or path.startswith(("/orders/", "/holds/")):
+            raise HttpError(405, "Метод не поддерживается")
+        raise HttpError(404, "Не найдено")
+
+    async def create_order(self, body):
+        args = _order_args(body)
+        try:
+            if self.write_queue is not None:
+                # Ждем фиксации пачки без занятого потока пула
+                order_id, tickets, seats = await asyncio.wrap_future(service.submit_order(self.write_queue, *args))
+            else:
+                order_id, tickets, seats = await self.pool.run(service.place_order, *args)
+        except booking.NotEnoughTicketsError as e:
+            raise HttpError(409, str(e))
+        except booking.BookingError as e:
+            raise HttpError(400, str(e))
+        return 201, {"order_id": order_id, "available_tickets": tickets, "seats": seats,
+                     "ticket_code": checkin.ticket_code(self.pool.path, order_id)}
+
+    async def cancel_orders(self, body):
+        try:
+            request = json.loads(body or b"{}")
+            order_ids = request.get("order_ids")
+            args = (None if order_ids is None else [int(order_id) for order_id in order_ids],
+                    request.get("email"), request.get("play_name"), request.get("date"),
+                    request.get("all_dates") is True, request.get("all_plays") is True)
+        except (ValueError, TypeError, AttributeError):
+            raise HttpError(400, "Ожидается JSON с полями order_ids, email или play_name и date")
+        try:
+            return 200, await self.pool.run(service.cancel_orders, *args)
+        except booking.BookingError as e:
+            raise HttpError(400, str(e))
+
+    async def create_hold(self, body):
+        args = _order_args(body)
+        try:
+            if self.write_queue is not None:
+                hold_id, tickets, seats, expires_at = await asyncio.wrap_future(
+                    service.submit_hold(self.write_queue, *args, self.hold_ttl))
+            else:
+                hold_id, tickets, seats, expires_at = await self.pool.run(service.hold_order, *args, self.hold_ttl)
+        except booking.NotEnoughTicketsError as e:
+            raise HttpError(409, str(e))
+        except booking.BookingError as e:
+            raise HttpError(400, str(e))
+        if self.scheduler is not None:
+            self.scheduler.add(hold_id, expires_at)
+        return 201, {"hold_id": hold_id, "available_tickets": tickets, "seats": seats, "expires_at": expires_at}
+
+
+async def _read_request(reader):
+    """Читает один HTTP-запрос. Возвращает None, если клиент закрыл соединение."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Некорректная строка запроса")
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "Слишком много заголовков")
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400, "Некорректный Content-Length")
+    if length < 0:
+        raise HttpError(400, "Некорректный Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise HttpError(413, "Слишком большой запрос")
+    body = await reader.readexactly(length) if length else b""
+
+    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+    return method.upper(), target, body, keep_alive
+
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+async def _serve_client(api, reader, writer):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                url = urlsplit(target)
+                status, payload = await api.handle(method, url.path, parse_qs(url.query), body)
+            except HttpError as e:
+                status, payload = e.status, {"error": e.message}
+            except asyncio.IncompleteReadError:
+                break
+            except Exception as e:
+                if booking.is_lock_error(e):
+                    status, payload = 503, {"error": "База данных занята, повторите запрос"}
+                else:
+                    status, payload = 500, {"error": str(e)}
+
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=8080, db_path=booking.DB_PATH, pool_size=POOL_SIZE,
+                hold_ttl=booking.HOLD_TTL, group_commit=False, backup_interval=None):
+    """Запускает HTTP API и работает до отмены."""
+    pool = ConnectionPool(db_path, pool_size)
+    await pool.run(service.prepare_database)
+    scheduler = holds.HoldScheduler(db_path).start()
+    write_queue = groupcommit.GroupCommitQueue(db_path).start() if group_commit else None
+    backups = backup.BackupScheduler(db_path, backup_interval * 60).start() if backup_interval else None
+    api = BookingApi(pool, scheduler, hold_ttl, write_queue)
+
+    server = await asyncio.start_server(lambda r, w: _serve_client(api, r, w), host, port, backlog=1024)
+    print(f"API продаж слушает http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        scheduler.stop()
+        if write_queue is not None:
+            write_queue.stop()
+        if backups is not None:
+            backups.stop()
+        pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API продаж билетов.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--pool", type=int, default=POOL_SIZE, help="число подключений к базе")
+    parser.add_argument("--hold-ttl", type=float, default=booking.HOLD_TTL, help="срок брони в секундах")
+    parser.add_argument("--group-commit", action="store_true",
+                        help="фиксировать одновременные заказы и брони одной транзакцией")
+    parser.add_argument("--backup-interval", type=float, metavar="MINUTES",
+                        help="снимать резервную копию базы каждые MINUTES минут (backup.py)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.db, args.pool, args.hold_ttl, args.group_commit,
+                          args.backup_interval))
+    except KeyboardInterrupt:
+        pass
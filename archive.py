@@ -0,0 +1,332 @@
+"""Перенос прошедших сеансов в сжатый архив.
+
+    python archive.py --before 2025-01-01 --vacuum
+    python archive.py --list
+
+Сеансы до даты отсечки вместе с зонами и заказами переносятся из живой базы в помесячные файлы
+archive/<имя базы>/ГГГГ-ММ.db.gz рядом с базой — сжатые gzip базы SQLite с таблицами showtimes, zones и
+orders. В живой базе остается маленький индекс archive_index (покупатель, месяц, диапазон id
+заказов), по которому service.load_history_page находит архивные заказы покупателя и распаковывает
+только нужные месяцы. Продажи по дням (daily_sales) архивация не уменьшает, итоги перенесенных
+заказов хранятся в archived_daily_sales.
+
+Перенос месяца идет в три шага: копирование в рабочий файл, сжатие с атомарной заменой архива и
+удаление из живой базы одной транзакцией. Сжатие и удаление идут под одной блокировкой записи:
+заказы, отмененные после копирования, убираются из рабочего файла до сжатия и не попадают ни в архив,
+ни в archive_index. Удаляются только заказы, уже лежащие в архиве, поэтому прерванную архивацию можно
+просто запустить снова.
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+import booking
+
+ARCHIVE_DIR_NAME = "archive"
+
+# Распакованные месяцы кэшируются, чтобы не распаковывать файл на каждую страницу истории
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "theater-archive")
+_cache_lock = threading.Lock()
+
+# Схема архивного месяца: названия хранятся строками, чтобы файл читался без живой базы
+_ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS month.showtimes (
+        id INTEGER PRIMARY KEY,
+        play_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        start_time TEXT,
+        duration INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS month.zones (
+        id INTEGER PRIMARY KEY,
+        showtime_id INTEGER NOT NULL,
+        zone_name TEXT NOT NULL,
+        available_tickets INTEGER NOT NULL,
+        sold_orders INTEGER NOT NULL,
+        sold_tickets INTEGER NOT NULL,
+        seat_rows INTEGER,
+        seats_per_row INTEGER,
+        seat_map BLOB
+    )""",
+    """CREATE TABLE IF NOT EXISTS month.orders (
+        id INTEGER PRIMARY KEY,
+        email TEXT NOT NULL,
+        zone_id INTEGER NOT NULL,
+        play_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        zone_name TEXT NOT NULL,
+        ticket_count INTEGER NOT NULL,
+        seats TEXT,
+        order_date TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS month.idx_orders_email_id ON orders (email, id)",
+]
+
+_COPY_SQL = [
+    """INSERT OR REPLACE INTO month.showtimes (id, play_name, date, start_time, duration)
+       SELECT s.id, p.name, s.date, s.start_time, s.duration FROM showtimes s JOIN plays p ON p.id = s.play_id
+       WHERE s.date >= ?1 AND s.date < ?2""",
+    """INSERT OR REPLACE INTO month.zones (id, showtime_id, zone_name, available_tickets, sold_orders, sold_tickets,
+                                           seat_rows, seats_per_row, seat_map)
+       SELECT z.id, z.showtime_id, z.zone_name, z.available_tickets, IFNULL(zs.orders, 0), IFNULL(zs.tickets, 0),
+              z.seat_rows, z.seats_per_row, z.seat_map
+       FROM showtimes s JOIN zones z ON z.showtime_id = s.id LEFT JOIN zone_sales zs ON zs.zone_id = z.id
+       WHERE s.date >= ?1 AND s.date < ?2""",
+    """INSERT OR REPLACE INTO month.orders (id, email, zone_id, play_name, date, zone_name, ticket_count, seats,
+                                            order_date)
+       SELECT o.id, o.email, o.zone_id, p.name, s.date, z.zone_name, o.ticket_count, o.seats, o.order_date
+       FROM showtimes s JOIN plays p ON p.id = s.play_id JOIN zones z ON z.showtime_id = s.id
+       JOIN orders o ON o.zone_id = z.id
+       WHERE s.date >= ?1 AND s.date < ?2""",
+]
+
+# Id, скопированные в рабочий файл в этот запуск: из живой базы удаляются и попадают в индекс только они
+_MOVED_SQL = [
+    ("showtimes", "SELECT s.id FROM showtimes s WHERE s.date >= ?1 AND s.date < ?2"),
+    ("zones", "SELECT z.id FROM showtimes s JOIN zones z ON z.showtime_id = s.id WHERE s.date >= ?1 AND s.date < ?2"),
+    ("orders", """SELECT o.id FROM showtimes s JOIN zones z ON z.showtime_id = s.id JOIN orders o ON o.zone_id = z.id
+                  WHERE s.date >= ?1 AND s.date < ?2"""),
+]
+
+HISTORY_COLUMNS = "id, play_name, date, zone_name, ticket_count, seats, order_date"
+
+
+def archive_dir(conn, schema="main"):
+    """Папка архива базы: archive/<имя базы> рядом с ее файлом (у залов в одной папке архивы не смешиваются).
+    schema — имя базы в подключении, для баз, присоединенных через ATTACH."""
+    path = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == schema) or booking.DB_PATH
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(path)), ARCHIVE_DIR_NAME, name)
+
+
+def _month_path(directory, month):
+    return os.path.join(directory, f"{month}.db.gz")
+
+
+def _month_bounds(month, cutoff):
+    """Диапазон дат [начало месяца, min(начало следующего, отсечка))."""
+    first = datetime.date.fromisoformat(f"{month}-01")
+    following = (first + datetime.timedelta(days=32)).replace(day=1)
+    return first.isoformat(), min(following.isoformat(), cutoff)
+
+
+def _compress(source, target):
+    """Сжимает файл во временный рядом с target и атомарно заменяет target."""
+    partial = target + ".partial"
+    with open(source, "rb") as src, open(partial, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, target)
+
+
+def _decompress(source, target):
+    with gzip.open(source, "rb") as src, open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def _move_month(conn, directory, month, cutoff):
+    """Переносит сеансы одного месяца. Возвращает (сеансов, заказов) перенесено."""
+    date_from, date_to = _month_bounds(month, cutoff)
+    target = _month_path(directory, month)
+    work = os.path.join(directory, f".{month}.db")
+    if os.path.exists(work):
+        os.remove(work)
+    # Месяц уже архивировали раньше (например, с другой отсечкой): дописываем в существующий файл
+    if os.path.exists(target):
+        _decompress(target, work)
+
+    try:
+        # Шаг 1: копия в рабочий файл; живая база только читается
+        conn.execute("ATTACH DATABASE ? AS month", (work,))
+        try:
+            with conn:
+                for sql in _ARCHIVE_SCHEMA:
+                    conn.execute(sql)
+                for sql in _COPY_SQL:
+                    conn.execute(sql, (date_from, date_to))
+                for table, sql in _MOVED_SQL:
+                    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS moved_{table} (id INTEGER PRIMARY KEY)")
+                    conn.execute(f"DELETE FROM temp.moved_{table}")
+                    conn.execute(f"INSERT INTO temp.moved_{table} (id) {sql}", (date_from, date_to))
+        finally:
+            # BEGIN IMMEDIATE заблокировал бы и рабочий файл, а шагу 2 нужно его править
+            conn.execute("DETACH DATABASE month")
+
+        # Шаги 2 и 3 под одной блокировкой записи
+        return booking.with_retries(_archive_month, conn, work, target, month)
+    finally:
+        os.remove(work)
+
+
+def _drop_cancelled(conn, work):
+    """Убирает из рабочего файла заказы, отмененные после копирования, и обновляет остатки их зон."""
+    cancelled = [(row[0],) for row in conn.execute(
+        "SELECT id FROM temp.moved_orders m WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.id = m.id)")]
+    if not cancelled:
+        return
+    conn.execute("DELETE FROM temp.moved_orders WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.id = moved_orders.id)")
+    zones = conn.execute(
+        "SELECT z.available_tickets, IFNULL(zs.orders, 0), IFNULL(zs.tickets, 0), z.seat_map, z.id "
+        "FROM temp.moved_zones m JOIN zones z ON z.id = m.id LEFT JOIN zone_sales zs ON zs.zone_id = z.id"
+    ).fetchall()
+    month_conn = sqlite3.connect(work)
+    try:
+        with month_conn:
+            month_conn.executemany("DELETE FROM orders WHERE id = ?", cancelled)
+            month_conn.executemany("UPDATE zones SET available_tickets = ?, sold_orders = ?, sold_tickets = ?, "
+                                   "seat_map = ? WHERE id = ?", zones)
+    finally:
+        month_conn.close()
+
+
+def _archive_month(conn, work, target, month):
+    with booking.immediate_transaction(conn):
+        # Шаг 2: архив на диске раньше, чем что-либо удалено из живой базы. Блокировка уже взята,
+        # поэтому отменить заказ между сжатием и удалением нельзя
+        _drop_cancelled(conn, work)
+        _compress(work, target)
+
+        # Шаг 3: удаление перенесенного; индекс строится только по действительно удаленным заказам
+        conn.execute("""
+            INSERT INTO archive_index (email, month, orders, min_id, max_id)
+            SELECT email, ?, COUNT(*), MIN(id), MAX(id) FROM orders
+            WHERE id IN (SELECT id FROM temp.moved_orders) GROUP BY email
+            ON CONFLICT (email, month) DO UPDATE SET
+                orders = orders + excluded.orders, min_id = MIN(min_id, excluded.min_id),
+                max_id = MAX(max_id, excluded.max_id)
+        """, (month,))
+        days = conn.execute(
+            "SELECT date(order_date), COUNT(*), SUM(ticket_count) FROM orders "
+            "WHERE id IN (SELECT id FROM temp.moved_orders) GROUP BY date(order_date)"
+        ).fetchall()
+        moved = conn.execute("DELETE FROM orders WHERE id IN (SELECT id FROM temp.moved_orders)").rowcount
+        # Триггеры уменьшили daily_sales: возвращаем проданное, архив не меняет историю продаж по дням
+        for day, orders, tickets in days:
+            conn.execute("UPDATE daily_sales SET orders = orders + ?, tickets = tickets + ? WHERE day = ?",
+                         (orders, tickets, day))
+            conn.execute(
+                "INSERT INTO archived_daily_sales (day, orders, tickets) VALUES (?, ?, ?) "
+                "ON CONFLICT (day) DO UPDATE SET orders = orders + excluded.orders, "
+                "tickets = tickets + excluded.tickets",
+                (day, orders, tickets)
+            )
+
+        # Брони на прошедшие сеансы уже не подтвердить
+        conn.execute("DELETE FROM holds WHERE zone_id IN (SELECT id FROM temp.moved_zones)")
+        # Зоны и сеансы, на которые после копирования успели оформить заказ, остаются до следующего запуска
+        conn.execute("DELETE FROM zones WHERE id IN (SELECT id FROM temp.moved_zones) "
+                     "AND NOT EXISTS (SELECT 1 FROM orders o WHERE o.zone_id = zones.id)")
+        conn.execute("DELETE FROM zone_sales WHERE zone_id IN (SELECT id FROM temp.moved_zones) "
+                     "AND NOT EXISTS (SELECT 1 FROM zones z WHERE z.id = zone_sales.zone_id)")
+        showtimes = conn.execute(
+            "DELETE FROM showtimes WHERE id IN (SELECT id FROM temp.moved_showtimes) "
+            "AND NOT EXISTS (SELECT 1 FROM zones z WHERE z.showtime_id = showtimes.id)"
+        ).rowcount
+        return showtimes, moved
+
+
+def archive_before(conn, cutoff, directory=None, progress=None):
+    """Переносит в архив сеансы с датой раньше cutoff (ГГГГ-ММ-ДД), их зоны и заказы.
+    Возвращает {месяц: (сеансов, заказов)}."""
+    directory = directory or archive_dir(conn)
+    os.makedirs(directory, exist_ok=True)
+    months = [row[0] for row in conn.execute(
+        "SELECT DISTINCT substr(date, 1, 7) FROM showtimes WHERE date < ? ORDER BY 1", (cutoff,))]
+    if conn.in_transaction:
+        conn.commit()
+
+    moved = {}
+    for month in months:
+        moved[month] = _move_month(conn, directory, month, cutoff)
+        if progress is not None:
+            progress(f"{month}: сеансов {moved[month][0]}, заказов {moved[month][1]}")
+    return moved
+
+
+def _open_month(directory, month):
+    """Подключение только для чтения к распакованному месяцу (распаковка — один раз на версию файла)."""
+    source = _month_path(directory, month)
+    key = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16]
+    cached = os.path.join(CACHE_DIR, f"{month}-{key}.db")
+    with _cache_lock:
+        if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(source):
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            partial = f"{cached}.{threading.get_ident()}.partial"
+            _decompress(source, partial)
+            os.replace(partial, cached)
+    return sqlite3.connect(f"file:{cached}?mode=ro", uri=True)
+
+
+def load_orders(conn, email, before_id=None, limit=100, directory=None, schema="main"):
+    """Архивные заказы покупателя с id меньше before_id, от новых к старым, не больше limit.
+    Строки в формате service.load_history_page. Открываются только месяцы, где у покупателя есть заказы."""
+    before_id = before_id if before_id is not None else 2 ** 63 - 1
+    months = conn.execute(
+        f"SELECT month, max_id FROM {schema}.archive_index WHERE email = ? AND min_id < ? ORDER BY max_id DESC",
+        (email, before_id)
+    ).fetchall()
+    if not months:
+        return []
+
+    directory = directory or archive_dir(conn, schema)
+    rows = []
+    for month, max_id in months:
+        # Месяцы идут по убыванию самого нового заказа: дальше заказы только старше уже найденных
+        if len(rows) >= limit and max_id < rows[limit - 1][0]:
+            break
+        if not os.path.exists(_month_path(directory, month)):
+            continue
+        month_conn = _open_month(directory, month)
+        try:
+            rows.extend(month_conn.execute(
+                f"SELECT {HISTORY_COLUMNS} FROM orders WHERE email = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (email, before_id, limit)
+            ))
+        finally:
+            month_conn.close()
+        rows.sort(key=lambda row: row[0], reverse=True)
+    return rows[:limit]
+
+
+def list_months(conn, directory=None):
+    """Архивные месяцы: [(месяц, заказов по индексу, размер файла в байтах)]."""
+    directory = directory or archive_dir(conn)
+    counts = dict(conn.execute("SELECT month, SUM(orders) FROM archive_index GROUP BY month"))
+    months = sorted(name[:-len(".db.gz")] for name in os.listdir(directory) if name.endswith(".db.gz")) \
+        if os.path.isdir(directory) else []
+    return [(month, counts.get(month, 0), os.path.getsize(_month_path(directory, month))) for month in months]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос прошедших сеансов в сжатый помесячный архив.")
+    parser.add_argument("--before", help="перенести сеансы с датой раньше этой (ГГГГ-ММ-ДД)")
+    parser.add_argument("--list", action="store_true", help="показать архивные месяцы")
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--dir", help="папка архива (по умолчанию archive/<имя базы> рядом с базой)")
+    parser.add_argument("--vacuum", action="store_true", help="сжать живую базу после переноса")
+    args = parser.parse_args()
+    if not args.before and not args.list:
+        parser.error("укажите --before или --list")
+
+    conn = booking.connect(args.db)
+    if args.before:
+        size = os.path.getsize(args.db)
+        moved = archive_before(conn, args.before, args.dir, progress=print)
+        print(f"Перенесено сеансов: {sum(s for s, _ in moved.values())}, "
+              f"заказов: {sum(o for _, o in moved.values())}.")
+        if args.vacuum:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+            print(f"Размер базы: {size / 2 ** 20:.1f} МБ → {os.path.getsize(args.db) / 2 ** 20:.1f} МБ.")
+    if args.list:
+        for month, orders, size in list_months(conn, args.dir):
+            print(f"{month}: заказов {orders}, {size / 2 ** 20:.2f} МБ")
+    conn.close()
@@ -0,0 +1,266 @@
+"""Резервные копии базы без остановки продаж.
+
+    python backup.py                              # снимок сейчас
+    python backup.py --list
+    python backup.py --check backups/theater/theater-20241120-180000-000000.db
+    python backup.py --restore --at "2024-11-20 18:00"
+
+Копия снимается через backup API SQLite (Connection.backup) шагами по BACKUP_PAGES страниц с
+паузой между шагами: каждый шаг держит транзакцию чтения недолго, а в режиме WAL чтение вообще не
+мешает записи, поэтому заказы оформляются во время копирования. Если базу меняют между шагами,
+SQLite начинает копирование заново; после MAX_RESTARTS перезапусков копия снимается за один
+проход — в WAL он тоже не блокирует заказы, только откладывает контрольную точку журнала.
+
+Снимок пишется во временный файл, проверяется PRAGMA integrity_check и только потом получает
+имя <база>-ГГГГММДД-ЧЧММСС-мкс.db в папке backups/<имя базы> рядом с базой, поэтому в папке не бывает
+недописанных или битых снимков. Восстановление выбирает последний снимок не позже --at, еще раз
+проверяет его и копирует в живую базу тем же backup API, предварительно сохранив текущее состояние
+снимком. Архив прошедших сеансов (archive.py) лежит в отдельных файлах и снимком не охватывается.
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import booking
+
+BACKUP_DIR_NAME = "backups"
+
+# Страниц за шаг (по 4 КБ — 4 МБ) и пауза между шагами (секунды), в которую пишут заказы
+BACKUP_PAGES = 1024
+BACKUP_SLEEP = 0.005
+
+# Сколько раз начинать копию заново из-за записи в базу, прежде чем снять ее за один проход
+MAX_RESTARTS = 3
+
+# Сколько последних снимков хранить
+BACKUP_KEEP = 48
+
+# Как часто снимать копию в приложении (минуты), если не задано THEATER_BACKUP_INTERVAL
+BACKUP_INTERVAL = 60
+
+# Микросекунды в имени: снимки, снятые в одну секунду (например, страховочный при восстановлении), не совпадут
+_TIME_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+
+class _Restarted(Exception):
+    """Копирование слишком часто начиналось заново."""
+
+
+def backup_dir(path):
+    """Папка снимков базы: backups/<имя базы> рядом с ее файлом."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(path)), BACKUP_DIR_NAME, name)
+
+
+def _snapshot_name(path, taken_at):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{name}-{taken_at.strftime(_TIME_FORMAT)}.db"
+
+
+def _copy(source, target_path, pages, sleep, max_restarts):
+    """Копирует базу source в файл target_path шагами. Возвращает (страниц, перезапусков)."""
+    stats = {"pages": 0, "remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        # Оставшихся страниц стало больше — SQLite начал копию заново после записи в базу
+        if stats["remaining"] is not None and remaining > stats["remaining"]:
+            stats["restarts"] += 1
+            if max_restarts is not None and stats["restarts"] > max_restarts:
+                raise _Restarted()
+        stats["pages"], stats["remaining"] = total, remaining
+
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _Restarted:
+            source.backup(target)
+        # Снимок — один самостоятельный файл, без журнала WAL рядом
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+    return stats["pages"], stats["restarts"]
+
+
+def check_snapshot(path):
+    """Проверяет файл снимка. Возвращает список проблем (пустой, если снимок цел)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        # Заголовок или схема испорчены настолько, что проверка не может начаться
+        problems = [str(e)]
+    finally:
+        conn.close()
+    return [] if problems == ["ok"] else problems
+
+
+def create_backup(path=booking.DB_PATH, directory=None, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP,
+                  max_restarts=MAX_RESTARTS, keep=BACKUP_KEEP):
+    """Снимает проверенную копию базы. Возвращает (путь снимка, статистика копирования)."""
+    directory = directory or backup_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    taken_at = datetime.datetime.now()
+    snapshot = os.path.join(directory, _snapshot_name(path, taken_at))
+    partial = snapshot + ".partial"
+
+    started = time.perf_counter()
+    source = booking.connect(path)
+    try:
+        page_size = source.execute("PRAGMA page_size").fetchone()[0]
+        page_count, restarts = _copy(source, partial, pages, sleep, max_restarts)
+    finally:
+        source.close()
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    problems = check_snapshot(partial)
+    check_elapsed = time.perf_counter() - started
+    if problems:
+        os.remove(partial)
+        raise sqlite3.DatabaseError(f"Снимок {snapshot} поврежден: {'; '.join(problems[:5])}")
+    os.replace(partial, snapshot)
+    _prune(path, directory, keep)
+
+    size = os.path.getsize(snapshot)
+    return snapshot, {
+        "pages": page_count,
+        "bytes": page_count * page_size,
+        "seconds": elapsed,
+        "mb_per_sec": size / 2 ** 20 / elapsed if elapsed else None,
+        "restarts": restarts,
+        "check_seconds": check_elapsed,
+    }
+
+
+def list_snapshots(path=booking.DB_PATH, directory=None):
+    """Снимки базы от старых к новым: [(время, путь)]."""
+    directory = directory or backup_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    prefix = os.path.splitext(os.path.basename(path))[0] + "-"
+    snapshots = []
+    for name in os.listdir(directory):
+        if not (name.startswith(prefix) and name.endswith(".db")):
+            continue
+        try:
+            taken_at = datetime.datetime.strptime(name[len(prefix):-len(".db")], _TIME_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append((taken_at, os.path.join(directory, name)))
+    return sorted(snapshots)
+
+
+def _prune(path, directory, keep):
+    """Удаляет снимки сверх keep последних."""
+    if keep:
+        for _, snapshot in list_snapshots(path, directory)[:-keep]:
+            os.remove(snapshot)
+
+
+def find_snapshot(path=booking.DB_PATH, at=None, directory=None):
+    """Последний снимок не позже момента at (datetime), без at — самый новый."""
+    snapshots = [snapshot for taken_at, snapshot in list_snapshots(path, directory) if at is None or taken_at <= at]
+    if not snapshots:
+        raise booking.BookingError("Нет подходящего снимка базы.")
+    return snapshots[-1]
+
+
+def restore(snapshot, path=booking.DB_PATH, directory=None):
+    """Заменяет содержимое живой базы снимком. Перед заменой текущее состояние сохраняется снимком,
+    чтобы восстановление можно было отменить. Возвращает путь этого страховочного снимка."""
+    problems = check_snapshot(snapshot)
+    if problems:
+        raise sqlite3.DatabaseError(f"Снимок {snapshot} поврежден: {'; '.join(problems[:5])}")
+    current, _ = create_backup(path, directory, keep=None)
+
+    source = sqlite3.connect(f"file:{snapshot}?mode=ro", uri=True)
+    target = booking.connect(path)
+    try:
+        # Целиком за один шаг: остальные подключения не должны увидеть наполовину замененную базу
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return current
+
+
+def format_stats(snapshot, stats):
+    return (f"{snapshot}: {stats['bytes'] / 2 ** 20:.1f} МБ за {stats['seconds']:.2f} с "
+            f"({stats['mb_per_sec']:.1f} МБ/с), перезапусков: {stats['restarts']}, "
+            f"проверка {stats['check_seconds']:.2f} с")
+
+
+class BackupScheduler:
+    """Снимает копию базы по расписанию в фоновом потоке."""
+
+    def __init__(self, path=booking.DB_PATH, interval=BACKUP_INTERVAL * 60, directory=None):
+        self.path = path
+        self.interval = interval
+        self.directory = directory
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает поток; начатая копия дописывается."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopped, self.interval)
+                if self.stopped:
+                    break
+            try:
+                snapshot, stats = create_backup(self.path, self.directory)
+                print(f"Резервная копия {format_stats(snapshot, stats)}", file=sys.stderr)
+            except (sqlite3.Error, OSError) as e:
+                # Следующая попытка — через интервал; прежние снимки остаются
+                print(f"Не удалось снять резервную копию: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Резервные копии базы театра без остановки продаж.")
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--dir", help="папка снимков (по умолчанию backups/<имя базы> рядом с базой)")
+    parser.add_argument("--list", action="store_true", help="показать снимки")
+    parser.add_argument("--check", metavar="SNAPSHOT", help="проверить целостность снимка")
+    parser.add_argument("--restore", nargs="?", const="", metavar="SNAPSHOT",
+                        help="восстановить базу из снимка (по умолчанию последнего или последнего до --at)")
+    parser.add_argument("--at", help="момент для восстановления (ГГГГ-ММ-ДД ЧЧ:ММ)")
+    parser.add_argument("--pages", type=int, default=BACKUP_PAGES, help="страниц за шаг копирования")
+    args = parser.parse_args()
+
+    if args.list:
+        for taken_at, snapshot in list_snapshots(args.db, args.dir):
+            print(f"{taken_at:%Y-%m-%d %H:%M:%S}\t{os.path.getsize(snapshot) / 2 ** 20:.1f} МБ\t{snapshot}")
+    elif args.check:
+        problems = check_snapshot(args.check)
+        for problem in problems:
+            print(problem)
+        print("Снимок цел." if not problems else f"Проблем: {len(problems)}")
+        sys.exit(1 if problems else 0)
+    elif args.restore is not None:
+        at = datetime.datetime.fromisoformat(args.at) if args.at else None
+        try:
+            snapshot = args.restore or find_snapshot(args.db, at, args.dir)
+        except booking.BookingError as e:
+            parser.error(str(e))
+        current = restore(snapshot, args.db, args.dir)
+        print(f"База восстановлена из {snapshot}. Прежнее состояние сохранено в {current}.")
+    else:
+        snapshot, stats = create_backup(args.db, args.dir, pages=args.pages)
+        print(f"Снимок {format_stats(snapshot, stats)}")
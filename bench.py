@@ -0,0 +1,289 @@
+"""Бенчмарки производительности на синтетической базе большого театра.
+
+    python bench.py generate --db bench.db --plays 500 --showtimes 20000 --orders 1000000
+    python bench.py run --db bench.db --out results.json
+    python bench.py compare base.json results.json
+
+Генератор и сценарии детерминированы по --seed, поэтому результаты разных коммитов,
+снятые на одной машине, можно сравнивать между собой.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import addinfo
+import booking
+import service
+import stats
+from catalog import CatalogCache
+
+ZONE_NAMES = ["Партер", "Амфитеатр", "Бельэтаж", "Балкон", "Ложа"]
+START_TIMES = ["12:00", "15:00", "18:00", "19:00", "20:30"]
+FIRST_DATE = datetime.date(2025, 1, 1)
+
+# Доля заказов, приходящихся на несколько корпоративных клиентов с длинной историей
+CORPORATE_SHARE = 0.01
+CORPORATE_ACCOUNTS = 10
+
+# Допустимый рост среднего времени сценария, после которого compare сообщает о регрессии
+DEFAULT_THRESHOLD = 0.25
+
+
+def generate_database(path, plays=100, showtimes=2000, zones=3, orders=100000, capacity=None, seed=1):
+    """Строит базу с заданным числом спектаклей, сеансов, зон на сеанс и заказов.
+    Остатки в зонах согласованы с заказами: остаток = вместимость − продано."""
+    rng = random.Random(seed)
+    zones = min(zones, len(ZONE_NAMES))
+    # Вместимость с запасом, чтобы все заказы поместились
+    capacity = capacity or max(100, 4 * orders // max(1, showtimes * zones) + 100)
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = booking.connect(path)
+    addinfo.create_tables(conn)
+
+    play_names = [f"Спектакль {i}" for i in range(plays)]
+    # Сеанс i: спектакль i % plays, дата сдвигается каждые plays сеансов — пара (спектакль, дата) уникальна
+    shows = [(play_names[i % plays], (FIRST_DATE + datetime.timedelta(days=i // plays)).isoformat())
+             for i in range(showtimes)]
+
+    season = {
+        "plays": ((name, f"Описание спектакля {name}") for name in play_names),
+        "showtimes": ((play, date, rng.choice(START_TIMES), rng.randint(90, 180)) for play, date in shows),
+        "zones": ((play, date, zone, capacity) for play, date in shows for zone in ZONE_NAMES[:zones]),
+    }
+    addinfo.import_season(conn, season)
+
+    zone_ids = {(play, date, zone): zone_id for zone_id, play, date, zone in conn.execute(
+        "SELECT id, play_name, date, zone_name FROM zone_details")}
+    sold = {}
+    customers = max(1, orders // 10)
+
+    def order_rows():
+        for _ in range(orders):
+            play, date = shows[rng.randrange(showtimes)]
+            zone_id = zone_ids[(play, date, ZONE_NAMES[rng.randrange(zones)])]
+            count = rng.randint(1, 4)
+            sold[zone_id] = sold.get(zone_id, 0) + count
+            if rng.random() < CORPORATE_SHARE:
+                email = f"corp{rng.randrange(CORPORATE_ACCOUNTS)}@bench.ru"
+            else:
+                email = f"user{rng.randrange(customers)}@bench.ru"
+            yield email, zone_id, count
+
+    with booking.immediate_transaction(conn):
+        for batch in addinfo.batches(order_rows(), 10000):
+            conn.executemany("INSERT INTO orders (email, zone_id, ticket_count) VALUES (?, ?, ?)", batch)
+        conn.executemany("UPDATE zones SET available_tickets = available_tickets - ? WHERE id = ?",
+                         [(count, zone_id) for zone_id, count in sold.items()])
+
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    return {"plays": plays, "showtimes": showtimes, "zones": showtimes * zones, "orders": orders,
+            "capacity": capacity, "seed": seed}
+
+
+def _timed(samples, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    samples.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def copy_database(source, target):
+    """Согласованная копия базы через backup API, чтобы сценарии записи не меняли исходник."""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    src.backup(dst)
+    dst.close()
+    src.close()
+
+
+def run_scenarios(db_path, iterations=1000, seed=1, pdf=True):
+    """Прогоняет сценарии на копии базы. Возвращает {сценарий: сводка задержек}."""
+    rng = random.Random(seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bench.db")
+        copy_database(db_path, path)
+        conn = booking.connect(path)
+
+        shows = conn.execute("SELECT play_name, date, zone_name FROM zone_details ORDER BY id").fetchall()
+        emails = [row[0] for row in conn.execute("SELECT DISTINCT email FROM orders ORDER BY email LIMIT 10000")]
+        corporate = [f"corp{i}@bench.ru" for i in range(CORPORATE_ACCOUNTS)]
+
+        # Каскад комбобоксов: запросы к базе
+        samples = {name: [] for name in ("cascade_dates", "cascade_plays", "cascade_zones", "cascade_available")}
+        for _ in range(iterations):
+            play, date, zone = rng.choice(shows)
+            _timed(samples["cascade_dates"], service.list_dates, conn)
+            _timed(samples["cascade_plays"], service.list_plays, conn, date)
+            _timed(samples["cascade_zones"], service.list_zones, conn, play, date)
+            _timed(samples["cascade_available"], service.get_available_tickets, conn, play, date, zone)
+        results.update({name: stats.summarize(values) for name, values in samples.items()})
+
+        # Кэш каталога: загрузка одним проходом и ответы из памяти
+        load_samples = []
+        cache = CatalogCache(path)
+        for _ in range(max(1, iterations // 100)):
+            _timed(load_samples, cache.reload)
+        results["catalog_load"] = stats.summarize(load_samples)
+        lookup_samples = []
+        for _ in range(iterations):
+            play, date, zone = rng.choice(shows)
+            _timed(lookup_samples, lambda: (cache.get_plays(date), cache.get_zones(play, date),
+                                            cache.get_available_tickets(play, date, zone)))
+        results["catalog_cached_lookup"] = stats.summarize(lookup_samples)
+
+        # История заказов: первая страница обычного и корпоративного клиента, глубокая страница
+        first_samples, deep_samples = [], []
+        for _ in range(iterations):
+            _timed(first_samples, service.load_history_page, conn, rng.choice(emails + corporate))
+            email = rng.choice(corporate)
+            oldest = conn.execute("SELECT MIN(id) FROM orders WHERE email = ?", (email,)).fetchone()[0] or 0
+            _timed(deep_samples, service.load_history_page, conn, email, oldest + service.HISTORY_PAGE_SIZE)
+        results["history_first_page"] = stats.summarize(first_samples)
+        results["history_deep_page"] = stats.summarize(deep_samples)
+
+        # Оформление и отмена заказов
+        order_samples, cancel_samples = [], []
+        for i in range(iterations):
+            play, date, zone = rng.choice(shows)
+            try:
+                _timed(order_samples, service.place_order, conn, f"bench{i}@bench.ru", play, date, zone, 1)
+            except booking.NotEnoughTicketsError:
+                pass
+        for i in range(iterations):
+            _timed(cancel_samples, service.cancel_latest_order, conn, f"bench{i}@bench.ru")
+        results["handle_order"] = stats.summarize(order_samples)
+        results["cancel_last_order"] = stats.summarize(cancel_samples)
+
+        conn.close()
+        cache.conn.close()
+
+        # PDF-билеты (ReportLab — необязательная зависимость для бенчмарка)
+        if pdf:
+            try:
+                import tickets
+            except ImportError:
+                results["pdf_ticket"] = {"skipped": "reportlab не установлен"}
+            else:
+                pdf_samples = []
+                for i in range(max(1, iterations // 10)):
+                    play, date, zone = rng.choice(shows)
+                    _timed(pdf_samples, tickets.render_ticket, os.path.join(workdir, f"t{i}.pdf"),
+                           "bench@bench.ru", play, date, zone, 2)
+                results["pdf_ticket"] = stats.summarize(pdf_samples)
+
+                # Тот же билет с кодом для входа и QR-кодом (checkin.py); ключ фиксирован, файл ключа не нужен
+                import checkin
+                key = b"bench-ticket-key"
+                code_samples = []
+                for i in range(max(1, iterations // 10)):
+                    play, date, zone = rng.choice(shows)
+                    _timed(code_samples, tickets.render_ticket, os.path.join(workdir, f"c{i}.pdf"),
+                           "bench@bench.ru", play, date, zone, 2, None, checkin.sign(key, i + 1))
+                results["pdf_ticket_with_code"] = stats.summarize(code_samples)
+
+    return results
+
+
+def _environment(db_path):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    conn = sqlite3.connect(db_path)
+    sizes = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+             for table in ("plays", "showtimes", "zones", "orders")}
+    conn.close()
+    return {"commit": commit, "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "database": sizes}
+
+
+def compare(base, current, threshold=DEFAULT_THRESHOLD):
+    """Сравнивает два файла результатов. Возвращает список регрессий (сценарий, было, стало)."""
+    regressions = []
+    for name, result in current["results"].items():
+        before = base["results"].get(name, {})
+        if "mean_ms" not in result or "mean_ms" not in before:
+            continue
+        if result["mean_ms"] > before["mean_ms"] * (1 + threshold):
+            regressions.append((name, before["mean_ms"], result["mean_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки на синтетической базе театра.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="построить синтетическую базу")
+    generate.add_argument("--db", default="bench.db")
+    generate.add_argument("--plays", type=int, default=100)
+    generate.add_argument("--showtimes", type=int, default=2000)
+    generate.add_argument("--zones", type=int, default=3, help="зон на сеанс (до 5)")
+    generate.add_argument("--orders", type=int, default=100000)
+    generate.add_argument("--seed", type=int, default=1)
+
+    run = commands.add_parser("run", help="прогнать сценарии и сохранить JSON")
+    run.add_argument("--db", default="bench.db")
+    run.add_argument("--out", default="bench_results.json")
+    run.add_argument("--iterations", type=int, default=1000)
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--no-pdf", action="store_true", help="не замерять печать PDF")
+
+    diff = commands.add_parser("compare", help="сравнить два файла результатов")
+    diff.add_argument("base")
+    diff.add_argument("current")
+    diff.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help="допустимый рост среднего времени (0.25 = +25%%)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        started = time.perf_counter()
+        params = generate_database(args.db, args.plays, args.showtimes, args.zones, args.orders, seed=args.seed)
+        print(f"База {args.db} построена за {time.perf_counter() - started:.1f} с: {params}")
+        return 0
+
+    if args.command == "run":
+        results = run_scenarios(args.db, args.iterations, args.seed, pdf=not args.no_pdf)
+        report = {"environment": _environment(args.db),
+                  "parameters": {"iterations": args.iterations, "seed": args.seed},
+                  "results": results}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        for name, result in results.items():
+            if "mean_ms" in result:
+                print(f"{name:24} p50 {result['p50_ms']:8.3f} мс  p95 {result['p95_ms']:8.3f} мс  "
+                      f"p99 {result['p99_ms']:8.3f} мс")
+            else:
+                print(f"{name:24} {result}")
+        print(f"Результаты сохранены в {args.out}")
+        return 0
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(base, current, args.threshold)
+    for name, before, after in regressions:
+        print(f"Регрессия {name}: {before:.3f} мс → {after:.3f} мс ({after / before - 1:+.0%})")
+    if not regressions:
+        print("Регрессий не найдено.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+import json
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import seatmap
+
+DB_PATH = "theater.db"
+
+# Сколько ждать снятия блокировки внутри SQLite, прежде чем вернуть "database is locked"
+BUSY_TIMEOUT_MS = 5000
+
+# Повторные попытки при конфликте блокировок: число попыток и границы задержки (в секундах)
+MAX_RETRIES = 6
+BACKOFF_BASE = 0.02
+BACKOFF_MAX = 0.5
+
+# Режим синхронизации с диском. FULL (по умолчанию): подтвержденный заказ переживает и отключение
+# питания. NORMAL — явное решение администратора через THEATER_SYNCHRONOUS=NORMAL: в режиме WAL база
+# остается целой и fsync заметно меньше, но при отключении питания пропадут последние зафиксированные
+# заказы, о которых покупателю уже сообщили
+SYNCHRONOUS = os.environ.get("THEATER_SYNCHRONOUS", "FULL").upper()
+if SYNCHRONOUS not in ("FULL", "NORMAL", "EXTRA"):
+    raise ValueError(f"THEATER_SYNCHRONOUS: ожидается FULL, NORMAL или EXTRA, получено {SYNCHRONOUS}")
+
+# Сколько секунд держится бронь, пока покупатель не подтвердил заказ
+HOLD_TTL = 15 * 60
+
+# Сколько просроченных броней снимать одной транзакцией
+HOLD_RELEASE_BATCH = 500
+
+# Запросы продаж; их планы проверяет migrations.check_query_plans
+RESERVE_SQL = ("UPDATE zones SET available_tickets = available_tickets - ? "
+               "WHERE id = (SELECT id FROM zone_details WHERE play_name = ? AND date = ? AND zone_name = ?) "
+               "AND available_tickets >= ? "
+               "RETURNING id, available_tickets, seat_rows, seats_per_row, seat_map")
+AVAILABLE_TICKETS_SQL = "SELECT available_tickets FROM zone_details WHERE play_name = ? AND date = ? AND zone_name = ?"
+CANCEL_ORDERS_SQL = ("SELECT id, email, play_name, date, zone_name, ticket_count, seats, order_date, zone_id "
+                     "FROM order_details WHERE {where}")
+RELEASE_EXPIRED_SQL = ("DELETE FROM holds WHERE id IN (SELECT id FROM holds WHERE expires_at <= ? "
+                       "ORDER BY expires_at LIMIT ?) RETURNING zone_id, ticket_count, seats")
+
+# Класс подключения и обработчик повторов при блокировке; замер задержек (instrumentation.py) подменяет их
+connection_factory = sqlite3.Connection
+lock_retry_hook = None
+
+
+class BookingError(Exception):
+    """Базовая ошибка оформления заказа."""
+
+
+class NotEnoughTicketsError(BookingError):
+    """В зоне не хватает свободных билетов."""
+
+
+class NoAdjacentSeatsError(NotEnoughTicketsError):
+    """Билеты в зоне есть, но нужного числа мест рядом нет."""
+
+
+class HoldExpiredError(BookingError):
+    """Бронь истекла или уже снята."""
+
+
+def connect(path=DB_PATH, **kwargs):
+    """Открывает соединение в режиме WAL с таймаутом ожидания блокировки."""
+    kwargs.setdefault("factory", connection_factory)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    return conn
+
+
+def is_lock_error(error):
+    """Проверяет, что ошибка вызвана занятой базой, а не ошибкой в запросе."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+@contextmanager
+def immediate_transaction(conn):
+    """Выполняет блок в транзакции BEGIN IMMEDIATE: блокировка записи берется сразу.
+    Открытую транзакцию вызывающего не фиксирует, а отказывается начинать: иначе его незавершенные
+    изменения молча зафиксировались бы вместе с чужим блоком."""
+    if conn.in_transaction:
+        raise RuntimeError("immediate_transaction вызван внутри открытой транзакции")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def with_retries(func, *args, **kwargs):
+    """Вызывает func, повторяя его с ограниченной экспоненциальной задержкой при блокировке базы."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e) or attempt == MAX_RETRIES - 1:
+                raise
+            if lock_retry_hook is not None:
+                lock_retry_hook(e)
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+            time.sleep(random.uniform(0, delay))
+
+
+def _reserve(conn, play_name, date, zone_name, ticket_count):
+    """Списывает билеты и назначает места внутри открытой транзакции. Возвращает (id зоны, новый остаток, места)."""
+    # Проверка и списание одним условным запросом: продать больше, чем есть, невозможно.
+    # Зона находится по названиям один раз, дальше работа идет по целочисленному id;
+    # RETURNING сразу отдает новый остаток и карту мест, без отдельного SELECT
+    zone = conn.execute(RESERVE_SQL, (ticket_count, play_name, date, zone_name, ticket_count)).fetchall()
+    if not zone:
+        raise NotEnoughTicketsError("Недостаточно доступных билетов!")
+
+    zone_id, available_tickets, seat_rows, seats_per_row, seat_map = zone[0]
+    seats = None
+    if seat_map is not None:
+        # Зона с местами: выбираем лучшие места рядом в той же транзакции
+        place = seatmap.find_adjacent(seat_map, seat_rows, seats_per_row, ticket_count)
+        if place is None:
+            raise NoAdjacentSeatsError(f"Нет {ticket_count} свободных мест рядом в зоне {zone_name}!")
+        row, first = place
+        conn.execute(
+            "UPDATE zones SET seat_map = ? WHERE id = ?",
+            (seatmap.set_seats(seat_map, seats_per_row, row, first, ticket_count), zone_id)
+        )
+        seats = seatmap.encode_seats(row, first, ticket_count)
+    return zone_id, available_tickets, seats
+
+
+def _release(conn, zone_id, ticket_count, seats=()):
+    """Возвращает билеты в зону и освобождает места (список orders.seats) внутри открытой транзакции.
+    Возвращает новый остаток или None, если зоны нет."""
+    zone = conn.execute(
+        "UPDATE zones SET available_tickets = available_tickets + ? WHERE id = ? "
+        "RETURNING available_tickets, seats_per_row, seat_map",
+        (ticket_count, zone_id)
+    ).fetchall()
+    if not zone:
+        return None
+
+    available_tickets, seats_per_row, seat_map = zone[0]
+    seats = [item for item in seats if item]
+    if seats and seat_map is not None:
+        for item in seats:
+            row, first, count = seatmap.decode_seats(item)
+            seat_map = seatmap.set_seats(seat_map, seats_per_row, row, first, count, taken=False)
+        conn.execute("UPDATE zones SET seat_map = ? WHERE id = ?", (seat_map, zone_id))
+    return available_tickets
+
+
+def _zone_names(conn, zone_id):
+    """(спектакль, дата, зона) по id зоны."""
+    return conn.execute("SELECT play_name, date, zone_name FROM zone_details WHERE id = ?", (zone_id,)).fetchone()
+
+
+def _release_rows(conn, rows):
+    """Возвращает в зоны билеты строк (id зоны, билетов, места) внутри открытой транзакции.
+    Одно обновление на зону, сколько бы строк к ней ни относилось. Возвращает [(спектакль, дата, зона, остаток)]."""
+    zones = {}
+    for zone_id, ticket_count, seats in rows:
+        zone = zones.setdefault(zone_id, [0, []])
+        zone[0] += ticket_count
+        zone[1].append(seats)
+    return [(*_zone_names(conn, zone_id), _release(conn, zone_id, total, spans))
+            for zone_id, (total, spans) in zones.items()]
+
+
+def book_in_transaction(conn, email, play_name, date, zone_name, ticket_count):
+    """Тело book_tickets внутри уже открытой транзакции (для групповой фиксации, groupcommit.py)."""
+    zone_id, available_tickets, seats = _reserve(conn, play_name, date, zone_name, ticket_count)
+    cursor = conn.execute(
+        "INSERT INTO orders (email, zone_id, ticket_count, seats) VALUES (?, ?, ?, ?)",
+        (email, zone_id, ticket_count, seats)
+    )
+    return cursor.lastrowid, available_tickets, seats
+
+
+def _book(conn, email, play_name, date, zone_name, ticket_count):
+    with immediate_transaction(conn):
+        return book_in_transaction(conn, email, play_name, date, zone_name, ticket_count)
+
+
+def book_tickets(conn, email, play_name, date, zone_name, ticket_count):
+    """Атомарно списывает билеты, назначает места (если у зоны есть карта мест) и создает заказ.
+    Возвращает (id заказа, новый остаток зоны, места или None)."""
+    if ticket_count <= 0:
+        raise BookingError("Количество билетов должно быть положительным.")
+    return with_retries(_book, conn, email, play_name, date, zone_name, ticket_count)
+
+
+def get_available_tickets(conn, play_name, date, zone_name):
+    """Остаток билетов в зоне или None, если такой зоны нет."""
+    row = conn.execute(AVAILABLE_TICKETS_SQL, (play_name, date, zone_name)).fetchone()
+    return row[0] if row else None
+
+
+def _cancel(conn, order_id):
+    with immediate_transaction(conn):
+        order = conn.execute(
+            "DELETE FROM orders WHERE id = ? RETURNING zone_id, ticket_count, seats", (order_id,)
+        ).fetchall()
+        if not order:
+            return None
+
+        zone_id, ticket_count, seats = order[0]
+        # Возврат билетов в зону и удаление заказа фиксируются вместе
+        available_tickets = _release(conn, zone_id, ticket_count, [seats])
+        return (*_zone_names(conn, zone_id), available_tickets)
+
+
+def cancel_order(conn, order_id):
+    """Отменяет заказ и возвращает билеты в зону одной транзакцией.
+    Возвращает (спектакль, дата, зона, новый остаток) или None, если заказа нет."""
+    return with_retries(_cancel, conn, order_id)
+
+
+def _cancel_many(conn, where, params):
+    with immediate_transaction(conn):
+        # Удаление заказов и возврат билетов — одна транзакция: сбой посередине не испортит остатки
+        orders = conn.execute(CANCEL_ORDERS_SQL.format(where=where), params).fetchall()
+        conn.execute("DELETE FROM orders WHERE id IN (SELECT value FROM json_each(?))",
+                     (json.dumps([order[0] for order in orders]),))
+        released = _release_rows(conn, ((order[8], order[5], order[6]) for order in orders))
+        return [order[:8] for order in orders], released
+
+
+def cancel_orders(conn, order_ids=None, email=None, play_name=None, date=None, all_dates=False, all_plays=False):
+    """Отменяет пачку заказов одной транзакцией: по списку id, по почте или все заказы сеанса
+    (спектакль и дата, например при отмене спектакля). Условия можно сочетать. Спектакль без даты
+    отменяется на все даты только с all_dates=True, дата без спектакля — все спектакли дня — только
+    с all_plays=True.
+    Возвращает (отмененные заказы [(id, почта, спектакль, дата, зона, билетов, места, оформлен)],
+    [(спектакль, дата, зона, новый остаток)])."""
+    conditions, params = [], []
+    if order_ids is not None:
+        # Список id передается одним параметром: число заказов не ограничено числом параметров SQLite
+        conditions.append("id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(order_id) for order_id in order_ids]))
+    if email is not None:
+        conditions.append("email = ?")
+        params.append(email)
+    if play_name is not None:
+        # Забытая дата не должна молча отменить все показы спектакля
+        if date is None and not all_dates:
+            raise BookingError("Укажите дату сеанса или явно отмените спектакль на все даты.")
+        conditions.append("play_name = ?")
+        params.append(play_name)
+    if date is not None:
+        # Как и с датой: забытый спектакль не должен молча отменить весь день
+        if play_name is None and not all_plays:
+            raise BookingError("Укажите спектакль или явно отмените все спектакли этой даты.")
+        conditions.append("date = ?")
+        params.append(date)
+    if not conditions:
+        raise BookingError("Не указано, какие заказы отменить.")
+    return with_retries(_cancel_many, conn, " AND ".join(conditions), params)
+
+
+def hold_in_transaction(conn, email, play_name, date, zone_name, ticket_count, ttl=HOLD_TTL):
+    """Тело hold_tickets внутри уже открытой транзакции."""
+    zone_id, available_tickets, seats = _reserve(conn, play_name, date, zone_name, ticket_count)
+    expires_at = time.time() + ttl
+    cursor = conn.execute(
+        "INSERT INTO holds (email, zone_id, ticket_count, seats, expires_at) VALUES (?, ?, ?, ?, ?)",
+        (email, zone_id, ticket_count, seats, expires_at)
+    )
+    return cursor.lastrowid, available_tickets, seats, expires_at
+
+
+def _hold(conn, email, play_name, date, zone_name, ticket_count, ttl):
+    with immediate_transaction(conn):
+        return hold_in_transaction(conn, email, play_name, date, zone_name, ticket_count, ttl)
+
+
+def hold_tickets(conn, email, play_name, date, zone_name, ticket_count, ttl=HOLD_TTL):
+    """Бронирует билеты (и места) на ttl секунд. Забронированные билеты сразу списываются с остатка зоны,
+    поэтому их не продаст другая касса. Возвращает (id брони, новый остаток, места или None, срок unix-время)."""
+    if ticket_count <= 0:
+        raise BookingError("Количество билетов должно быть положительным.")
+    return with_retries(_hold, conn, email, play_name, date, zone_name, ticket_count, ttl)
+
+
+def confirm_in_transaction(conn, hold_id):
+    """Тело confirm_hold внутри уже открытой транзакции."""
+    hold = conn.execute(
+        "SELECT email, zone_id, ticket_count, seats, expires_at FROM holds WHERE id = ?", (hold_id,)
+    ).fetchone()
+    if not hold or hold[4] <= time.time():
+        # Просроченную бронь, которую планировщик еще не снял, не подтверждаем
+        raise HoldExpiredError("Время брони истекло, билеты возвращены в продажу.")
+
+    email, zone_id, ticket_count, seats, _ = hold
+    # Билеты уже списаны бронью: заказ просто занимает ее место
+    cursor = conn.execute(
+        "INSERT INTO orders (email, zone_id, ticket_count, seats) VALUES (?, ?, ?, ?)",
+        (email, zone_id, ticket_count, seats)
+    )
+    conn.execute("DELETE FROM holds WHERE id = ?", (hold_id,))
+    return cursor.lastrowid, seats
+
+
+def _confirm(conn, hold_id):
+    with immediate_transaction(conn):
+        return confirm_in_transaction(conn, hold_id)
+
+
+def confirm_hold(conn, hold_id):
+    """Превращает бронь в заказ. Возвращает (id заказа, места или None).
+    Если бронь снята или просрочена, бросает HoldExpiredError."""
+    return with_retries(_confirm, conn, hold_id)
+
+
+def _release_hold(conn, hold_id):
+    with immediate_transaction(conn):
+        holds = conn.execute(
+            "DELETE FROM holds WHERE id = ? RETURNING zone_id, ticket_count, seats", (hold_id,)
+        ).fetchall()
+        return _release_rows(conn, holds)[0] if holds else None
+
+
+def release_hold(conn, hold_id):
+    """Снимает бронь досрочно. Возвращает (спектакль, дата, зона, новый остаток) или None, если брони нет."""
+    return with_retries(_release_hold, conn, hold_id)
+
+
+def _release_expired(conn, now, limit):
+    with immediate_transaction(conn):
+        holds = conn.execute(RELEASE_EXPIRED_SQL, (now, limit)).fetchall()
+        return len(holds), _release_rows(conn, holds)
+
+
+def release_expired_holds(conn, now=None, limit=HOLD_RELEASE_BATCH):
+    """Снимает до limit броней со сроком не позже now одной транзакцией.
+    Возвращает (число снятых броней, [(спектакль, дата, зона, новый остаток)])."""
+    return with_retries(_release_expired, conn, time.time() if now is None else now, limit)
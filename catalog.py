@@ -0,0 +1,158 @@
+import threading
+
+import booking
+
+
+class CatalogCache:
+    """Кэш каталога в памяти для каскада дата → спектакль → зона.
+
+    Загружается одним проходом по базе и дальше отвечает из словарей. Изменения, сделанные
+    другими подключениями, обнаруживаются по PRAGMA data_version, а изменения самого каталога —
+    по счетчику catalog_version, который ведут триггеры. Чтение из базы
+    (load, fetch_changes) не трогает кэш и может выполняться в рабочем потоке, а результат
+    применяется через apply в потоке интерфейса.
+    """
+
+    def __init__(self, path=booking.DB_PATH):
+        self.path = path
+        # Отдельное подключение: значения PRAGMA data_version сравнимы только в пределах одного подключения
+        self.conn = None
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.fingerprint = None
+
+        self.dates = []
+        self.plays_by_date = {}
+        self.zones_by_show = {}
+        self.available = {}
+        self.descriptions = {}
+        self.showtimes = {}
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = booking.connect(self.path, check_same_thread=False)
+        return self.conn
+
+    def _data_version(self):
+        return self._connection().execute("PRAGMA data_version").fetchone()[0]
+
+    def _fingerprint(self):
+        """Отпечаток каталога: меняется при любом изменении спектаклей, сеансов и состава зон, включая
+        правку описания, длительности или времени начала."""
+        return self._connection().execute("SELECT version FROM catalog_version").fetchone()[0]
+
+    def _read_all(self):
+        """Весь каталог одним запросом: сеансы со спектаклями и зонами первого сеанса на дату.
+        Используется при первой загрузке, чтобы даты появились после одного прохода по базе."""
+        plays_by_date = {}
+        showtimes = {}
+        descriptions = {}
+        zones_by_show = {}
+        available = {}
+        for play_name, description, date, start_time, duration, zone_name, tickets in self._connection().execute("""
+                SELECT p.name, p.description, s.date, s.start_time, s.duration, z.zone_name, z.available_tickets
+                FROM showtimes s
+                JOIN plays p ON p.id = s.play_id
+                LEFT JOIN zones z ON z.showtime_id = s.id
+                ORDER BY s.date, p.name, s.start_time, s.id, z.zone_name"""):
+            plays = plays_by_date.setdefault(date, [])
+            if not plays or plays[-1] != play_name:
+                plays.append(play_name)
+            showtimes.setdefault((play_name, date), (start_time, duration))
+            descriptions[play_name] = description
+            if zone_name is not None:
+                zones_by_show.setdefault((play_name, date), []).append(zone_name)
+                available[(play_name, date, zone_name)] = tickets
+
+        return {
+            "descriptions": descriptions,
+            "dates": list(plays_by_date),
+            "plays_by_date": plays_by_date,
+            "showtimes": showtimes,
+            "zones_by_show": zones_by_show,
+            "available": available,
+        }
+
+    def _read_zones(self):
+        conn = self._connection()
+        zones_by_show = {}
+        available = {}
+        # Зоны читаются по порядку уникального индекса (сеанс, зона), а названия сеансов берутся из словаря
+        shows = {showtime_id: (play_name, date) for showtime_id, play_name, date in conn.execute(
+            "SELECT s.id, p.name, s.date FROM showtimes s JOIN plays p ON p.id = s.play_id")}
+        for showtime_id, zone_name, tickets in conn.execute(
+                "SELECT showtime_id, zone_name, available_tickets FROM zones ORDER BY showtime_id, zone_name"):
+            play_name, date = shows[showtime_id]
+            zones_by_show.setdefault((play_name, date), []).append(zone_name)
+            available[(play_name, date, zone_name)] = tickets
+        return {"zones_by_show": zones_by_show, "available": available}
+
+    def load(self):
+        """Читает весь каталог одним запросом. Возвращает снимок для apply."""
+        with self.lock:
+            snapshot = {"data_version": self._data_version(), "fingerprint": self._fingerprint()}
+            snapshot.update(self._read_all())
+            return snapshot
+
+    def fetch_changes(self):
+        """Проверяет, менялась ли база, и читает только то, что нужно.
+        Возвращает снимок для apply или None, если изменений нет."""
+        with self.lock:
+            data_version = self._data_version()
+            if data_version == self.data_version:
+                return None
+
+            fingerprint = self._fingerprint()
+            snapshot = {"data_version": data_version, "fingerprint": fingerprint}
+            if fingerprint != self.fingerprint:
+                # Первая загрузка или изменившийся каталог: весь каталог одним запросом
+                snapshot.update(self._read_all())
+            else:
+                # Остатки билетов перечитываем при любом изменении
+                snapshot.update(self._read_zones())
+            return snapshot
+
+    def apply(self, snapshot):
+        """Применяет снимок, полученный из load или fetch_changes."""
+        if snapshot:
+            for name, value in snapshot.items():
+                setattr(self, name, value)
+
+    def reload(self):
+        """Полностью перечитывает каталог."""
+        self.apply(self.load())
+
+    def refresh(self):
+        """Синхронно применяет изменения базы. Возвращает True, если кэш обновился."""
+        snapshot = self.fetch_changes()
+        self.apply(snapshot)
+        return snapshot is not None
+
+    def set_available(self, play_name, date, zone_name, tickets):
+        """Обновляет остаток одной зоны после своего заказа или отмены."""
+        if tickets is None:
+            self.available.pop((play_name, date, zone_name), None)
+        else:
+            self.available[(play_name, date, zone_name)] = tickets
+
+    def get_dates(self):
+        return self.dates
+
+    def get_plays(self, date):
+        return self.plays_by_date.get(date, [])
+
+    def get_zones(self, play_name, date):
+        return self.zones_by_show.get((play_name, date), [])
+
+    def get_available_tickets(self, play_name, date, zone_name):
+        """Остаток билетов в зоне или None, если такой зоны нет."""
+        return self.available.get((play_name, date, zone_name))
+
+    def get_description(self, play_name):
+        return self.descriptions.get(play_name)
+
+    def get_showtime(self, play_name, date=None):
+        """Время начала и длительность спектакля на дату (или первого его сеанса, если дата не задана)."""
+        if date is not None:
+            return self.showtimes.get((play_name, date))
+        return next((value for (name, _), value in self.showtimes.items() if name == play_name), None)
@@ -0,0 +1,322 @@
+"""Коды билетов и проверка на входе.
+
+    python checkin.py 2024-11-20 --door "Главный вход" < scans.txt
+
+Код билета — номер заказа с подписью HMAC-SHA256 ключом театра: 1234-ABCDEFGHIJKLMNOP. Он печатается
+на билете QR-кодом (tickets.py) и возвращается API при оформлении заказа. Подделать код без ключа
+нельзя, а номера отмененных заказов не выдаются повторно, поэтому код отмененного заказа никуда не
+пропустит. Ключ хранится в файле <имя базы>.ticket-key рядом с базой, который создается при первом
+обращении; у каждого зала свой ключ, и билет в один зал не пройдет в другой. Общий секрет в
+THEATER_TICKET_KEY заменяет файлы ключей (например, когда кассы и входы работают на разных машинах):
+ключ зала тогда выводится из секрета и имени файла базы, поэтому залы по-прежнему не принимают чужие
+билеты, а переименование базы меняет ключ и делает недействительными уже напечатанные коды.
+
+На входе CheckInDesk перед началом загружает коды всех заказов на вечер в словарь, и проверка
+скана — поиск в нем и один запрос по первичному ключу: не отменили ли заказ после загрузки. Отметки
+о проходе копятся в памяти и записываются пачкой в фоновом потоке (каждые CHECKIN_BATCH сканов или
+CHECKIN_FLUSH_INTERVAL секунд), вместе с отметками других входов. Если база недоступна, вход
+продолжает работать по своему списку, а отметки дождутся следующей записи. За кодом с верной
+подписью, которого нет в списке, тоже идем в базу: билет купили уже после загрузки.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import booking
+import stats
+
+KEY_ENV = "THEATER_TICKET_KEY"
+KEY_SUFFIX = ".ticket-key"
+
+# Короче ключ (или секрет в THEATER_TICKET_KEY) не принимается: подпись стало бы можно подобрать
+MIN_KEY_BYTES = 16
+
+# Длина подписи в байтах: 10 байт — 16 символов base32, подобрать такую подпись перебором нельзя
+SIGNATURE_BYTES = 10
+
+# Сколько отметок о проходе копить до записи и как часто записывать их в любом случае (секунды)
+CHECKIN_BATCH = 100
+CHECKIN_FLUSH_INTERVAL = 2.0
+
+# Результаты проверки скана
+ADMITTED = "admitted"
+ALREADY_USED = "used"
+WRONG_DATE = "wrong_date"
+UNKNOWN = "unknown"
+FORGED = "forged"
+
+MESSAGES = {
+    ADMITTED: "ПРОХОД",
+    ALREADY_USED: "УЖЕ ПРОШЕЛ",
+    WRONG_DATE: "ДРУГОЙ ДЕНЬ",
+    UNKNOWN: "НЕТ ЗАКАЗА",
+    FORGED: "НЕВЕРНЫЙ КОД",
+}
+
+# Заказ по коду билета; план проверяет migrations.check_query_plans
+TICKET_SQL = "SELECT id, play_name, date, zone_name, ticket_count, seats FROM order_details"
+# Заказ из списка вечера еще не отменен
+ORDER_EXISTS_SQL = "SELECT 1 FROM orders WHERE id = ?"
+
+_keys = {}
+_keys_lock = threading.Lock()
+
+
+def _create_key_file(key_path):
+    """Создает файл ключа, если его еще нет. Ключ пишется во временный файл и появляется под своим
+    именем целиком (os.link не заменяет существующий файл): другой процесс, впервые печатающий билеты
+    в тот же момент, не прочитает пустой или недописанный ключ, а из двух ключей останется один.
+    Там, где жестких ссылок нет (FAT, часть сетевых папок), файл ключа создается с O_EXCL."""
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(key_path), dir=os.path.dirname(key_path))
+    try:
+        key = os.urandom(32).hex()
+        with os.fdopen(fd, "w") as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(temp_path, key_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            _create_key_file_exclusive(key_path, key)
+    finally:
+        os.remove(temp_path)
+
+
+def _create_key_file_exclusive(key_path, key):
+    """Создает файл ключа с O_EXCL. Пока ключ дописывается, файл уже виден под своим именем, поэтому
+    ticket_key ждет, пока в нем не появится ключ целиком."""
+    try:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_key_file(key_path):
+    # Файл, созданный с O_EXCL другим процессом, может быть еще не дописан
+    for _ in range(50):
+        with open(key_path) as f:
+            text = f.read().strip()
+        if len(text) >= MIN_KEY_BYTES * 2:
+            break
+        time.sleep(0.01)
+    return _check_key(bytes.fromhex(text), key_path)
+
+
+def _check_key(key, source):
+    if len(key) < MIN_KEY_BYTES:
+        raise ValueError(f"Ключ подписи билетов ({source}) короче {MIN_KEY_BYTES} байт")
+    return key
+
+
+def ticket_key(path=booking.DB_PATH):
+    """Ключ подписи кодов билетов для базы path: из файла ключа (создается при первом обращении)
+    или выведенный из THEATER_TICKET_KEY и имени базы."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if os.environ.get(KEY_ENV):
+        secret = _check_key(os.environ[KEY_ENV].encode(), KEY_ENV)
+        return hmac.new(secret, f"ticket-key:{name}".encode(), hashlib.sha256).digest()
+    key_path = os.path.splitext(os.path.abspath(path))[0] + KEY_SUFFIX
+    with _keys_lock:
+        if key_path not in _keys:
+            if not os.path.exists(key_path):
+                _create_key_file(key_path)
+            _keys[key_path] = _read_key_file(key_path)
+        return _keys[key_path]
+
+
+def sign(key, order_id):
+    """Код билета заказа order_id."""
+    digest = hmac.new(key, str(order_id).encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return f"{order_id}-{base64.b32encode(digest).decode()}"
+
+
+def verify(key, code):
+    """Номер заказа из кода билета или None, если подпись неверна."""
+    order_id, _, _ = code.partition("-")
+    # Только ASCII-цифры: str.isdigit() пропускает и "²", на котором int() упал бы
+    if not re.fullmatch(r"[0-9]+", order_id):
+        return None
+    return int(order_id) if hmac.compare_digest(sign(key, int(order_id)), code) else None
+
+
+def ticket_code(path, order_id):
+    """Код билета заказа в базе path."""
+    return sign(ticket_key(path), order_id)
+
+
+class CheckInDesk:
+    """Проверка билетов на входе по списку вечера в памяти. scan вызывается из одного потока (сканера)."""
+
+    def __init__(self, path=booking.DB_PATH, date=None, door="", batch=CHECKIN_BATCH,
+                 interval=CHECKIN_FLUSH_INTERVAL):
+        self.path = path
+        self.date = date
+        self.door = door
+        self.batch = batch
+        self.interval = interval
+        self.key = ticket_key(path)
+        self.conn = None
+        # Код -> (id заказа, спектакль, дата, зона, билетов, места); id прошедших заказов
+        self.tickets = {}
+        self.used = set()
+        self.pending = []
+        self.last_checkin_id = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="check-in", daemon=True)
+
+    def load(self):
+        """Загружает заказы вечера и уже отмеченные проходы."""
+        self.conn = booking.connect(self.path)
+        for ticket in self.conn.execute(f"{TICKET_SQL} WHERE date = ?", (self.date,)):
+            self.tickets[sign(self.key, ticket[0])] = ticket
+        self._merge_checkins(self.conn)
+        return self
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Записывает накопленные отметки и останавливает поток."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.conn is not None:
+            self.conn.close()
+
+    def scan(self, code):
+        """Проверяет отсканированный код. Возвращает (результат, заказ или None)."""
+        code = code.strip().upper()
+        ticket = self.tickets.get(code)
+        if ticket is not None and self._cancelled(ticket[0]):
+            del self.tickets[code]
+            return UNKNOWN, None
+        if ticket is None:
+            order_id = verify(self.key, code)
+            if order_id is None:
+                return FORGED, None
+            ticket = self._lookup(order_id)
+            if ticket is None:
+                return UNKNOWN, None
+            if ticket[2] != self.date:
+                return WRONG_DATE, ticket
+            self.tickets[code] = ticket
+
+        with self.condition:
+            if ticket[0] in self.used:
+                return ALREADY_USED, ticket
+            self.used.add(ticket[0])
+            self.pending.append((ticket[0], time.time(), self.door))
+            if len(self.pending) >= self.batch:
+                self.condition.notify()
+        return ADMITTED, ticket
+
+    def _cancelled(self, order_id):
+        """Заказ из списка отменили после загрузки. Если база недоступна, верим списку."""
+        try:
+            return self.conn.execute(ORDER_EXISTS_SQL, (order_id,)).fetchone() is None
+        except sqlite3.Error:
+            return False
+
+    def _lookup(self, order_id):
+        """Заказ, купленный после загрузки списка. Без базы такой билет не пропустить."""
+        try:
+            return self.conn.execute(f"{TICKET_SQL} WHERE id = ?", (order_id,)).fetchone()
+        except sqlite3.Error:
+            return None
+
+    def _merge_checkins(self, conn):
+        """Добавляет к прошедшим заказы, отмеченные на других входах после прошлой проверки."""
+        rows = conn.execute("SELECT id, order_id FROM checkins WHERE id > ? ORDER BY id",
+                            (self.last_checkin_id,)).fetchall()
+        if rows:
+            with self.condition:
+                self.used.update(order_id for _, order_id in rows)
+            self.last_checkin_id = rows[-1][0]
+
+    def _write(self, conn, pending):
+        with booking.immediate_transaction(conn):
+            # Заказ, уже отмеченный на другом входе, второй раз не записывается
+            conn.executemany("INSERT OR IGNORE INTO checkins (order_id, checked_in_at, door) VALUES (?, ?, ?)",
+                             pending)
+
+    def flush(self, conn):
+        """Записывает накопленные отметки одной транзакцией и подхватывает отметки других входов."""
+        with self.condition:
+            pending, self.pending = self.pending, []
+        try:
+            if pending:
+                booking.with_retries(self._write, conn, pending)
+            self._merge_checkins(conn)
+        except sqlite3.Error as e:
+            # Отметки не теряются: вернутся в очередь и запишутся следующей пачкой
+            with self.condition:
+                self.pending[:0] = pending
+            print(f"Не удалось записать проходы: {e}", file=sys.stderr)
+
+    def _run(self):
+        conn = booking.connect(self.path)
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.stopped or len(self.pending) >= self.batch, self.interval)
+                    stopped = self.stopped
+                self.flush(conn)
+                if stopped:
+                    break
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка билетов на входе: коды читаются по строке со сканера.")
+    parser.add_argument("date", help="дата спектаклей (ГГГГ-ММ-ДД)")
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--door", default="", help="название входа для отметок")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    desk = CheckInDesk(args.db, args.date, args.door).load().start()
+    print(f"Загружено билетов: {len(desk.tickets)}, уже прошли: {len(desk.used)} "
+          f"({(time.perf_counter() - started) * 1000:.0f} мс).", file=sys.stderr)
+
+    timings = []
+    counts = dict.fromkeys(MESSAGES, 0)
+    try:
+        # Сканер штрихкодов работает как клавиатура: каждый код — отдельная строка
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            started = time.perf_counter()
+            result, ticket = desk.scan(line)
+            timings.append((time.perf_counter() - started) * 1000)
+            counts[result] += 1
+            details = f"\t{ticket[1]}, {ticket[3]}, билетов: {ticket[4]}" if ticket else ""
+            print(f"{MESSAGES[result]}{details}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        desk.stop()
+
+    summary = stats.summarize(timings)
+    print(", ".join(f"{MESSAGES[result].lower()}: {count}" for result, count in counts.items()), file=sys.stderr)
+    if timings:
+        print(f"Проверка скана: p50 {summary['p50_ms'] * 1000:.1f} мкс, p99 {summary['p99_ms'] * 1000:.1f} мкс.",
+              file=sys.stderr)
@@ -0,0 +1,20 @@
+"""Общие фикстуры тестов: база с тестовым сезоном addinfo во временной папке."""
+import pytest
+
+import addinfo
+import booking
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # create_database пишет базу по умолчанию в текущую папку
+    monkeypatch.chdir(tmp_path)
+    addinfo.create_database()
+    return str(tmp_path / booking.DB_PATH)
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = booking.connect(db_path)
+    yield conn
+    conn.close()
@@ -0,0 +1,152 @@
+"""Групповая фиксация заказов для часов пик (старт продаж премьеры, API под нагрузкой).
+
+    queue = groupcommit.GroupCommitQueue().start()
+    order_id, available, seats = queue.book_tickets(email, play_name, date, zone_name, 2).result()
+
+Обычно каждый заказ — своя транзакция: BEGIN IMMEDIATE, запись, COMMIT. При всплеске заказов
+кассы и потоки API стоят в очереди за блокировкой записи, а каждый COMMIT отдельно пишет в журнал
+одни и те же страницы зон. Очередь собирает запросы, пришедшие за короткое окно, и выполняет их
+одним потоком в одной транзакции, каждый под своей точкой сохранения (SAVEPOINT): запрос, которому
+не хватило билетов, откатывается один, не задевая остальных. Результат (или ошибка) каждого запроса
+отдается через его Future только после COMMIT, поэтому гарантии сохранности те же, что у обычного
+заказа: подтвержденный заказ уже зафиксирован в базе.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import booking
+
+# Сколько ждать попутных запросов после первого (секунды) и сколько запросов фиксировать вместе.
+# Без ожидания пачка складывается сама: пока фиксируется предыдущая, новые запросы копятся в очереди.
+# Положительное окно укрупняет пачки ценой задержки, что выгодно лишь при очень медленном fsync
+GROUP_COMMIT_WINDOW = 0.0
+GROUP_COMMIT_MAX_BATCH = 200
+
+
+class GroupCommitQueue:
+    """Очередь записи с групповой фиксацией. Запросы принимаются из любых потоков."""
+
+    def __init__(self, path=booking.DB_PATH, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = queue.SimpleQueue()
+        # После stop() запросы не принимаются: их уже некому выполнить
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Дофиксирует уже принятые запросы и останавливает поток. Запросы, которые выполнить уже
+        некому (поток не запускался или упал), завершаются ошибкой."""
+        with self.lock:
+            if not self.stopped:
+                self.stopped = True
+                self.requests.put(None)
+        if self.thread.is_alive():
+            self.thread.join()
+        error = RuntimeError("Очередь записи остановлена")
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None and request[2].set_running_or_notify_cancel():
+                request[2].set_exception(error)
+
+    def submit(self, operation, *args):
+        """Ставит в очередь operation(conn, *args) — функцию, работающую внутри открытой транзакции
+        (booking.book_in_transaction и т. п.). Возвращает Future с ее результатом после фиксации.
+        После stop() бросает RuntimeError."""
+        future = Future()
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError("Очередь записи остановлена")
+            self.requests.put((operation, args, future))
+        return future
+
+    def book_tickets(self, email, play_name, date, zone_name, ticket_count):
+        """Как booking.book_tickets. Future с (id заказа, новый остаток, места или None)."""
+        if ticket_count <= 0:
+            raise booking.BookingError("Количество билетов должно быть положительным.")
+        return self.submit(booking.book_in_transaction, email, play_name, date, zone_name, ticket_count)
+
+    def hold_tickets(self, email, play_name, date, zone_name, ticket_count, ttl=booking.HOLD_TTL):
+        """Как booking.hold_tickets. Future с (id брони, новый остаток, места или None, срок)."""
+        if ticket_count <= 0:
+            raise booking.BookingError("Количество билетов должно быть положительным.")
+        return self.submit(booking.hold_in_transaction, email, play_name, date, zone_name, ticket_count, ttl)
+
+    def confirm_hold(self, hold_id):
+        """Как booking.confirm_hold. Future с (id заказа, места или None)."""
+        return self.submit(booking.confirm_in_transaction, hold_id)
+
+    def _next_batch(self):
+        """Ждет первый запрос и добирает к нему уже стоящие в очереди и пришедшие за окно.
+        Возвращает (пачка, остановиться ли после нее)."""
+        batch = []
+        request = self.requests.get()
+        deadline = time.monotonic() + self.window
+        while request is not None:
+            # Запрос, отмененный до начала выполнения, пропускаем
+            if request[2].set_running_or_notify_cancel():
+                batch.append(request)
+            if len(batch) >= self.max_batch:
+                return batch, False
+            remaining = deadline - time.monotonic()
+            try:
+                request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def _run(self):
+        conn = booking.connect(self.path)
+        try:
+            while True:
+                batch, stopped = self._next_batch()
+                if batch:
+                    self._commit(conn, batch)
+                if stopped:
+                    break
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        try:
+            results = booking.with_retries(self._apply, conn, batch)
+        except Exception as e:
+            # Пачка не зафиксирована целиком (например, база недоступна): ошибка у каждого запроса
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, _, future), (result, error) in zip(batch, results):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _apply(self, conn, batch):
+        """Выполняет пачку одной транзакцией. Возвращает [(результат, ошибка)] по запросам."""
+        results = []
+        with booking.immediate_transaction(conn):
+            for operation, args, _ in batch:
+                conn.execute("SAVEPOINT request")
+                try:
+                    results.append((operation(conn, *args), None))
+                except Exception as e:
+                    # Блокировка — ошибка всей пачки, ее повторит with_retries. Любая другая ошибка
+                    # (отказ в заказе, ошибка в запросе или в самой operation) — только этого запроса
+                    if booking.is_lock_error(e):
+                        raise
+                    conn.execute("ROLLBACK TO request")
+                    results.append((None, e))
+                conn.execute("RELEASE request")
+        return results
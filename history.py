@@ -0,0 +1,163 @@
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+from PyQt6.QtWidgets import QDialog, QFileDialog, QHBoxLayout, QMessageBox, QPushButton, QTableView, QVBoxLayout, \
+    QAbstractItemView
+
+import seatmap
+import service
+import tickets
+
+COLUMNS = ["№", "Спектакль", "Дата", "Зона", "Билетов", "Места", "Оформлен", "Зал"]
+SEATS_COLUMN = COLUMNS.index("Места")
+VENUE_COLUMN = COLUMNS.index("Зал")
+
+
+class OrderHistoryModel(QAbstractTableModel):
+    """Модель истории заказов, которая подгружает страницы по мере прокрутки."""
+
+    def __init__(self, executor, router, email, first_page=None, parent=None):
+        super().__init__(parent)
+        self.executor = executor
+        self.router = router
+        self.email = email
+        self.orders = list(first_page or [])
+        self.loading = False
+        # Неполная первая страница означает, что история прочитана целиком
+        self.exhausted = first_page is not None and len(first_page) < service.HISTORY_PAGE_SIZE
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.orders)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        value = self.orders[index.row()][index.column()]
+        if index.column() == SEATS_COLUMN:
+            return seatmap.format_seats(value)
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        """Запрашивает следующую страницу в фоне."""
+        if not self.canFetchMore(parent):
+            return
+        self.loading = True
+        # Номера заказов в каждом зале свои, поэтому продолжаем с позиции каждого зала
+        before = self.router.history_cursor(self.orders)
+        self.executor.submit(self.router.load_history_page, self.email, before, channel=("history", self.email),
+                             db=self.router.connect, on_result=self._append_page, on_error=self._page_failed)
+
+    def _append_page(self, page):
+        self.loading = False
+        if len(page) < service.HISTORY_PAGE_SIZE:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.orders), len(self.orders) + len(page) - 1)
+            self.orders.extend(page)
+            self.endInsertRows()
+
+    def _page_failed(self, error):
+        self.loading = False
+
+    def order_at(self, row):
+        return self.orders[row]
+
+    def remove_order(self, venue, order_id):
+        """Убирает отмененный заказ из таблицы."""
+        for row, order in enumerate(self.orders):
+            if order[0] == order_id and order[VENUE_COLUMN] == venue:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.orders[row]
+                self.endRemoveRows()
+                return
+
+
+class OrderHistoryDialog(QDialog):
+    """Окно истории заказов с отменой и повторной печатью билета для выбранной строки."""
+
+    # Зал, спектакль, дата, зона и новый остаток после отмены заказа
+    order_cancelled = pyqtSignal(str, str, str, str, object)
+
+    def __init__(self, executor, router, email, first_page, parent=None):
+        super().__init__(parent)
+        self.executor = executor
+        self.router = router
+        self.email = email
+
+        self.setWindowTitle("История заказов")
+        self.resize(640, 400)
+        layout = QVBoxLayout(self)
+
+        self.model = OrderHistoryModel(executor, router, email, first_page, self)
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        # С одним залом колонка зала ничего не говорит
+        self.table.setColumnHidden(VENUE_COLUMN, len(router.names) < 2)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.cancel_button = QPushButton("Отменить заказ", self)
+        self.cancel_button.clicked.connect(self.cancel_selected)
+        buttons.addWidget(self.cancel_button)
+        self.print_button = QPushButton("Сохранить билет", self)
+        self.print_button.clicked.connect(self.print_selected)
+        buttons.addWidget(self.print_button)
+        layout.addLayout(buttons)
+
+    def selected_order(self):
+        rows = self.table.selectionModel().selectedRows()
+        if not rows:
+            QMessageBox.information(self, "История заказов", "Выберите заказ в таблице.")
+            return None
+        return self.model.order_at(rows[0].row())
+
+    def cancel_selected(self):
+        """Отменяет выбранный заказ."""
+        order = self.selected_order()
+        if order is None:
+            return
+
+        order_id, venue = order[0], order[VENUE_COLUMN]
+        self.executor.submit(service.cancel_order, order_id, db=self.router.path(venue),
+                             on_result=lambda result: self.on_order_cancelled(venue, order_id, result),
+                             on_error=lambda e: QMessageBox.critical(self, "Ошибка", f"Ошибка при отмене заказа: {e}"))
+
+    def on_order_cancelled(self, venue, order_id, result):
+        self.model.remove_order(venue, order_id)
+        if result is None:
+            QMessageBox.information(self, "Отмена заказа", "Заказ уже был отменен.")
+            return
+
+        self.order_cancelled.emit(venue, *result)
+        QMessageBox.information(self, "Отмена заказа", f"Заказ №{order_id} отменен.")
+
+    def print_selected(self):
+        """Сохраняет билет выбранного заказа в PDF."""
+        order = self.selected_order()
+        if order is None:
+            return
+
+        order_id, play_name, date, zone_name, ticket_count, seats, _, venue = order
+        file_name, _ = QFileDialog.getSaveFileName(self, "Сохранить билет", f"ticket_{order_id}.pdf",
+                                                   "PDF Files (*.pdf)")
+        if not file_name:
+            return
+
+        self.executor.submit(tickets.render_order_ticket, file_name, self.router.path(venue), order_id, self.email,
+                             play_name, date, zone_name, ticket_count, seats, db=False,
+                             on_result=lambda name: QMessageBox.information(
+                                 self, "Билет сохранен", f"Ваш билет был сохранен как {name}."),
+                             on_error=lambda e: QMessageBox.critical(
+                                 self, "Ошибка", f"Ошибка при сохранении билета: {e}"))
@@ -0,0 +1,99 @@
+import heapq
+import sqlite3
+import sys
+import threading
+import time
+
+import booking
+
+# Как часто перечитывать сроки броней из базы, чтобы подхватить брони других касс и API (секунды)
+RESCAN_INTERVAL = 60.0
+
+
+class HoldScheduler:
+    """Снимает просроченные брони в фоновом потоке.
+
+    Сроки броней лежат в куче (heapq) по времени истечения: поток спит ровно до ближайшего
+    срока, а проснувшись, снимает все просроченные брони пачками по booking.HOLD_RELEASE_BATCH
+    в одной транзакции на пачку, а не опрашивает строки по одной. Подтвержденные и досрочно
+    снятые брони из кучи не удаляются: на их сроке просто нечего снимать.
+    """
+
+    def __init__(self, path=booking.DB_PATH, rescan_interval=RESCAN_INTERVAL):
+        self.path = path
+        self.rescan_interval = rescan_interval
+        self.deadlines = []
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="hold-scheduler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def add(self, hold_id, expires_at):
+        """Сообщает планировщику о новой брони."""
+        with self.condition:
+            heapq.heappush(self.deadlines, (expires_at, hold_id))
+            # Будим поток, только если новый срок стал ближайшим
+            if self.deadlines[0][1] == hold_id:
+                self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def _rescan(self, conn):
+        """Перечитывает сроки активных броней: брони из других процессов тоже попадают в кучу."""
+        deadlines = conn.execute("SELECT expires_at, id FROM holds").fetchall()
+        heapq.heapify(deadlines)
+        with self.condition:
+            self.deadlines = deadlines
+
+    def _wait_for_deadline(self):
+        """Ждет ближайшего срока. Возвращает момент, на который снимать брони, None при
+        перечитывании сроков и False при остановке."""
+        with self.condition:
+            wake_at = time.time() + self.rescan_interval
+            while not self.stopped:
+                now = time.time()
+                if self.deadlines and self.deadlines[0][0] <= now:
+                    # Снимаем из кучи все наступившие сроки разом
+                    while self.deadlines and self.deadlines[0][0] <= now:
+                        heapq.heappop(self.deadlines)
+                    return now
+                if now >= wake_at:
+                    return None
+                next_deadline = self.deadlines[0][0] if self.deadlines else wake_at
+                self.condition.wait(min(next_deadline, wake_at) - now)
+            return False
+
+    def _run(self):
+        conn = booking.connect(self.path)
+        try:
+            self._rescan(conn)
+            # Брони, истекшие, пока приложение было закрыто, снимаются сразу
+            self._release(conn, time.time())
+            while True:
+                now = self._wait_for_deadline()
+                if now is False:
+                    break
+                if now is None:
+                    self._rescan(conn)
+                else:
+                    self._release(conn, now)
+        finally:
+            conn.close()
+
+    def _release(self, conn, now):
+        try:
+            while True:
+                count, _ = booking.release_expired_holds(conn, now)
+                if count < booking.HOLD_RELEASE_BATCH:
+                    break
+        except sqlite3.Error as e:
+            # Брони не потеряются: их снимет следующий проход по сроку или при перечитывании
+            print(f"Не удалось снять просроченные брони: {e}", file=sys.stderr)
@@ -0,0 +1,233 @@
+"""Необязательный замер задержек запросов и обработчиков.
+
+Включается переменной окружения THEATER_PROFILE=<файл.json> (или instrumentation.enable).
+Выключенный замер ничего не подменяет, поэтому ничего и не стоит. Включенный:
+  * подключения booking.connect создаются классом TimedConnection, который замеряет execute,
+    executemany и commit, а через set_trace_callback считает все выполненные SQLite операторы;
+  * обработчики окна и задачи пула потоков оборачиваются замером времени;
+  * повторы из-за блокировки и долгие BEGIN IMMEDIATE учитываются как ожидания блокировки.
+Задержки копятся в гистограммах с логарифмическими корзинами (память не растет со временем),
+а при выходе сводка с p50/p95/p99 сохраняется в файл.
+"""
+import atexit
+import bisect
+import functools
+import json
+import sqlite3
+import threading
+import time
+
+import booking
+
+# Границы корзин гистограммы в миллисекундах: от 1 мкс до ~16 с с шагом ×2
+BUCKET_BOUNDS = [0.001 * 2 ** i for i in range(25)]
+
+# BEGIN IMMEDIATE дольше этого значения (мс) означает, что транзакция ждала блокировку записи
+LOCK_WAIT_THRESHOLD_MS = 1.0
+
+# Длина ключа запроса в отчете
+MAX_QUERY_KEY = 160
+
+_recorder = None
+
+
+class Histogram:
+    """Гистограмма задержек с логарифмическими корзинами."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value_ms):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, q):
+        """Оценка перцентиля q (0..100) линейной интерполяцией внутри корзины."""
+        if not self.count:
+            return None
+        rank = self.count * q / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = BUCKET_BOUNDS[index - 1] if index else 0.0
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max,
+        }
+
+
+class Recorder:
+    """Потокобезопасное хранилище замеров."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = {}
+        self.handlers = {}
+        self.tasks = {}
+        self.statements = {}
+        self.lock_waits = 0
+        self.lock_retries = 0
+
+    def _add(self, table, key, elapsed_ms):
+        with self.lock:
+            histogram = table.get(key)
+            if histogram is None:
+                histogram = table[key] = Histogram()
+            histogram.add(elapsed_ms)
+
+    def record_query(self, sql, elapsed_ms):
+        key = " ".join(sql.split())[:MAX_QUERY_KEY]
+        self._add(self.queries, key, elapsed_ms)
+        if key.startswith("BEGIN IMMEDIATE") and elapsed_ms > LOCK_WAIT_THRESHOLD_MS:
+            with self.lock:
+                self.lock_waits += 1
+
+    def record_handler(self, name, elapsed_ms):
+        self._add(self.handlers, name, elapsed_ms)
+
+    def record_task(self, name, elapsed_ms):
+        self._add(self.tasks, name, elapsed_ms)
+
+    def trace(self, statement):
+        """Обработчик set_trace_callback: считает операторы, которые реально выполнил SQLite,
+        включая неявные BEGIN/COMMIT и каждую строку executemany."""
+        key = " ".join(statement.split())[:MAX_QUERY_KEY]
+        with self.lock:
+            self.statements[key] = self.statements.get(key, 0) + 1
+
+    def on_lock_retry(self, error):
+        with self.lock:
+            self.lock_retries += 1
+
+    def report(self):
+        with self.lock:
+            return {
+                "queries": {key: h.summary() for key, h in self.queries.items()},
+                "handlers": {key: h.summary() for key, h in self.handlers.items()},
+                "tasks": {key: h.summary() for key, h in self.tasks.items()},
+                "statements": dict(self.statements),
+                "lock": {"waits": self.lock_waits, "retries": self.lock_retries},
+            }
+
+
+class TimedConnection(sqlite3.Connection):
+    """Подключение, которое замеряет свои запросы. Время SELECT учитывается до первой строки."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_recorder.trace)
+
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            _recorder.record_query(sql, (time.perf_counter() - started) * 1000)
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            _recorder.record_query(sql, (time.perf_counter() - started) * 1000)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _recorder.record_query("COMMIT", (time.perf_counter() - started) * 1000)
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+def enable(path=None):
+    """Включает замер. Действует на подключения, открытые после вызова.
+    Если задан path, сводка сохраняется в него при выходе из программы."""
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder()
+        booking.connection_factory = TimedConnection
+        booking.lock_retry_hook = _recorder.on_lock_retry
+        if path:
+            atexit.register(dump, path)
+    return _recorder
+
+
+def record_startup(stage, elapsed_ms):
+    """Учитывает время от запуска программы до этапа (окно показано, каталог прочитан)."""
+    if _recorder is not None:
+        _recorder.record_handler(f"запуск: {stage}", elapsed_ms)
+
+
+def wrap_handlers(cls, names):
+    """Оборачивает методы класса замером времени. Вызывать до создания объектов, чтобы сигналы
+    Qt подключались уже к обернутым методам."""
+    for name in names:
+        original = getattr(cls, name)
+        # Qt передает в слот аргументы сигнала; отдаем методу столько, сколько он принимает
+        arg_count = original.__code__.co_argcount - 1
+
+        def wrapper(self, *args, _original=original, _name=name, _arg_count=arg_count):
+            started = time.perf_counter()
+            try:
+                return _original(self, *args[:_arg_count])
+            finally:
+                _recorder.record_handler(_name, (time.perf_counter() - started) * 1000)
+
+        setattr(cls, name, functools.wraps(original)(wrapper))
+
+
+def wrap_tasks(task_cls):
+    """Замеряет выполнение задач пула потоков (workers.Task) по имени вызываемой функции."""
+    original = task_cls.run
+
+    @functools.wraps(original)
+    def run(self):
+        started = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            name = getattr(self.func, "__qualname__", repr(self.func))
+            _recorder.record_task(name, (time.perf_counter() - started) * 1000)
+
+    task_cls.run = run
+
+
+def format_report(report=None):
+    """Текстовая сводка для панели отладки."""
+    report = report or _recorder.report()
+    lines = []
+    for section, title in (("handlers", "Обработчики"), ("tasks", "Фоновые задачи"), ("queries", "Запросы")):
+        lines.append(f"== {title} ==")
+        rows = sorted(report[section].items(), key=lambda item: -(item[1]["p99_ms"] or 0))
+        for key, s in rows:
+            lines.append(f"{s['p50_ms']:9.3f} {s['p95_ms']:9.3f} {s['p99_ms']:9.3f} мс  ×{s['count']:<6} {key}")
+        lines.append("")
+    lines.append(f"Ожидания блокировки: {report['lock']['waits']}, повторы: {report['lock']['retries']}")
+    return "\n".join(["      p50       p95       p99"] + lines)
+
+
+def dump(path):
+    """Сохраняет сводку замеров в JSON."""
+    if _recorder is None:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(_recorder.report(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,199 @@
+"""Нагрузочная проверка общей базы несколькими процессами-кассами.
+
+    python loadsim.py --db theater.db --workers 8 --duration 10 --out load.json
+
+Каждый процесс открывает свое подключение к копии базы и в течение --duration секунд оформляет,
+бронирует и отменяет заказы в заданной пропорции, как касса в час пик: большая часть операций
+приходится на несколько популярных сеансов. Замеряются пропускная способность, задержки
+p50/p95/p99 по видам операций, повторы и ошибки из-за блокировки. В конце проверяются
+инварианты: остаток нигде не отрицательный, в каждой зоне продано + в брони + свободно равно
+исходной вместимости, карта мест совпадает с остатком, а сводки продаж — с заказами.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import booking
+import reports
+import seatmap
+import service
+import stats
+from bench import copy_database
+
+# Доля операций по видам: оформить сразу, забронировать и подтвердить, отменить последний заказ
+DEFAULT_MIX = {"book": 60, "hold": 20, "cancel": 20}
+
+# Сколько самых загруженных зон получают большую часть операций
+HOT_ZONES = 5
+HOT_SHARE = 0.8
+
+
+def _zone_capacities(conn):
+    """Вместимость каждой зоны: свободно + продано + в брони."""
+    return dict(conn.execute("""
+        SELECT z.id, z.available_tickets
+               + IFNULL((SELECT SUM(ticket_count) FROM orders o WHERE o.zone_id = z.id), 0)
+               + IFNULL((SELECT SUM(ticket_count) FROM holds h WHERE h.zone_id = z.id), 0)
+        FROM zones z
+    """))
+
+
+def check_invariants(conn, capacities):
+    """Проверяет инварианты после нагрузки. Возвращает список нарушений."""
+    problems = []
+    for zone_id, available in conn.execute("SELECT id, available_tickets FROM zones WHERE available_tickets < 0"):
+        problems.append(f"зона {zone_id}: отрицательный остаток {available}")
+
+    for zone_id, capacity in _zone_capacities(conn).items():
+        if capacity != capacities.get(zone_id):
+            problems.append(f"зона {zone_id}: продано + в брони + свободно = {capacity}, "
+                            f"а было {capacities.get(zone_id)}")
+
+    for zone_id, available, rows, per_row, seat_map in conn.execute(
+            "SELECT id, available_tickets, seat_rows, seats_per_row, seat_map FROM zones WHERE seat_map IS NOT NULL"):
+        free = seatmap.free_count(seat_map, rows, per_row)
+        if free != available:
+            problems.append(f"зона {zone_id}: свободных мест по карте {free}, остаток {available}")
+
+    problems.extend(reports.check_aggregates(conn))
+    return problems
+
+
+def _worker(args):
+    """Рабочий процесс: операции в цикле до deadline. Возвращает замеры и счетчики."""
+    worker_id, path, zones, mix, start_at, deadline, seed = args
+    rng = random.Random(seed)
+    conn = booking.connect(path)
+    counters = {"lock_retries": 0, "lock_errors": 0, "sold_out": 0, "other_errors": 0}
+
+    def on_retry(error):
+        counters["lock_retries"] += 1
+
+    booking.lock_retry_hook = on_retry
+    samples = {name: [] for name in mix}
+    operations, weights = list(mix), list(mix.values())
+    hot = zones[:HOT_ZONES]
+    emails = [f"load{worker_id}-{i}@load.ru" for i in range(20)]
+
+    # Все процессы стартуют одновременно, чтобы нагрузка была параллельной с первой секунды
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        play_name, date, zone_name = rng.choice(hot) if rng.random() < HOT_SHARE else rng.choice(zones)
+        email = rng.choice(emails)
+        count = rng.randint(1, 4)
+        started = time.perf_counter()
+        try:
+            if operation == "book":
+                service.place_order(conn, email, play_name, date, zone_name, count)
+            elif operation == "hold":
+                hold_id = service.hold_order(conn, email, play_name, date, zone_name, count)[0]
+                service.confirm_hold(conn, hold_id)
+            else:
+                service.cancel_latest_order(conn, email)
+        except booking.NotEnoughTicketsError:
+            counters["sold_out"] += 1
+        except sqlite3.OperationalError as e:
+            counters["lock_errors" if booking.is_lock_error(e) else "other_errors"] += 1
+            continue
+        except booking.BookingError:
+            counters["other_errors"] += 1
+            continue
+        samples[operation].append((time.perf_counter() - started) * 1000)
+
+    conn.close()
+    return samples, counters
+
+
+def run(db_path, workers=4, duration=10.0, mix=None, seed=1):
+    """Запускает нагрузку на копии базы. Возвращает отчет с замерами и нарушенными инвариантами."""
+    mix = mix or DEFAULT_MIX
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "load.db")
+        copy_database(db_path, path)
+        conn = booking.connect(path)
+        service.prepare_database(conn)
+        capacities = _zone_capacities(conn)
+        # Нарушения, которые уже были в исходной базе, нагрузка не создавала
+        initial_problems = check_invariants(conn, capacities)
+        # Популярные сеансы — зоны с наибольшим остатком, чтобы их хватило на весь прогон
+        zones = conn.execute("SELECT play_name, date, zone_name FROM zone_details "
+                             "ORDER BY available_tickets DESC, id").fetchall()
+        if not zones:
+            raise SystemExit("В базе нет зон для продажи.")
+
+        start_at = time.time() + 1.0
+        deadline = start_at + duration
+        jobs = [(worker_id, path, zones, mix, start_at, deadline, seed + worker_id) for worker_id in range(workers)]
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_worker, jobs)
+
+        samples = {name: [] for name in mix}
+        counters = {}
+        for worker_samples, worker_counters in results:
+            for name, values in worker_samples.items():
+                samples[name].extend(values)
+            for name, value in worker_counters.items():
+                counters[name] = counters.get(name, 0) + value
+
+        problems = check_invariants(conn, capacities)
+        conn.close()
+
+    completed = sum(len(values) for values in samples.values())
+    return {
+        "parameters": {"workers": workers, "duration": duration, "mix": mix, "seed": seed,
+                       "sqlite": sqlite3.sqlite_version},
+        "throughput_ops_per_sec": completed / duration,
+        "operations": {name: stats.summarize(values) for name, values in samples.items()},
+        "counters": counters,
+        "initial_violations": initial_problems,
+        "invariant_violations": [problem for problem in problems if problem not in initial_problems],
+    }
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"неизвестная операция {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка базы несколькими процессами.")
+    parser.add_argument("--db", default=booking.DB_PATH, help="исходная база (не изменяется)")
+    parser.add_argument("--workers", type=int, default=4, help="число процессов-касс")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность в секундах")
+    parser.add_argument("--mix", type=_parse_mix, help="пропорции операций, например book=60,hold=20,cancel=20")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    report = run(args.db, args.workers, args.duration, args.mix, args.seed)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"Процессов: {args.workers}, операций в секунду: {report['throughput_ops_per_sec']:.0f}")
+    for name, result in report["operations"].items():
+        if result["count"]:
+            print(f"{name:8} ×{result['count']:<7} p50 {result['p50_ms']:8.3f} мс  p95 {result['p95_ms']:8.3f} мс  "
+                  f"p99 {result['p99_ms']:8.3f} мс")
+    counters = report["counters"]
+    print(f"Повторов из-за блокировки: {counters['lock_retries']}, ошибок блокировки: {counters['lock_errors']}, "
+          f"нет билетов: {counters['sold_out']}, прочих ошибок: {counters['other_errors']}")
+    for problem in report["initial_violations"]:
+        print(f"Уже в исходной базе: {problem}")
+    for problem in report["invariant_violations"]:
+        print(f"Нарушение: {problem}")
+    if report["invariant_violations"]:
+        sys.exit(1)
+    print("Инварианты соблюдены.")
@@ -1,23 +1,122 @@
-import sys
-import sqlite3
-from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QComboBox, QLabel, QPushButton, QSpinBox, QLineEdit, \
-    QMessageBox, QFileDialog
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-import re
+import time
+
+# Момент запуска: от него считается время до готового окна (до импорта PyQt и модулей кассы)
+STARTED_AT = time.perf_counter()
+
+import os  # noqa: E402
+import sys  # noqa: E402
+from PyQt6.QtWidgets import (  # noqa: E402
+    QApplication, QWidget, QVBoxLayout, QComboBox, QLabel, QPushButton, QSpinBox, QLineEdit, QMessageBox, QFileDialog,
+    QDialog, QPlainTextEdit, QListWidget, QListWidgetItem)
+from PyQt6.QtCore import Qt, QTimer  # noqa: E402
+from PyQt6.QtGui import QPixmap, QShortcut, QKeySequence, QFontDatabase  # noqa: E402
+
+import backup  # noqa: E402
+import booking  # noqa: E402
+import groupcommit  # noqa: E402
+import history  # noqa: E402
+import holds  # noqa: E402
+import instrumentation  # noqa: E402
+import seatmap  # noqa: E402
+import service  # noqa: E402
+import tickets  # noqa: E402
+import venues  # noqa: E402
+from catalog import CatalogCache  # noqa: E402
+from workers import Executor, Task  # noqa: E402
+
+# Как часто проверять, не продали ли билеты другие кассы (мс)
+CATALOG_REFRESH_INTERVAL = 2000
+
+# Пауза в наборе, после которой выполняется поиск спектакля (мс)
+SEARCH_DEBOUNCE_INTERVAL = 250
+
+# Обработчики, время которых замеряется при THEATER_PROFILE=<файл>
+PROFILED_HANDLERS = ["update_dates", "update_plays", "update_zones", "update_available_tickets",
+                     "update_play_description", "update_play_time_and_duration", "handle_order",
+                     "generate_ticket_pdf", "show_order_history", "cancel_last_order", "run_search",
+                     "show_search_results"]
+
+# Таблицы стилей тем: строятся один раз при загрузке модуля, переключение темы только применяет готовую
+THEMES = {
+    "Темная": """
+        QWidget {
+            background-color: #2E2E2E;
+            color: #FFFFFF;
+        }
+        QLineEdit, QComboBox, QSpinBox, QPushButton {
+            background-color: #424242;
+            color: #FFFFFF;
+            border: 1px solid #555555;
+        }
+        QPushButton:hover {
+            background-color: #616161;
+        }
+        QComboBox QAbstractItemView {
+            background-color: #424242;
+            color: #FFFFFF;
+        }
+    """,
+    "Светлая": """
+        QWidget {
+            background-color: #FFFFFF;
+            color: #000000;
+        }
+        QLineEdit, QComboBox, QSpinBox, QPushButton {
+            background-color: #F0F0F0;
+            color: #000000;
+            border: 1px solid #CCCCCC;
+        }
+        QPushButton:hover {
+            background-color: #E0E0E0;
+        }
+        QComboBox QAbstractItemView {
+            background-color: #F0F0F0;
+            color: #000000;
+        }
+    """,
+}
+
+ERROR_ICON_PATH = "error_icon.jpg"
 
 
 class TicketBookingApp(QWidget):
     def __init__(self):
         super().__init__()
 
-        # Подключаемся к базе данных
-        self.conn = sqlite3.connect("theater.db")
-        self.cursor = self.conn.cursor()
+        # У каждого зала своя база (venues.json); касса работает с выбранным залом
+        self.router = venues.VenueRouter()
+        self.venue = self.router.names[0]
+
+        # Вся работа с базой и PDF идет в пуле потоков, у каждого потока свое подключение
+        self.executor = Executor(self.router.path(self.venue), parent=self)
+
+        # Каталог зала загружается один раз, каскад комбобоксов обслуживается из памяти
+        self.catalogs = {venue: CatalogCache(path) for venue, path in self.router.venues.items()}
+        self.catalog = self.catalogs[self.venue]
+
+        # Снимают брони, которые не подтвердили вовремя; запускаются после миграций базы зала
+        self.hold_schedulers = {venue: holds.HoldScheduler(path) for venue, path in self.router.venues.items()}
+
+        # Очереди групповой фиксации броней и заказов (THEATER_GROUP_COMMIT=1), тоже после миграций
+        self.write_queues = {venue: groupcommit.GroupCommitQueue(path) if os.environ.get("THEATER_GROUP_COMMIT")
+                             else None for venue, path in self.router.venues.items()}
+
+        # Резервные копии баз залов по расписанию (THEATER_BACKUP_INTERVAL — интервал в минутах)
+        backup_interval = float(os.environ.get("THEATER_BACKUP_INTERVAL") or 0)
+        self.backup_schedulers = {venue: backup.BackupScheduler(path, backup_interval * 60) if backup_interval
+                                  else None for venue, path in self.router.venues.items()}
+
+        # Текущая тема и картинка для окна ошибки (декодируется при первой ошибке)
+        self.theme = None
+        self.error_pixmap = None
+
+        # Замер запуска: окно показано и каталог прочитан
+        self.startup_times = {}
+
+        # Даты спектаклей во всех залах ({дата: [залы]}) для подсказок в списке дат.
+        # Читаются, когда готовы базы всех залов
+        self.venue_dates = {}
+        self.ready_venues = set()
 
         self.setWindowTitle("Театр AKA Макса")
         self.setGeometry(100, 100, 400, 500)
@@ -34,6 +133,32 @@ class TicketBookingApp(QWidget):
         # Установить темную тему по умолчанию
         self.set_theme("Темная")
 
+        # Поиск спектакля по названию и описанию: запрос уходит, когда кассир перестает печатать
+        self.search_input = QLineEdit(self)
+        self.search_input.setPlaceholderText("Название или слова из описания")
+        self.layout.addWidget(QLabel("Поиск спектакля:"))
+        self.layout.addWidget(self.search_input)
+        self.search_results = QListWidget(self)
+        self.search_results.hide()
+        self.layout.addWidget(self.search_results)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_INTERVAL)
+        self.search_timer.timeout.connect(self.run_search)
+        # Каждое нажатие перезапускает таймер, поэтому запрос один на паузу в наборе
+        self.search_input.textChanged.connect(lambda: self.search_timer.start())
+        self.search_results.itemClicked.connect(self.select_search_result)
+
+        # Выбор зала, если залов несколько
+        self.venue_combo = QComboBox(self)
+        self.venue_combo.addItems(self.router.names)
+        if len(self.router.names) > 1:
+            self.layout.addWidget(QLabel("Выберите зал:"))
+            self.layout.addWidget(self.venue_combo)
+        else:
+            self.venue_combo.hide()
+        self.venue_combo.currentTextChanged.connect(self.change_venue)
+
         # Выбор даты (без автоматического выбора)
         self.date_combo = QComboBox(self)
         self.layout.addWidget(QLabel("Выберите дату:"))
@@ -103,6 +228,55 @@ class TicketBookingApp(QWidget):
         self.play_combo.currentTextChanged.connect(self.update_play_description)
         self.play_combo.currentTextChanged.connect(self.update_play_time_and_duration)
 
+        # Обновляем схемы баз залов и загружаем их каталоги в фоне, затем периодически проверяем остатки
+        for venue, path in self.router.venues.items():
+            self.executor.submit(service.prepare_database, self.catalogs[venue], db=path,
+                                 on_result=lambda snapshot, venue=venue: self.on_database_ready(venue, snapshot),
+                                 on_error=lambda e: self.show_error(f"Ошибка при загрузке каталога: {e}"))
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_catalog)
+        self.refresh_timer.timeout.connect(self.refresh_venue_dates)
+        self.refresh_timer.start(CATALOG_REFRESH_INTERVAL)
+
+        # Панель замеров по F12, если включено профилирование
+        if instrumentation.is_enabled():
+            QShortcut(QKeySequence("F12"), self, self.show_profile_panel)
+
+    def show_profile_panel(self):
+        """Показывает задержки обработчиков, фоновых задач и запросов (p50/p95/p99)."""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Замеры производительности")
+        dialog.resize(900, 500)
+        layout = QVBoxLayout(dialog)
+        text = QPlainTextEdit(instrumentation.format_report(), dialog)
+        text.setReadOnly(True)
+        text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(text)
+        dialog.exec()
+
+    def mark_startup(self, stage):
+        """Запоминает время от запуска до этапа; когда окно показано и каталог прочитан, печатает замер."""
+        elapsed_ms = (time.perf_counter() - STARTED_AT) * 1000
+        self.startup_times[stage] = elapsed_ms
+        instrumentation.record_startup(stage, elapsed_ms)
+        if len(self.startup_times) == 2:
+            print("Запуск: " + ", ".join(f"{name} за {ms:.0f} мс" for name, ms in self.startup_times.items()),
+                  file=sys.stderr)
+
+    def closeEvent(self, event):
+        """Дожидается фоновых задач перед закрытием окна."""
+        self.refresh_timer.stop()
+        self.executor.shutdown()
+        for scheduler in self.hold_schedulers.values():
+            scheduler.stop()
+        for write_queue in self.write_queues.values():
+            if write_queue is not None:
+                write_queue.stop()
+        for scheduler in self.backup_schedulers.values():
+            if scheduler is not None:
+                scheduler.stop()
+        super().closeEvent(event)
+
     def cancel_last_order(self):
         """Отменить последний заказ"""
         email = self.email_input.text()
@@ -111,92 +285,109 @@ class TicketBookingApp(QWidget):
             self.show_error("Пожалуйста, введите правильный адрес электронной почты!")
             return
 
-        try:
-            # Найдем последний заказ пользователя
-            self.cursor.execute(
-                "SELECT id, play_name, date, zone_name, ticket_count FROM orders WHERE email = ? ORDER BY id DESC LIMIT 1",
-                (email,)
-            )
-            order = self.cursor.fetchone()
-
-            if not order:
-                self.show_error("У вас нет заказов для отмены.")
-                return
-
-            order_id, play_name, date, zone_name, ticket_count = order
-
-            # Восстановим количество билетов в зоне
-            self.cursor.execute(
-                "UPDATE zones SET available_tickets = available_tickets + ? WHERE play_name = ? AND date = ? AND zone_name = ?",
-                (ticket_count, play_name, date, zone_name)
-            )
-            self.conn.commit()
-
-            # Удалим последний заказ
-            self.cursor.execute(
-                "DELETE FROM orders WHERE id = ?",
-                (order_id,)
-            )
-            self.conn.commit()
-
-            QMessageBox.information(self, "Отмена заказа", "Ваш последний заказ успешно отменен!")
+        # Отменяется последний заказ в выбранном зале
+        venue = self.venue
+        self.executor.submit(service.cancel_latest_order, email, db=self.router.path(venue),
+                             on_result=lambda result: self.on_order_cancelled(venue, result),
+                             on_error=lambda e: self.show_error(f"Ошибка при отмене последнего заказа: {e}"))
 
-        except Exception as e:
-            self.show_error(f"Ошибка при отмене последнего заказа: {e}")
+    def on_order_cancelled(self, venue, result):
+        """Показывает результат отмены заказа."""
+        if result is None:
+            self.show_error("У вас нет заказов для отмены.")
+            return
+
+        play_name, date, zone_name, available_tickets = result
+        self.catalogs[venue].set_available(play_name, date, zone_name, available_tickets)
+        self.show_available_tickets()
+
+        QMessageBox.information(self, "Отмена заказа", "Ваш последний заказ успешно отменен!")
 
     def set_theme(self, theme):
         """Устанавливает тему приложения."""
-        if theme == "Темная":
-            self.setStyleSheet("""
-                QWidget {
-                    background-color: #2E2E2E;
-                    color: #FFFFFF;
-                }
-                QLineEdit, QComboBox, QSpinBox, QPushButton {
-                    background-color: #424242;
-                    color: #FFFFFF;
-                    border: 1px solid #555555;
-                }
-                QPushButton:hover {
-                    background-color: #616161;
-                }
-                QComboBox QAbstractItemView {
-                    background-color: #424242;
-                    color: #FFFFFF;
-                }
-            """)
-        elif theme == "Светлая":
-            self.setStyleSheet("""
-                QWidget {
-                    background-color: #FFFFFF;
-                    color: #000000;
-                }
-                QLineEdit, QComboBox, QSpinBox, QPushButton {
-                    background-color: #F0F0F0;
-                    color: #000000;
-                    border: 1px solid #CCCCCC;
-                }
-                QPushButton:hover {
-                    background-color: #E0E0E0;
-                }
-                QComboBox QAbstractItemView {
-                    background-color: #F0F0F0;
-                    color: #000000;
-                }
-            """)
+        # Повторная установка той же таблицы стилей заставила бы Qt заново применить ее ко всем виджетам
+        if theme in THEMES and theme != self.theme:
+            self.theme = theme
+            self.setStyleSheet(THEMES[theme])
 
     def change_theme(self, theme_name):
         """Изменяет тему в зависимости от выбора пользователя."""
         self.set_theme(theme_name)
 
+    def run_search(self):
+        """Ищет спектакли по введенному тексту в фоне; незавершенный прошлый поиск отменяется."""
+        text = self.search_input.text().strip()
+        if not text:
+            self.executor.cancel("search")
+            self.search_results.clear()
+            self.search_results.hide()
+            return
+
+        self.executor.submit(service.search_plays, text, channel="search",
+                             on_result=self.show_search_results,
+                             on_error=lambda e: self.show_error(f"Ошибка при поиске спектакля: {e}"))
+
+    def show_search_results(self, results):
+        """Показывает найденные спектакли с ближайшими сеансами."""
+        self.search_results.clear()
+        for play_name, showtimes in results:
+            if not showtimes:
+                item = QListWidgetItem(f"{play_name} — нет ближайших сеансов")
+                item.setData(Qt.ItemDataRole.UserRole, (play_name, None))
+                self.search_results.addItem(item)
+            for date, start_time in showtimes:
+                item = QListWidgetItem(f"{play_name} — {date} {start_time or ''}".rstrip())
+                item.setData(Qt.ItemDataRole.UserRole, (play_name, date))
+                self.search_results.addItem(item)
+        if not results:
+            self.search_results.addItem("Ничего не найдено")
+        self.search_results.show()
+
+    def select_search_result(self, item):
+        """Выбирает в каскаде дату и спектакль найденного сеанса."""
+        play_name, date = item.data(Qt.ItemDataRole.UserRole) or (None, None)
+        index = self.date_combo.findText(date) if date else -1
+        if index < 0:
+            return
+        self.date_combo.setCurrentIndex(index)
+        self.play_combo.setCurrentText(play_name)
+
+    def change_venue(self, venue):
+        """Переключает кассу на базу и каталог другого зала."""
+        if venue not in self.catalogs or venue == self.venue:
+            return
+        # Изменения каталога прежнего зала, которые еще читаются, к новому не относятся
+        self.executor.cancel("catalog")
+        self.venue = venue
+        self.executor.db_path = self.router.path(venue)
+        self.catalog = self.catalogs[venue]
+        self.update_dates()
+        self.refresh_catalog()
+
     def update_dates(self):
         """Заполняет комбобокс с доступными датами спектаклей."""
-        self.cursor.execute("SELECT DISTINCT date FROM showtimes ORDER BY date")
-        dates = self.cursor.fetchall()
-
         self.date_combo.clear()
         self.date_combo.addItem("Выберите дату")  # Добавляем placeholder
-        self.date_combo.addItems([date[0] for date in dates])
+        self.date_combo.addItems(self.catalog.get_dates())
+        self.update_date_tooltips()
+
+    def refresh_venue_dates(self):
+        """Читает даты спектаклей во всех залах одним запросом по присоединенным базам залов."""
+        if len(self.router.names) < 2 or len(self.ready_venues) < len(self.router.names):
+            return
+        self.executor.submit(self.router.list_dates, channel="venue_dates", db=self.router.connect,
+                             on_result=self.on_venue_dates_loaded)
+
+    def on_venue_dates_loaded(self, dates):
+        self.venue_dates = dict(dates)
+        self.update_date_tooltips()
+
+    def update_date_tooltips(self):
+        """Подсказывает у каждой даты, в каких залах в этот день идут спектакли."""
+        for index in range(1, self.date_combo.count()):
+            venues_on_date = self.venue_dates.get(self.date_combo.itemText(index))
+            tooltip = f"Спектакли в залах: {', '.join(venues_on_date)}" if venues_on_date else None
+            self.date_combo.setItemData(index, tooltip, Qt.ItemDataRole.ToolTipRole)
 
     def update_plays(self):
         """Обновляет список спектаклей в зависимости от выбранной даты."""
@@ -205,12 +396,9 @@ class TicketBookingApp(QWidget):
             self.play_combo.clear()
             return
 
-        self.cursor.execute("SELECT DISTINCT play_name FROM showtimes WHERE date = ? ORDER BY play_name", (date,))
-        plays = self.cursor.fetchall()
-
         self.play_combo.clear()
         self.play_combo.addItem("Выберите спектакль")  # Добавляем placeholder
-        self.play_combo.addItems([play[0] for play in plays])
+        self.play_combo.addItems(self.catalog.get_plays(date))
 
     def update_zones(self):
         """Обновляет список доступных зон в зависимости от выбранного спектакля."""
@@ -221,18 +409,49 @@ class TicketBookingApp(QWidget):
             self.zone_combo.clear()
             return
 
-        self.cursor.execute(
-            "SELECT DISTINCT zone_name FROM zones WHERE play_name = ? AND date = ? ORDER BY zone_name",
-            (play_name, date)
-        )
-        zones = self.cursor.fetchall()
-
         self.zone_combo.clear()
         self.zone_combo.addItem("Выберите зону")  # Добавляем placeholder
-        self.zone_combo.addItems([zone[0] for zone in zones])
+        self.zone_combo.addItems(self.catalog.get_zones(play_name, date))
 
     def update_available_tickets(self):
         """Обновляет количество доступных билетов в зависимости от выбранной зоны, спектакля и даты."""
+        self.show_available_tickets()
+        # Сразу показываем значение из кэша и в фоне проверяем, не продали ли билеты другие кассы
+        self.refresh_catalog()
+
+    def refresh_catalog(self):
+        """Запрашивает изменения каталога в фоне; устаревший запрос отменяется новым."""
+        self.executor.submit(self.catalog.fetch_changes, channel="catalog", db=False,
+                             on_result=self.on_catalog_changed)
+
+    def on_database_ready(self, venue, snapshot):
+        """Схема базы зала обновлена и каталог прочитан: запускаем планировщик броней и показываем каталог."""
+        self.hold_schedulers[venue].start()
+        self.ready_venues.add(venue)
+        self.refresh_venue_dates()
+        if self.write_queues[venue] is not None:
+            self.write_queues[venue].start()
+        if self.backup_schedulers[venue] is not None:
+            self.backup_schedulers[venue].start()
+        if venue != self.venue:
+            self.catalogs[venue].apply(snapshot)
+            return
+        self.on_catalog_changed(snapshot)
+        self.mark_startup("каталог")
+
+    def on_catalog_changed(self, snapshot):
+        """Применяет изменения каталога, прочитанные в рабочем потоке."""
+        if snapshot is None:
+            return
+
+        first_load = not self.catalog.get_dates()
+        self.catalog.apply(snapshot)
+        if first_load or self.date_combo.currentText() == "Выберите дату":
+            self.update_dates()
+        self.show_available_tickets()
+
+    def show_available_tickets(self):
+        """Показывает остаток билетов выбранной зоны из кэша каталога."""
         play_name = self.play_combo.currentText()
         date = self.date_combo.currentText()
         zone_name = self.zone_combo.currentText()
@@ -241,14 +460,10 @@ class TicketBookingApp(QWidget):
             self.available_tickets_label.setText("Доступно билетов: Н/Д")
             return
 
-        self.cursor.execute(
-            "SELECT available_tickets FROM zones WHERE play_name = ? AND date = ? AND zone_name = ?",
-            (play_name, date, zone_name)
-        )
-        available_tickets = self.cursor.fetchone()
+        available_tickets = self.catalog.get_available_tickets(play_name, date, zone_name)
 
-        if available_tickets:
-            self.available_tickets_label.setText(f"Доступно билетов: {available_tickets[0]}")
+        if available_tickets is not None:
+            self.available_tickets_label.setText(f"Доступно билетов: {available_tickets}")
         else:
             self.available_tickets_label.setText("Доступно билетов: Н/Д")
 
@@ -260,11 +475,10 @@ class TicketBookingApp(QWidget):
             self.play_description_label.setText("Описание спектакля: Н/Д")
             return
 
-        self.cursor.execute("SELECT description FROM plays WHERE name = ?", (play_name,))
-        description = self.cursor.fetchone()
+        description = self.catalog.get_description(play_name)
 
         if description:
-            self.play_description_label.setText(f"Описание спектакля: {description[0]}")
+            self.play_description_label.setText(f"Описание спектакля: {description}")
         else:
             self.play_description_label.setText("Описание спектакля: Н/Д")
 
@@ -278,8 +492,7 @@ class TicketBookingApp(QWidget):
             return
 
         try:
-            self.cursor.execute("SELECT start_time, duration FROM showtimes WHERE play_name = ? LIMIT 1", (play_name,))
-            result = self.cursor.fetchone()
+            result = self.catalog.get_showtime(play_name, self.date_combo.currentText())
 
             if result:
                 start_time, duration = result
@@ -296,8 +509,7 @@ class TicketBookingApp(QWidget):
 
     def is_valid_email(self, email):
         """Проверка валидности email."""
-        email_regex = r"(^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$)"
-        return re.match(email_regex, email) is not None
+        return service.is_valid_email(email)
 
     def show_error(self, message):
         """Показывает ошибку в виде всплывающего окна с изображением."""
@@ -306,9 +518,10 @@ class TicketBookingApp(QWidget):
         msg.setText(message)
         msg.setWindowTitle("Ошибка")
 
-        # Загружаем изображение
-        pixmap = QPixmap("error_icon.jpg")  # Укажите путь к вашему изображению
-        msg.setIconPixmap(pixmap)  # Устанавливаем изображение как иконку
+        # Изображение декодируется один раз и дальше берется из памяти
+        if self.error_pixmap is None:
+            self.error_pixmap = QPixmap(ERROR_ICON_PATH)
+        msg.setIconPixmap(self.error_pixmap)  # Устанавливаем изображение как иконку
 
         # Показываем сообщение
         msg.exec()
@@ -325,71 +538,101 @@ class TicketBookingApp(QWidget):
             self.show_error("Пожалуйста, введите правильный адрес электронной почты!")
             return
 
-        try:
-            self.cursor.execute(
-                "SELECT available_tickets FROM zones WHERE play_name = ? AND date = ? AND zone_name = ?",
-                (play_name, date, zone_name)
-            )
-            available_tickets = self.cursor.fetchone()
-
-            if not available_tickets or available_tickets[0] < ticket_count:
-                self.show_error("Недостаточно доступных билетов!")
-                return
-
-            # Создаем заказ
-            self.cursor.execute(
-                "INSERT INTO orders (email, play_name, date, zone_name, ticket_count) VALUES (?, ?, ?, ?, ?)",
-                (email, play_name, date, zone_name, ticket_count)
-            )
-
-            # Обновляем доступные билеты
-            self.cursor.execute(
-                "UPDATE zones SET available_tickets = available_tickets - ? WHERE play_name = ? AND date = ? AND zone_name = ?",
-                (ticket_count, play_name, date, zone_name)
-            )
-            self.conn.commit()
-
-            # Показываем окно с подтверждением и кнопкой сохранения билета
-            self.show_success_window(email, play_name, date, zone_name, ticket_count)
-
-        except Exception as e:
-            self.show_error(f"Ошибка при оформлении заказа: {e}")
+        # Сначала бронируем билеты: пока покупатель подтверждает заказ, их не продаст другая касса.
+        # Зал запоминаем: бронь и заказ должны попасть в одну базу, даже если кассир переключит зал
+        venue = self.venue
+        self.order_button.setEnabled(False)
+        self.executor.submit(service.hold_order, email, play_name, date, zone_name, ticket_count,
+                             booking.HOLD_TTL, self.write_queues[venue], db=self.router.path(venue),
+                             on_result=lambda result: self.on_tickets_held(
+                                 venue, email, play_name, date, zone_name, ticket_count, *result),
+                             on_error=self.on_order_failed)
+
+    def on_tickets_held(self, venue, email, play_name, date, zone_name, ticket_count, hold_id, available_tickets,
+                        seats, expires_at):
+        """Показывает бронь и спрашивает подтверждение покупки."""
+        self.hold_schedulers[venue].add(hold_id, expires_at)
+        self.catalogs[venue].set_available(play_name, date, zone_name, available_tickets)
+        self.show_available_tickets()
+
+        text = f"Билеты забронированы до {time.strftime('%H:%M', time.localtime(expires_at))}."
+        if seats:
+            text += f"\nМеста: {seatmap.format_seats(seats)}"
+        answer = QMessageBox.question(self, "Подтверждение заказа", f"{text}\nОформить заказ?")
+
+        if answer == QMessageBox.StandardButton.Yes:
+            self.executor.submit(service.confirm_hold, hold_id, self.write_queues[venue], db=self.router.path(venue),
+                                 on_result=lambda result: self.on_order_placed(
+                                     venue, email, play_name, date, zone_name, ticket_count, *result),
+                                 on_error=self.on_order_failed)
+        else:
+            self.executor.submit(service.release_hold, hold_id, db=self.router.path(venue),
+                                 on_result=lambda result: self.on_hold_released(venue, result),
+                                 on_error=self.on_order_failed)
+
+    def on_hold_released(self, venue, result):
+        """Возвращает отмененную бронь в остаток."""
+        self.order_button.setEnabled(True)
+        if result is not None:
+            play_name, date, zone_name, available_tickets = result
+            self.catalogs[venue].set_available(play_name, date, zone_name, available_tickets)
+            self.show_available_tickets()
+
+    def on_order_placed(self, venue, email, play_name, date, zone_name, ticket_count, order_id, seats):
+        """Показывает подтверждение заказа."""
+        self.order_button.setEnabled(True)
+
+        # Показываем окно с подтверждением и кнопкой сохранения билета; код билета проверят на входе
+        self.show_success_window(email, play_name, date, zone_name, ticket_count, seats, order_id,
+                                 self.router.path(venue))
+
+    def on_order_failed(self, error):
+        """Показывает ошибку оформления заказа."""
+        self.order_button.setEnabled(True)
+        if isinstance(error, booking.NotEnoughTicketsError):
+            self.show_error("Недостаточно доступных билетов!")
+        elif isinstance(error, booking.HoldExpiredError):
+            self.show_error(str(error))
+            self.refresh_catalog()
+        else:
+            self.show_error(f"Ошибка при оформлении заказа: {error}")
 
-    def show_success_window(self, email, play_name, date, zone_name, ticket_count):
+    def show_success_window(self, email, play_name, date, zone_name, ticket_count, seats=None, order_id=None,
+                            db_path=None):
         """Показывает окно с подтверждением заказа и кнопкой сохранения билета"""
         success_msg = QMessageBox(self)
         success_msg.setIcon(QMessageBox.Icon.Information)
-        success_msg.setText("Ваш заказ успешно оформлен!")
+        if seats:
+            success_msg.setText(f"Ваш заказ успешно оформлен!\nМеста: {seatmap.format_seats(seats)}")
+        else:
+            success_msg.setText("Ваш заказ успешно оформлен!")
         success_msg.setWindowTitle("Заказ успешен")
 
         # Кнопка для сохранения билета
         save_button = success_msg.addButton("Сохранить билет", QMessageBox.ButtonRole.AcceptRole)
-        save_button.clicked.connect(lambda: self.generate_ticket_pdf(email, play_name, date, zone_name, ticket_count))
+        save_button.clicked.connect(lambda: self.generate_ticket_pdf(email, play_name, date, zone_name, ticket_count,
+                                                                     seats, order_id, db_path))
 
         success_msg.exec()
 
-    def generate_ticket_pdf(self, email, play_name, date, zone_name, ticket_count):
-        """Генерирует PDF файл с билетом."""
+    def generate_ticket_pdf(self, email, play_name, date, zone_name, ticket_count, seats=None, order_id=None,
+                            db_path=None):
+        """Генерирует PDF файл с билетом. С заказом и базой на билете печатается код для проверки на входе."""
         file_name, _ = QFileDialog.getSaveFileName(self, "Сохранить билет", "", "PDF Files (*.pdf)")
 
         if not file_name:
             return  # Если пользователь не выбрал место для сохранения, выходим
 
-        pdfmetrics.registerFont(TTFont('DejaVuSans', 'C:/Users/sh3lze/Desktop/project/pythonProject1/DejaVuSans.ttf'))  # Убедитесь, что путь правильный
-        c = canvas.Canvas(file_name, pagesize=letter)
-        c.setFont("DejaVuSans", 12)
-
-        c.drawString(100, 750, f"Билет на спектакль: {play_name}")
-        c.drawString(100, 730, f"Дата: {date}")
-        c.drawString(100, 710, f"Зона: {zone_name}")
-        c.drawString(100, 690, f"Количество билетов: {ticket_count}")
-        c.drawString(100, 670, f"Email покупателя: {email}")
-        c.drawString(100, 650, "Спасибо за покупку!")
-
-        c.showPage()
-        c.save()
-
-        QMessageBox.information(self, "Билет сохранен", f"Ваш билет был сохранен как {file_name}.")
+        # Код билета подписывается в рабочем потоке: ключ при первом обращении читается с диска
+        if order_id is not None:
+            task = (tickets.render_order_ticket, file_name, db_path, order_id, email, play_name, date, zone_name,
+                    ticket_count, seats)
+        else:
+            task = (tickets.render_ticket, file_name, email, play_name, date, zone_name, ticket_count, seats)
+        self.executor.submit(*task, db=False,
+                             on_result=lambda name: QMessageBox.information(
+                                 self, "Билет сохранен", f"Ваш билет был сохранен как {name}."),
+                             on_error=lambda e: self.show_error(f"Ошибка при сохранении билета: {e}"))
 
     def show_order_history(self):
         """Показывает историю заказов"""
@@ -399,28 +642,37 @@ class TicketBookingApp(QWidget):
             self.show_error("Пожалуйста, введите правильный адрес электронной почты!")
             return
 
-        try:
-            self.cursor.execute(
-                "SELECT play_name, date, zone_name, ticket_count FROM orders WHERE email = ? ORDER BY id DESC",
-                (email,)
-            )
-            orders = self.cursor.fetchall()
-
-            if not orders:
-                self.show_error("У вас нет заказов.")
-                return
+        # Сначала читаем только первую страницу по всем залам, остальное окно подгрузит при прокрутке
+        self.executor.submit(self.router.load_history_page, email, db=self.router.connect,
+                             on_result=lambda page: self.on_order_history_loaded(email, page),
+                             on_error=lambda e: self.show_error(f"Ошибка при получении истории заказов: {e}"))
 
-            orders_text = "\n".join([f"{play} | {date} | {zone} | {tickets} билетов"
-                                    for play, date, zone, tickets in orders])
+    def on_order_history_loaded(self, email, first_page):
+        """Открывает окно истории заказов с первой загруженной страницей."""
+        if not first_page:
+            self.show_error("У вас нет заказов.")
+            return
 
-            QMessageBox.information(self, "История заказов", orders_text)
+        dialog = history.OrderHistoryDialog(self.executor, self.router, email, first_page, self)
+        dialog.order_cancelled.connect(self.on_history_order_cancelled)
+        dialog.exec()
 
-        except Exception as e:
-            self.show_error(f"Ошибка при получении истории заказов: {e}")
+    def on_history_order_cancelled(self, venue, play_name, date, zone_name, available_tickets):
+        """Обновляет остаток зоны после отмены заказа из истории."""
+        self.catalogs[venue].set_available(play_name, date, zone_name, available_tickets)
+        self.show_available_tickets()
 
 
 if __name__ == "__main__":
+    # Замер задержек включается только явно и до создания окна и подключений
+    profile_path = os.environ.get("THEATER_PROFILE")
+    if profile_path:
+        instrumentation.enable(profile_path)
+        instrumentation.wrap_handlers(TicketBookingApp, PROFILED_HANDLERS)
+        instrumentation.wrap_tasks(Task)
+
     app = QApplication(sys.argv)
     window = TicketBookingApp()
     window.show()
+    window.mark_startup("окно")
     sys.exit(app.exec())
@@ -0,0 +1,497 @@
+import sys
+
+import booking
+
+
+def _add_indexes(conn):
+    """Составные индексы под запросы каскада комбобоксов, заказа и истории."""
+    # Зоны: выбор зон спектакля на дату и условное списание билетов
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_zones_play_date_zone ON zones (play_name, date, zone_name)")
+    # Сеансы: список дат, спектакли на дату, время начала спектакля
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_showtimes_date_play ON showtimes (date, play_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_showtimes_play_date ON showtimes (play_name, date)")
+    # Спектакли: описание по названию
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plays_name ON plays (name)")
+    # Заказы: история и последний заказ по почте
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_email_id ON orders (email, id)")
+
+
+def _add_natural_keys(conn):
+    """Уникальные естественные ключи каталога для идемпотентного импорта сезона."""
+    # Повторные запуски старого create_database оставляли дубликаты — сохраняем самую раннюю строку
+    conn.execute("DELETE FROM plays WHERE id NOT IN (SELECT MIN(id) FROM plays GROUP BY name)")
+    conn.execute("DELETE FROM showtimes WHERE id NOT IN "
+                 "(SELECT MIN(id) FROM showtimes GROUP BY play_name, date, start_time)")
+    conn.execute("DELETE FROM zones WHERE id NOT IN (SELECT MIN(id) FROM zones GROUP BY play_name, date, zone_name)")
+
+    # Уникальные индексы заменяют обычные с тем же префиксом
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_plays_name ON plays (name)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_showtimes_play_date_time "
+                 "ON showtimes (play_name, date, start_time)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_zones_play_date_zone ON zones (play_name, date, zone_name)")
+    conn.execute("DROP INDEX IF EXISTS idx_plays_name")
+    conn.execute("DROP INDEX IF EXISTS idx_showtimes_play_date")
+    conn.execute("DROP INDEX IF EXISTS idx_zones_play_date_zone")
+
+
+def _add_order_date_index(conn):
+    """Индекс для выборки заказов на сеанс или диапазон дат (пакетная печать билетов)."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_date_play ON orders (date, play_name)")
+
+
+def _add_seat_maps(conn):
+    """Места в зонах: сетка рядов и карта мест битовой маской, назначенные места в заказах."""
+    conn.execute("ALTER TABLE zones ADD COLUMN seat_rows INTEGER")
+    conn.execute("ALTER TABLE zones ADD COLUMN seats_per_row INTEGER")
+    # NULL — зона без мест, продается только по счетчику available_tickets
+    conn.execute("ALTER TABLE zones ADD COLUMN seat_map BLOB")
+    conn.execute("ALTER TABLE orders ADD COLUMN seats TEXT")
+
+
+def _add_holds(conn):
+    """Временные брони: билеты списаны с остатка зоны, пока бронь не подтверждена или не истекла."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS holds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            play_name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            zone_name TEXT NOT NULL,
+            ticket_count INTEGER NOT NULL,
+            seats TEXT,
+            expires_at REAL NOT NULL
+        )
+    """)
+    # Планировщик снимает брони по сроку истечения
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_holds_expires_at ON holds (expires_at)")
+
+
+# Сколько заказов переносить в нормализованную таблицу за одну транзакцию
+NORMALIZE_CHUNK_SIZE = 50000
+
+# Строки заказа для копирования: зона определяется по старому текстовому ключу (спектакль, дата, зона).
+# id зон при нормализации сохраняются, поэтому zones.id старой таблицы годится как zone_id
+_COPY_ORDERS_SQL = (
+    "INSERT INTO orders_new (id, email, zone_id, ticket_count, seats, order_date) "
+    "SELECT o.id, o.email, z.id, o.ticket_count, o.seats, o.order_date FROM orders o "
+    "JOIN zones z ON z.play_name = o.play_name AND z.date = o.date AND z.zone_name = o.zone_name "
+    "WHERE o.id > ? ORDER BY o.id"
+)
+
+
+def _create_normalized_orders(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS orders_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            zone_id INTEGER NOT NULL REFERENCES zones (id),
+            ticket_count INTEGER NOT NULL,
+            seats TEXT,
+            order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _add_missing_zones(conn, after_id=0):
+    """Заказы без зоны в каталоге (старые базы это допускали) получают пустую зону, чтобы не потеряться."""
+    conn.execute(
+        "INSERT INTO zones (play_name, date, zone_name, available_tickets) "
+        "SELECT DISTINCT o.play_name, o.date, o.zone_name, 0 FROM orders o WHERE o.id > ? AND NOT EXISTS "
+        "(SELECT 1 FROM zones z WHERE z.play_name = o.play_name AND z.date = o.date AND z.zone_name = o.zone_name)",
+        (after_id,)
+    )
+
+
+def _copied_until(conn):
+    return conn.execute("SELECT IFNULL(MAX(id), 0) FROM orders_new").fetchone()[0]
+
+
+def _copy_orders(conn, progress=None):
+    """Подготовка к нормализации: переносит заказы в orders_new пачками по NORMALIZE_CHUNK_SIZE,
+    каждую в своей короткой транзакции. Между пачками кассы продолжают продавать; заказы,
+    появившиеся или отмененные за это время, учитывает завершающая транзакция миграции."""
+    with booking.immediate_transaction(conn):
+        _create_normalized_orders(conn)
+        _add_missing_zones(conn)
+
+    done = 0
+    while True:
+        with booking.immediate_transaction(conn):
+            copied = conn.execute(f"{_COPY_ORDERS_SQL} LIMIT ?", (_copied_until(conn), NORMALIZE_CHUNK_SIZE)).rowcount
+        done += copied
+        if progress is not None:
+            progress(f"Перенесено заказов: {done}")
+        if copied < NORMALIZE_CHUNK_SIZE:
+            break
+
+
+def _normalize_schema(conn):
+    """Нормализованная схема: сеансы ссылаются на спектакль, зоны — на сеанс, заказы и брони — на зону
+    целочисленными ключами вместо повторяющихся строк спектакля, даты и зоны. Читать их вместе
+    с названиями удобно через представления zone_details и order_details."""
+    # Догоняем заказы, оформленные и отмененные после переноса пачками
+    _create_normalized_orders(conn)
+    copied_until = _copied_until(conn)
+    _add_missing_zones(conn, copied_until)
+    conn.execute(_COPY_ORDERS_SQL, (copied_until,))
+    conn.execute("DELETE FROM orders_new WHERE id NOT IN (SELECT id FROM orders)")
+
+    # Спектакли, которые упоминаются только в сеансах или зонах
+    conn.execute("INSERT INTO plays (name) SELECT play_name FROM showtimes UNION SELECT play_name FROM zones "
+                 "EXCEPT SELECT name FROM plays")
+
+    conn.execute("""
+        CREATE TABLE showtimes_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            play_id INTEGER NOT NULL REFERENCES plays (id),
+            date DATE NOT NULL,
+            start_time TEXT NOT NULL,  -- HH:MM
+            duration INTEGER  -- длительность в минутах
+        )
+    """)
+    conn.execute("INSERT INTO showtimes_new (id, play_id, date, start_time, duration) "
+                 "SELECT s.id, p.id, s.date, s.start_time, s.duration FROM showtimes s "
+                 "JOIN plays p ON p.name = s.play_name")
+    # Зоны на дату, для которой нет сеанса, получают сеанс без времени начала
+    conn.execute("INSERT INTO showtimes_new (play_id, date, start_time) "
+                 "SELECT DISTINCT p.id, z.date, '' FROM zones z JOIN plays p ON p.name = z.play_name "
+                 "WHERE NOT EXISTS (SELECT 1 FROM showtimes s WHERE s.play_name = z.play_name AND s.date = z.date)")
+
+    conn.execute("""
+        CREATE TABLE zones_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            showtime_id INTEGER NOT NULL REFERENCES showtimes (id),
+            zone_name TEXT NOT NULL,
+            available_tickets INTEGER NOT NULL,
+            seat_rows INTEGER,
+            seats_per_row INTEGER,
+            seat_map BLOB
+        )
+    """)
+    # Зоны относятся к первому сеансу спектакля в этот день — как и раньше показывал каталог
+    conn.execute("INSERT INTO zones_new (id, showtime_id, zone_name, available_tickets, seat_rows, seats_per_row, "
+                 "seat_map) SELECT z.id, (SELECT s.id FROM showtimes_new s WHERE s.play_id = p.id AND s.date = z.date "
+                 "ORDER BY s.start_time, s.id LIMIT 1), z.zone_name, z.available_tickets, z.seat_rows, "
+                 "z.seats_per_row, z.seat_map FROM zones z JOIN plays p ON p.name = z.play_name")
+
+    conn.execute("""
+        CREATE TABLE holds_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            zone_id INTEGER NOT NULL REFERENCES zones (id),
+            ticket_count INTEGER NOT NULL,
+            seats TEXT,
+            expires_at REAL NOT NULL
+        )
+    """)
+    conn.execute("INSERT INTO holds_new (id, email, zone_id, ticket_count, seats, expires_at) "
+                 "SELECT h.id, h.email, z.id, h.ticket_count, h.seats, h.expires_at FROM holds h "
+                 "JOIN zones z ON z.play_name = h.play_name AND z.date = h.date AND z.zone_name = h.zone_name")
+
+    # Счетчики AUTOINCREMENT сохраняем, чтобы id удаленных заказов не выдавались повторно
+    sequences = dict(conn.execute("SELECT name, seq FROM sqlite_sequence"))
+    for table in ("showtimes", "zones", "orders", "holds"):
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        if table in sequences:
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequences[table], table))
+
+    conn.execute("CREATE UNIQUE INDEX uq_showtimes_play_date_time ON showtimes (play_id, date, start_time)")
+    conn.execute("CREATE INDEX idx_showtimes_date_play ON showtimes (date, play_id)")
+    conn.execute("CREATE UNIQUE INDEX uq_zones_showtime_zone ON zones (showtime_id, zone_name)")
+    conn.execute("CREATE INDEX idx_orders_email_id ON orders (email, id)")
+    conn.execute("CREATE INDEX idx_orders_zone ON orders (zone_id)")
+    conn.execute("CREATE INDEX idx_holds_expires_at ON holds (expires_at)")
+
+    conn.execute("""
+        CREATE VIEW zone_details AS
+        SELECT z.id, p.name AS play_name, s.date, z.zone_name, z.available_tickets, z.showtime_id
+        FROM zones z JOIN showtimes s ON s.id = z.showtime_id JOIN plays p ON p.id = s.play_id
+    """)
+    conn.execute("""
+        CREATE VIEW order_details AS
+        SELECT o.id, o.email, p.name AS play_name, s.date, z.zone_name, o.ticket_count, o.seats, o.order_date,
+               o.zone_id
+        FROM orders o JOIN zones z ON z.id = o.zone_id JOIN showtimes s ON s.id = z.showtime_id
+        JOIN plays p ON p.id = s.play_id
+    """)
+
+
+def _add_sales_aggregates(conn):
+    """Сводные таблицы продаж для отчетов. Их поддерживают триггеры на orders, поэтому любой путь
+    записи (заказ, подтверждение брони, отмена, массовая отмена, импорт) обновляет их в той же транзакции,
+    а отчеты читают по строке на зону или день вместо прохода по всем заказам."""
+    conn.execute("""
+        CREATE TABLE zone_sales (
+            zone_id INTEGER PRIMARY KEY REFERENCES zones (id),
+            orders INTEGER NOT NULL,
+            tickets INTEGER NOT NULL
+        )
+    """)
+    # Продажи по дню оформления заказа; отмена уменьшает продажи того дня, когда заказ был оформлен
+    conn.execute("""
+        CREATE TABLE daily_sales (
+            day TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            tickets INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER orders_sales_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO zone_sales (zone_id, orders, tickets) VALUES (NEW.zone_id, 1, NEW.ticket_count)
+                ON CONFLICT (zone_id) DO UPDATE SET orders = orders + 1, tickets = tickets + excluded.tickets;
+            INSERT INTO daily_sales (day, orders, tickets) VALUES (date(NEW.order_date), 1, NEW.ticket_count)
+                ON CONFLICT (day) DO UPDATE SET orders = orders + 1, tickets = tickets + excluded.tickets;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER orders_sales_delete AFTER DELETE ON orders BEGIN
+            UPDATE zone_sales SET orders = orders - 1, tickets = tickets - OLD.ticket_count
+                WHERE zone_id = OLD.zone_id;
+            UPDATE daily_sales SET orders = orders - 1, tickets = tickets - OLD.ticket_count
+                WHERE day = date(OLD.order_date);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER orders_sales_update AFTER UPDATE OF zone_id, ticket_count, order_date ON orders BEGIN
+            UPDATE zone_sales SET orders = orders - 1, tickets = tickets - OLD.ticket_count
+                WHERE zone_id = OLD.zone_id;
+            UPDATE daily_sales SET orders = orders - 1, tickets = tickets - OLD.ticket_count
+                WHERE day = date(OLD.order_date);
+            INSERT INTO zone_sales (zone_id, orders, tickets) VALUES (NEW.zone_id, 1, NEW.ticket_count)
+                ON CONFLICT (zone_id) DO UPDATE SET orders = orders + 1, tickets = tickets + excluded.tickets;
+            INSERT INTO daily_sales (day, orders, tickets) VALUES (date(NEW.order_date), 1, NEW.ticket_count)
+                ON CONFLICT (day) DO UPDATE SET orders = orders + 1, tickets = tickets + excluded.tickets;
+        END
+    """)
+    conn.execute("INSERT INTO zone_sales (zone_id, orders, tickets) "
+                 "SELECT zone_id, COUNT(*), SUM(ticket_count) FROM orders GROUP BY zone_id")
+    conn.execute("INSERT INTO daily_sales (day, orders, tickets) "
+                 "SELECT date(order_date), COUNT(*), SUM(ticket_count) FROM orders GROUP BY date(order_date)")
+
+
+def _add_play_search(conn):
+    """Полнотекстовый индекс FTS5 по названиям и описаниям спектаклей для поиска по мере ввода.
+    Индекс внешнего содержимого (content='plays') хранит только токены, сами тексты читаются из plays;
+    триггеры синхронизируют его с таблицей. Префиксные индексы на 2 и 3 символа отвечают на запрос
+    по первым буквам слова без перебора словаря."""
+    conn.execute("""
+        CREATE VIRTUAL TABLE plays_fts USING fts5 (
+            name, description,
+            content = 'plays', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER plays_fts_insert AFTER INSERT ON plays BEGIN
+            INSERT INTO plays_fts (rowid, name, description) VALUES (NEW.id, NEW.name, NEW.description);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER plays_fts_delete AFTER DELETE ON plays BEGIN
+            INSERT INTO plays_fts (plays_fts, rowid, name, description)
+                VALUES ('delete', OLD.id, OLD.name, OLD.description);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER plays_fts_update AFTER UPDATE OF name, description ON plays BEGIN
+            INSERT INTO plays_fts (plays_fts, rowid, name, description)
+                VALUES ('delete', OLD.id, OLD.name, OLD.description);
+            INSERT INTO plays_fts (rowid, name, description) VALUES (NEW.id, NEW.name, NEW.description);
+        END
+    """)
+    # Совпадение в названии весит больше, чем в описании
+    conn.execute("INSERT INTO plays_fts (plays_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    conn.execute("INSERT INTO plays_fts (plays_fts) VALUES ('rebuild')")
+
+
+def _add_archive_index(conn):
+    """Индекс архива прошедших сеансов (archive.py): в каких месяцах архива есть заказы покупателя,
+    и итоги перенесенных в архив заказов по дням для сверки daily_sales."""
+    conn.execute("""
+        CREATE TABLE archive_index (
+            email TEXT NOT NULL,
+            month TEXT NOT NULL,
+            orders INTEGER NOT NULL,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            PRIMARY KEY (email, month)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE archived_daily_sales (
+            day TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            tickets INTEGER NOT NULL
+        )
+    """)
+
+
+def _add_checkins(conn):
+    """Отметки о проходе на входе (checkin.py): по строке на заказ. Входы дописывают их пачками и
+    читают чужие отметки по возрастанию id. Отметка удаляется вместе с заказом (отмена, архивация)."""
+    conn.execute("""
+        CREATE TABLE checkins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL UNIQUE,
+            checked_in_at REAL NOT NULL,
+            door TEXT NOT NULL DEFAULT ''
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER orders_checkins_delete AFTER DELETE ON orders BEGIN
+            DELETE FROM checkins WHERE order_id = OLD.id;
+        END
+    """)
+
+
+def _add_catalog_version(conn):
+    """Счетчик изменений каталога для CatalogCache: триггеры увеличивают его при любом изменении
+    спектаклей, сеансов и состава зон. Продажа билетов (остаток и карта мест зоны) его не меняет."""
+    conn.execute("""
+        CREATE TABLE catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT INTO catalog_version (id, version) VALUES (1, 0)")
+    for table, columns in (("plays", "name, description"),
+                           ("showtimes", "play_id, date, start_time, duration"),
+                           ("zones", "showtime_id, zone_name")):
+        for event in ("INSERT", "DELETE", f"UPDATE OF {columns}"):
+            conn.execute(f"""
+                CREATE TRIGGER {table}_catalog_{event.split()[0].lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE catalog_version SET version = version + 1;
+                END
+            """)
+
+
+# Миграции по порядку; номер версии хранится в PRAGMA user_version
+MIGRATIONS = [
+    (1, _add_indexes),
+    (2, _add_natural_keys),
+    (3, _add_order_date_index),
+    (4, _add_seat_maps),
+    (5, _add_holds),
+    (6, _normalize_schema),
+    (7, _add_sales_aggregates),
+    (8, _add_play_search),
+    (9, _add_archive_index),
+    (10, _add_checkins),
+    (11, _add_catalog_version),
+]
+
+# Долгая подготовка миграции, которая выполняется до ее транзакции короткими транзакциями,
+# чтобы не держать блокировку записи на все время переноса данных
+PREPARATIONS = {
+    6: _copy_orders,
+}
+
+
+def schema_version(conn):
+    """Возвращает текущую версию схемы базы."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, progress=None):
+    """Применяет недостающие миграции, каждую в своей транзакции. progress(текст) получает сообщения
+    о ходе долгих миграций."""
+    for version, apply in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        if version in PREPARATIONS:
+            PREPARATIONS[version](conn, progress)
+        with booking.immediate_transaction(conn):
+            # Другой процесс мог успеть применить эту миграцию, пока шла подготовка
+            if version <= schema_version(conn):
+                continue
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+    # Обновляем статистику, чтобы планировщик выбирал новые индексы
+    conn.execute("PRAGMA optimize")
+
+
+# Запросы, которые по смыслу перебирают всю таблицу (все даты афиши): им разрешен обход покрывающего
+# индекса по порядку, но не чтение самих строк таблицы и не сортировка
+WHOLE_TABLE_QUERIES = {"list_dates"}
+
+
+def hot_queries():
+    """Горячие запросы приложения с примерными параметрами: {имя: (sql, параметры)}. SQL берется из
+    модулей, которые его выполняют, поэтому проверка не расходится с кодом."""
+    # Импорт здесь, а не в начале модуля: service и checkin сами импортируют migrations через booking и addinfo
+    import checkin
+    import service
+    import tickets
+
+    return {
+        "list_dates": (service.DATES_SQL, ()),
+        "list_plays": (service.PLAYS_SQL, ("",)),
+        "list_zones": (service.ZONES_SQL, ("", "")),
+        "available_tickets": (booking.AVAILABLE_TICKETS_SQL, ("", "", "")),
+        "reserve": (booking.RESERVE_SQL, (0, "", "", "", 0)),
+        "history_first_page": (service.HISTORY_SQL, ("", 100)),
+        "history_next_page": (service.HISTORY_BEFORE_SQL, ("", 0, 100)),
+        "cancel_latest_order": (service.LATEST_ORDER_SQL, ("",)),
+        "cancel_showtime": (booking.CANCEL_ORDERS_SQL.format(where="play_name = ? AND date = ?"), ("", "")),
+        "cancel_by_email": (booking.CANCEL_ORDERS_SQL.format(where="email = ?"), ("",)),
+        "print_tickets": tickets.orders_query(""),
+        "print_play_tickets": tickets.orders_query("", play_name=""),
+        "search_plays": (service.SEARCH_SQL, ('"а"*', service.SEARCH_LIMIT, "")),
+        "check_in": (f"{checkin.TICKET_SQL} WHERE date = ?", ("",)),
+        "check_in_lookup": (f"{checkin.TICKET_SQL} WHERE id = ?", (0,)),
+        "check_in_cancelled": (checkin.ORDER_EXISTS_SQL, (0,)),
+        "release_expired_holds": (booking.RELEASE_EXPIRED_SQL, (0, booking.HOLD_RELEASE_BATCH)),
+    }
+
+
+def query_plan(conn, sql, params=()):
+    """Возвращает строки EXPLAIN QUERY PLAN для запроса."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn, queries=None):
+    """Проверяет планы горячих запросов. Возвращает {имя: план} для запросов с полным обходом таблицы
+    или индекса либо временным B-деревом для сортировки."""
+    problems = {}
+    for name, (sql, params) in (queries or hot_queries()).items():
+        plan = query_plan(conn, sql, params)
+        # Проход по материализованному подзапросу (его размер ограничен LIMIT) — не полный обход таблицы
+        materialized = {step.split()[-1] for step in plan if step.startswith("MATERIALIZE")}
+        for step in plan:
+            if "TEMP B-TREE" in step:
+                break
+            if not step.startswith("SCAN") or step.split()[1] in materialized or step == "SCAN CONSTANT ROW":
+                continue
+            # Поиск по индексу FTS5 или json_each — не обход таблицы
+            if "VIRTUAL TABLE INDEX" in step:
+                continue
+            # "SCAN t USING INDEX" читает весь индекс, а не диапазон, — это тоже полный обход
+            if name in WHOLE_TABLE_QUERIES and "USING COVERING INDEX" in step:
+                continue
+            break
+        else:
+            continue
+        problems[name] = plan
+    return problems
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith("--") else booking.DB_PATH
+    conn = booking.connect(path)
+    migrate(conn, progress=print)
+    print(f"Схема {path} обновлена до версии {schema_version(conn)}.")
+
+    if "--vacuum" in sys.argv:
+        # Место, освобожденное после нормализации, возвращается только пересборкой файла
+        conn.execute("VACUUM")
+        print("База сжата.")
+
+    if "--check" in sys.argv:
+        problems = check_query_plans(conn)
+        for name, plan in problems.items():
+            print(f"{name}: {' / '.join(plan)}")
+        if problems:
+            sys.exit(1)
+        print("Все горячие запросы используют индексы.")
+    conn.close()
@@ -0,0 +1,75 @@
+"""Массовая отмена заказов и отчет о возвратах.
+
+    python refunds.py --play Гамлет --date 2024-11-20 --report refunds.csv   # отмена спектакля
+    python refunds.py --play Гамлет --all-dates                                # снять спектакль со всех дат
+    python refunds.py --date 2024-11-20 --all-plays                            # отменить все спектакли дня
+    python refunds.py --email client@mail.ru
+    python refunds.py --order 12 15 40
+
+Все выбранные заказы удаляются, а билеты возвращаются в зоны одной транзакцией (booking.cancel_orders).
+"""
+import argparse
+import csv
+import time
+
+import booking
+
+REPORT_COLUMNS = ("order_id", "email", "play_name", "date", "zone_name", "ticket_count", "seats", "order_date")
+
+
+def build_report(orders, zones):
+    """Отчет о возвратах по результату booking.cancel_orders: отмененные заказы, итоги по покупателям
+    (кому и сколько билетов вернуть) и новые остатки зон."""
+    customers = {}
+    for order in orders:
+        email, ticket_count = order[1], order[5]
+        total = customers.setdefault(email, {"email": email, "orders": 0, "tickets": 0})
+        total["orders"] += 1
+        total["tickets"] += ticket_count
+
+    return {
+        "orders": [dict(zip(REPORT_COLUMNS, order)) for order in orders],
+        "tickets": sum(order[5] for order in orders),
+        "customers": sorted(customers.values(), key=lambda total: total["email"]),
+        "zones": [{"play_name": play_name, "date": date, "zone_name": zone_name, "available_tickets": available}
+                  for play_name, date, zone_name, available in zones],
+    }
+
+
+def write_csv(report, path):
+    """Сохраняет отмененные заказы отчета в CSV для бухгалтерии."""
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(report["orders"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовая отмена заказов с отчетом о возвратах.")
+    parser.add_argument("--order", type=int, nargs="+", dest="order_ids", help="id заказов")
+    parser.add_argument("--email", help="все заказы покупателя")
+    parser.add_argument("--play", help="спектакль (вместе с --date — отмена сеанса)")
+    parser.add_argument("--date", help="дата спектакля (ГГГГ-ММ-ДД)")
+    parser.add_argument("--all-dates", action="store_true", help="отменить --play на все даты, без --date")
+    parser.add_argument("--all-plays", action="store_true", help="отменить все спектакли --date, без --play")
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--report", help="сохранить отмененные заказы в CSV")
+    args = parser.parse_args()
+
+    conn = booking.connect(args.db)
+    started = time.perf_counter()
+    try:
+        orders, zones = booking.cancel_orders(conn, args.order_ids, args.email, args.play, args.date,
+                                              args.all_dates, args.all_plays)
+    except booking.BookingError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - started
+    conn.close()
+
+    report = build_report(orders, zones)
+    if args.report:
+        write_csv(report, args.report)
+
+    print(f"Отменено заказов: {len(orders)}, билетов: {report['tickets']} за {elapsed:.3f} с.")
+    for total in report["customers"]:
+        print(f"  {total['email']}: заказов {total['orders']}, билетов {total['tickets']}")
@@ -0,0 +1,157 @@
+"""Отчеты о продажах для руководства.
+
+    python reports.py showtimes --from 2024-11-20 --to 2024-11-24 --csv fill.csv
+    python reports.py plays
+    python reports.py daily --from 2024-11-01
+    python reports.py check
+
+Отчеты читают сводные таблицы zone_sales и daily_sales, которые триггеры на orders обновляют
+при каждом заказе и отмене (миграция 7), поэтому время отчета зависит от числа сеансов и дней,
+а не от числа заказов. Заполняемость = продано / (продано + в брони + свободно).
+"""
+import argparse
+import csv
+import sys
+
+import booking
+
+SHOWTIME_COLUMNS = ("date", "start_time", "play_name", "zone_name", "orders", "sold", "held", "available",
+                    "capacity", "fill_rate")
+PLAY_COLUMNS = ("play_name", "showtimes", "orders", "sold", "held", "available", "capacity", "fill_rate")
+DAILY_COLUMNS = ("day", "orders", "tickets")
+
+# Продано, в брони и свободно по зонам; брони агрегируются по небольшой таблице holds
+_ZONE_TOTALS_SQL = """
+    SELECT s.date, s.start_time, p.name, z.zone_name, IFNULL(zs.orders, 0), IFNULL(zs.tickets, 0),
+           IFNULL(h.tickets, 0), z.available_tickets, s.id
+    FROM zones z
+    JOIN showtimes s ON s.id = z.showtime_id
+    JOIN plays p ON p.id = s.play_id
+    LEFT JOIN zone_sales zs ON zs.zone_id = z.id
+    LEFT JOIN (SELECT zone_id, SUM(ticket_count) AS tickets FROM holds GROUP BY zone_id) h ON h.zone_id = z.id
+"""
+
+
+def _fill_rate(sold, held, available):
+    capacity = sold + held + available
+    return round(sold / capacity, 4) if capacity else None
+
+
+def _zone_totals(conn, date_from=None, date_to=None, play_name=None):
+    sql = _ZONE_TOTALS_SQL + " WHERE s.date BETWEEN ? AND ?"
+    params = [date_from or "", date_to or "9999-12-31"]
+    if play_name:
+        sql += " AND p.name = ?"
+        params.append(play_name)
+    return conn.execute(sql + " ORDER BY s.date, s.start_time, p.name, z.zone_name", params).fetchall()
+
+
+def showtime_report(conn, date_from=None, date_to=None, play_name=None):
+    """Продажи по сеансам и зонам: продано, в брони, свободно, вместимость и заполняемость."""
+    report = []
+    for date, start_time, play, zone_name, orders, sold, held, available, _ in _zone_totals(
+            conn, date_from, date_to, play_name):
+        report.append(dict(zip(SHOWTIME_COLUMNS, (date, start_time, play, zone_name, orders, sold, held, available,
+                                                  sold + held + available, _fill_rate(sold, held, available)))))
+    return report
+
+
+def play_report(conn, date_from=None, date_to=None):
+    """Продажи по спектаклям за период."""
+    plays = {}
+    for _, _, play, _, orders, sold, held, available, showtime_id in _zone_totals(conn, date_from, date_to):
+        total = plays.setdefault(play, {"play_name": play, "showtimes": set(), "orders": 0, "sold": 0, "held": 0,
+                                        "available": 0})
+        total["showtimes"].add(showtime_id)
+        total["orders"] += orders
+        total["sold"] += sold
+        total["held"] += held
+        total["available"] += available
+
+    report = []
+    for total in sorted(plays.values(), key=lambda total: total["play_name"]):
+        total["showtimes"] = len(total["showtimes"])
+        total["capacity"] = total["sold"] + total["held"] + total["available"]
+        total["fill_rate"] = _fill_rate(total["sold"], total["held"], total["available"])
+        report.append(total)
+    return report
+
+
+def daily_report(conn, date_from=None, date_to=None):
+    """Продажи по дням оформления заказов."""
+    rows = conn.execute(
+        "SELECT day, orders, tickets FROM daily_sales WHERE day BETWEEN ? AND ? AND orders > 0 ORDER BY day",
+        (date_from or "", date_to or "9999-12-31")
+    )
+    return [dict(zip(DAILY_COLUMNS, row)) for row in rows]
+
+
+def check_aggregates(conn):
+    """Сверяет сводные таблицы с полным пересчетом по orders. Возвращает список расхождений."""
+    problems = []
+    for zone_id, expected, actual in conn.execute("""
+        SELECT z.id, IFNULL(o.tickets, 0), IFNULL(zs.tickets, 0) FROM zones z
+        LEFT JOIN (SELECT zone_id, SUM(ticket_count) AS tickets FROM orders GROUP BY zone_id) o ON o.zone_id = z.id
+        LEFT JOIN zone_sales zs ON zs.zone_id = z.id
+        WHERE IFNULL(o.tickets, 0) != IFNULL(zs.tickets, 0)
+    """):
+        problems.append(f"зона {zone_id}: продано {expected}, в сводке {actual}")
+    # Продажи по дням включают и заказы, перенесенные в архив (archive.py)
+    for day, expected, actual in conn.execute("""
+        SELECT o.day, SUM(o.tickets), IFNULL(ds.tickets, 0) FROM
+            (SELECT date(order_date) AS day, SUM(ticket_count) AS tickets FROM orders GROUP BY day
+             UNION ALL
+             SELECT day, tickets FROM archived_daily_sales) o
+        LEFT JOIN daily_sales ds ON ds.day = o.day
+        GROUP BY o.day
+        HAVING SUM(o.tickets) != IFNULL(ds.tickets, 0)
+    """):
+        problems.append(f"день {day}: продано {expected}, в сводке {actual}")
+    return problems
+
+
+def write_csv(rows, columns, path):
+    """Сохраняет отчет в CSV (с BOM, чтобы Excel сразу открыл кириллицу)."""
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+REPORTS = {
+    "showtimes": (SHOWTIME_COLUMNS, lambda conn, args: showtime_report(conn, args.date_from, args.date_to, args.play)),
+    "plays": (PLAY_COLUMNS, lambda conn, args: play_report(conn, args.date_from, args.date_to)),
+    "daily": (DAILY_COLUMNS, lambda conn, args: daily_report(conn, args.date_from, args.date_to)),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отчеты о продажах билетов.")
+    parser.add_argument("report", choices=[*REPORTS, "check"],
+                        help="по сеансам и зонам, по спектаклям, по дням или сверка сводок с заказами")
+    parser.add_argument("--from", dest="date_from", help="начало периода (ГГГГ-ММ-ДД)")
+    parser.add_argument("--to", dest="date_to", help="конец периода включительно")
+    parser.add_argument("--play", help="только этот спектакль (отчет по сеансам)")
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--csv", help="сохранить отчет в CSV")
+    args = parser.parse_args()
+
+    conn = booking.connect(args.db)
+    if args.report == "check":
+        problems = check_aggregates(conn)
+        for problem in problems:
+            print(problem)
+        print("Сводки совпадают с заказами." if not problems else f"Расхождений: {len(problems)}")
+        sys.exit(1 if problems else 0)
+
+    columns, build = REPORTS[args.report]
+    rows = build(conn, args)
+    conn.close()
+
+    if args.csv:
+        write_csv(rows, columns, args.csv)
+        print(f"Отчет сохранен в {args.csv} ({len(rows)} строк).")
+    else:
+        print("\t".join(columns))
+        for row in rows:
+            print("\t".join("" if row[column] is None else str(row[column]) for column in columns))
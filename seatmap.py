@@ -0,0 +1,81 @@
+"""Карта мест зоны в виде битовой маски.
+
+Зона — сетка rows × per_row мест. Место (ряд r, номер s), считая с нуля, хранится в бите
+r * per_row + s (младший бит первого байта — первое место первого ряда); 1 — место продано.
+Зал на 2000 мест занимает 250 байт в одной строке zones вместо 2000 строк.
+
+Назначенные места заказа хранятся в orders.seats строкой "ряд:первое-последнее" (с единицы),
+например "3:5-8".
+"""
+import re
+
+
+def empty_map(rows, per_row):
+    """Карта зоны, в которой все места свободны."""
+    return bytes((rows * per_row + 7) // 8)
+
+
+def _seat_bits(seat_map, total):
+    """Строка из '0' и '1' длиной total, где i-й символ — i-е место."""
+    return format(int.from_bytes(seat_map, "little"), f"0{total}b")[::-1][:total]
+
+
+def row_order(rows):
+    """Порядок рядов от лучших к худшим: ближе к трети зала от сцены, при равенстве — ближе к сцене."""
+    best = rows // 3
+    return sorted(range(rows), key=lambda row: (abs(row - best), row))
+
+
+def find_adjacent(seat_map, rows, per_row, count):
+    """Ищет count свободных мест подряд в одном ряду. Возвращает (ряд, первое место) с нуля
+    или None. В лучшем подходящем ряду выбирается блок, ближайший к центру ряда.
+    Проход линейный по числу мест; сами строки сканирует регулярное выражение на C."""
+    if count <= 0 or count > per_row:
+        return None
+
+    bits = _seat_bits(seat_map, rows * per_row)
+    block = re.compile(f"(?=0{{{count}}})")
+    center = (per_row - count) / 2
+
+    for row in row_order(rows):
+        line = bits[row * per_row:(row + 1) * per_row]
+        starts = [match.start() for match in block.finditer(line)]
+        if starts:
+            return row, min(starts, key=lambda start: (abs(start - center), start))
+    return None
+
+
+def set_seats(seat_map, per_row, row, first, count, taken=True):
+    """Возвращает новую карту, где count мест ряда row начиная с first отмечены проданными
+    (taken=True) или свободными."""
+    mask = ((1 << count) - 1) << (row * per_row + first)
+    value = int.from_bytes(seat_map, "little")
+    value = value | mask if taken else value & ~mask
+    return value.to_bytes(len(seat_map), "little")
+
+
+def free_count(seat_map, rows, per_row):
+    """Число свободных мест по карте."""
+    return rows * per_row - _seat_bits(seat_map, rows * per_row).count("1")
+
+
+def encode_seats(row, first, count):
+    """Места заказа для orders.seats (с нуля → с единицы)."""
+    return f"{row + 1}:{first + 1}-{first + count}"
+
+
+def decode_seats(seats):
+    """Разбирает orders.seats обратно в (ряд, первое место, количество) с нуля."""
+    row, _, span = seats.partition(":")
+    first, _, last = span.partition("-")
+    return int(row) - 1, int(first) - 1, int(last) - int(first) + 1
+
+
+def format_seats(seats):
+    """Места для билета и истории: "ряд 3, места 5–8"."""
+    if not seats:
+        return ""
+    row, first, count = decode_seats(seats)
+    if count == 1:
+        return f"ряд {row + 1}, место {first + 1}"
+    return f"ряд {row + 1}, места {first + 1}–{first + count}"
@@ -0,0 +1,192 @@
+"""Логика продаж без интерфейса. Ее вызывают окно кассы (через пул потоков) и HTTP API.
+
+Все функции принимают подключение первым аргументом и не держат состояния между вызовами,
+поэтому их можно выполнять в любом потоке со своим подключением.
+"""
+import datetime
+import re
+
+import addinfo
+import archive
+import booking
+import migrations
+import refunds
+
+# Сколько заказов отдавать за одну страницу истории
+HISTORY_PAGE_SIZE = 100
+
+# Сколько спектаклей и ближайших сеансов каждого показывать в результатах поиска
+SEARCH_LIMIT = 20
+SEARCH_SHOWTIMES = 5
+
+EMAIL_REGEX = re.compile(r"(^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$)")
+
+# Запросы кассы и API. Их планы проверяет migrations.check_query_plans, поэтому они вынесены сюда
+DATES_SQL = "SELECT DISTINCT date FROM showtimes ORDER BY date"
+PLAYS_SQL = "SELECT name FROM plays WHERE id IN (SELECT play_id FROM showtimes WHERE date = ?)"
+# Зоны принадлежат первому сеансу спектакля в этот день
+ZONES_SQL = ("SELECT zone_name, available_tickets FROM zones WHERE showtime_id = (SELECT s.id FROM showtimes s "
+             "JOIN plays p ON p.id = s.play_id WHERE p.name = ? AND s.date = ? ORDER BY s.start_time, s.id LIMIT 1) "
+             "ORDER BY zone_name")
+SEARCH_SQL = ("SELECT f.rank, p.id, p.name, s.date, s.start_time FROM (SELECT rowid, rank FROM plays_fts "
+              "WHERE plays_fts MATCH ? ORDER BY rank LIMIT ?) f JOIN plays p ON p.id = f.rowid "
+              "LEFT JOIN showtimes s ON s.play_id = p.id AND s.date >= ?")
+LATEST_ORDER_SQL = "SELECT id FROM orders WHERE email = ? ORDER BY id DESC LIMIT 1"
+HISTORY_SQL = ("SELECT id, play_name, date, zone_name, ticket_count, seats, order_date FROM order_details "
+               "WHERE email = ? ORDER BY id DESC LIMIT ?")
+HISTORY_BEFORE_SQL = ("SELECT id, play_name, date, zone_name, ticket_count, seats, order_date FROM order_details "
+                      "WHERE email = ? AND id < ? ORDER BY id DESC LIMIT ?")
+
+
+def is_valid_email(email):
+    """Проверка валидности email."""
+    return EMAIL_REGEX.match(email or "") is not None
+
+
+def prepare_database(conn, catalog=None):
+    """Применяет миграции и, если передан кэш каталога, читает его изменения. В пустой базе (например,
+    у нового зала из venues.json) сначала создаются таблицы."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'zones'").fetchone():
+        addinfo.create_tables(conn)
+    migrations.migrate(conn)
+    return catalog.fetch_changes() if catalog is not None else None
+
+
+def list_dates(conn):
+    """Даты, на которые есть спектакли."""
+    return [row[0] for row in conn.execute(DATES_SQL)]
+
+
+def list_plays(conn, date):
+    """Спектакли на дату."""
+    # Спектаклей на одну дату немного: сортировать их здесь дешевле, чем обходить весь индекс названий
+    return sorted(row[0] for row in conn.execute(PLAYS_SQL, (date,)))
+
+
+def list_zones(conn, play_name, date):
+    """Зоны спектакля на дату с остатком билетов: [(зона, остаток)]."""
+    return conn.execute(ZONES_SQL, (play_name, date)).fetchall()
+
+
+def _search_query(text):
+    """Строка запроса FTS5: каждое слово ищется как префикс, все слова должны встретиться.
+    Слова берутся в кавычки, чтобы символы синтаксиса FTS5 во вводе не ломали запрос."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+def search_plays(conn, text, today=None, limit=SEARCH_LIMIT):
+    """Спектакли, в названии или описании которых есть слова, начинающиеся с введенных, по
+    релевантности: [(спектакль, [(дата, время начала)])] с ближайшими сеансами начиная с today."""
+    query = _search_query(text)
+    if not query:
+        return []
+
+    today = today or datetime.date.today().isoformat()
+    rows = conn.execute(SEARCH_SQL, (query, limit, today)).fetchall()
+    # Совпадений не больше limit, поэтому порядок проще навести здесь, чем сортировкой в запросе
+    rows.sort(key=lambda row: (row[0], row[1], row[3] or "", row[4] or ""))
+
+    results = {}
+    for _, _, play_name, date, start_time in rows:
+        showtimes = results.setdefault(play_name, [])
+        if date is not None and len(showtimes) < SEARCH_SHOWTIMES:
+            showtimes.append((date, start_time))
+    return list(results.items())
+
+
+def get_available_tickets(conn, play_name, date, zone_name):
+    """Остаток билетов в зоне или None, если такой зоны нет."""
+    return booking.get_available_tickets(conn, play_name, date, zone_name)
+
+
+def submit_order(write_queue, email, play_name, date, zone_name, ticket_count):
+    """Ставит заказ в очередь групповой фиксации (groupcommit.GroupCommitQueue).
+    Возвращает Future с тем же результатом, что у place_order."""
+    if not is_valid_email(email):
+        raise booking.BookingError("Пожалуйста, введите правильный адрес электронной почты!")
+
+    return write_queue.book_tickets(email, play_name, date, zone_name, ticket_count)
+
+
+def submit_hold(write_queue, email, play_name, date, zone_name, ticket_count, ttl=booking.HOLD_TTL):
+    """Ставит бронь в очередь групповой фиксации. Возвращает Future с тем же результатом, что у hold_order."""
+    if not is_valid_email(email):
+        raise booking.BookingError("Пожалуйста, введите правильный адрес электронной почты!")
+
+    return write_queue.hold_tickets(email, play_name, date, zone_name, ticket_count, ttl)
+
+
+def place_order(conn, email, play_name, date, zone_name, ticket_count, write_queue=None):
+    """Оформляет заказ (через очередь групповой фиксации, если она передана).
+    Возвращает (id заказа, новый остаток зоны, места или None)."""
+    if write_queue is not None:
+        return submit_order(write_queue, email, play_name, date, zone_name, ticket_count).result()
+
+    if not is_valid_email(email):
+        raise booking.BookingError("Пожалуйста, введите правильный адрес электронной почты!")
+
+    return booking.book_tickets(conn, email, play_name, date, zone_name, ticket_count)
+
+
+def hold_order(conn, email, play_name, date, zone_name, ticket_count, ttl=booking.HOLD_TTL, write_queue=None):
+    """Бронирует билеты на время оплаты. Возвращает (id брони, новый остаток зоны, места или None,
+    срок брони unix-время). Остаток сразу учитывает бронь."""
+    if write_queue is not None:
+        return submit_hold(write_queue, email, play_name, date, zone_name, ticket_count, ttl).result()
+
+    if not is_valid_email(email):
+        raise booking.BookingError("Пожалуйста, введите правильный адрес электронной почты!")
+
+    return booking.hold_tickets(conn, email, play_name, date, zone_name, ticket_count, ttl)
+
+
+def confirm_hold(conn, hold_id, write_queue=None):
+    """Оформляет заказ по брони. Возвращает (id заказа, места или None)."""
+    if write_queue is not None:
+        return write_queue.confirm_hold(hold_id).result()
+    return booking.confirm_hold(conn, hold_id)
+
+
+def release_hold(conn, hold_id):
+    """Отменяет бронь. Возвращает (спектакль, дата, зона, новый остаток) или None."""
+    return booking.release_hold(conn, hold_id)
+
+
+def cancel_order(conn, order_id):
+    """Отменяет заказ по id. Возвращает (спектакль, дата, зона, новый остаток) или None."""
+    return booking.cancel_order(conn, order_id)
+
+
+def cancel_orders(conn, order_ids=None, email=None, play_name=None, date=None, all_dates=False, all_plays=False):
+    """Отменяет заказы по id, по почте или весь сеанс одной транзакцией. Возвращает отчет о возвратах
+    (refunds.build_report)."""
+    return refunds.build_report(*booking.cancel_orders(conn, order_ids, email, play_name, date, all_dates,
+                                                       all_plays))
+
+
+def cancel_latest_order(conn, email):
+    """Отменяет последний заказ по почте. Возвращает (спектакль, дата, зона, новый остаток)
+    или None, если заказов нет."""
+    # Найдем последний заказ пользователя
+    order = conn.execute(LATEST_ORDER_SQL, (email,)).fetchone()
+
+    if not order:
+        return None
+
+    return booking.cancel_order(conn, order[0])
+
+
+def load_history_page(conn, email, before_id=None, limit=HISTORY_PAGE_SIZE):
+    """Страница истории заказов, от новых к старым. Пагинация по ключу: следующая страница
+    начинается с заказов, у которых id меньше последнего прочитанного, поэтому время
+    запроса не зависит от того, как далеко пролистана история. Заказы прошедших сеансов,
+    перенесенные в архив, подмешиваются по индексу архива."""
+    if before_id is None:
+        page = conn.execute(HISTORY_SQL, (email, limit)).fetchall()
+    else:
+        page = conn.execute(HISTORY_BEFORE_SQL, (email, before_id, limit)).fetchall()
+
+    archived = archive.load_orders(conn, email, before_id, limit)
+    if not archived:
+        return page
+    return sorted(page + archived, key=lambda row: row[0], reverse=True)[:limit]
@@ -0,0 +1,28 @@
+"""Сводная статистика задержек для бенчмарков и замеров."""
+
+
+def percentile(sorted_values, q):
+    """Перцентиль q (0..100) по заранее отсортированному списку, с линейной интерполяцией."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples_ms):
+    """Сводка по задержкам в миллисекундах: число, среднее, p50/p95/p99, максимум и операций в секунду."""
+    values = sorted(samples_ms)
+    if not values:
+        return {"count": 0}
+    total = sum(values)
+    return {
+        "count": len(values),
+        "mean_ms": total / len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1],
+        "ops_per_sec": len(values) / (total / 1000) if total else None,
+    }
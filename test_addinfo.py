@@ -0,0 +1,19 @@
+"""Импорт сезона: счетчики добавленных и пропущенных строк."""
+import addinfo
+
+
+def test_import_counts_real_changes(conn):
+    season = {
+        "plays": [("Чайка", "Комедия Чехова"), ("Гамлет", "Трагедия Шекспира о датском принце")],
+        "showtimes": [("Чайка", "2024-12-01", "19:00", 140), ("Нет такого", "2024-12-01", "19:00", 100)],
+        "zones": [
+            ("Чайка", "2024-12-01", "Партер", None, 5, 10),
+            ("Чайка", "2024-12-02", "Партер", 50),
+            # Уже существующая зона не меняется
+            ("Гамлет", "2024-11-20", "Балкон", 100),
+        ],
+    }
+    counts, skipped, _ = addinfo.import_season(conn, season)
+    assert counts == {"plays": 2, "showtimes": 1, "zones": 1}
+    assert skipped == {"plays": 0, "showtimes": 1, "zones": 2}
+    assert conn.execute("SELECT available_tickets FROM zone_details WHERE play_name = 'Чайка'").fetchall() == [(50,)]
@@ -0,0 +1,109 @@
+"""HTTP API: коды ответов на ошибки клиента, нехватку билетов и занятую базу."""
+import asyncio
+import json
+import sqlite3
+from urllib.parse import urlencode
+
+import api
+import service
+
+
+def _request(db_path, method, target, body=None, headers=None, **options):
+    """Поднимает API на свободном порту, отправляет один запрос и возвращает (код, JSON ответа).
+    options передаются в BookingApi."""
+    async def run():
+        pool = api.ConnectionPool(db_path, 2)
+        app = api.BookingApi(pool, **options)
+        server = await asyncio.start_server(lambda r, w: api._serve_client(app, r, w), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            data = body if isinstance(body, bytes) else json.dumps(body).encode() if body is not None else b""
+            head = {"Content-Length": str(len(data)), "Connection": "close", **(headers or {})}
+            writer.write(f"{method} {target} HTTP/1.1\r\n".encode()
+                         + "".join(f"{name}: {value}\r\n" for name, value in head.items()).encode()
+                         + b"\r\n" + data)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+            pool.close()
+        status_line, _, payload = response.partition(b"\r\n\r\n")
+        return int(status_line.split()[1]), json.loads(payload)
+
+    return asyncio.run(run())
+
+
+ORDER = {"email": "guest@example.com", "play_name": "Гамлет", "date": "2024-11-20", "zone_name": "Балкон",
+         "ticket_count": 2}
+
+
+def test_order_is_created(db_path):
+    status, payload = _request(db_path, "POST", "/orders", ORDER)
+    assert status == 201
+    assert payload["available_tickets"] == 28
+
+
+def test_malformed_order_is_bad_request(db_path):
+    assert _request(db_path, "POST", "/orders", b"{not json")[0] == 400
+    assert _request(db_path, "POST", "/orders", {"email": "guest@example.com"})[0] == 400
+    assert _request(db_path, "POST", "/orders", {**ORDER, "email": "not-an-email"})[0] == 400
+
+
+def test_missing_parameter_is_bad_request(db_path):
+    status, payload = _request(db_path, "GET", "/plays")
+    assert status == 400
+    assert "date" in payload["error"]
+
+
+def test_not_enough_tickets_is_conflict(db_path):
+    status, _ = _request(db_path, "POST", "/orders", {**ORDER, "ticket_count": 31})
+    assert status == 409
+    query = urlencode({"play": "Гамлет", "date": "2024-11-20", "zone": "Балкон"})
+    assert _request(db_path, "GET", f"/availability?{query}")[1] == {"available_tickets": 30}
+
+
+def test_cancelling_a_whole_day_needs_all_plays(db_path):
+    assert _request(db_path, "POST", "/cancellations", {"date": "2024-11-20"})[0] == 400
+    status, report = _request(db_path, "POST", "/cancellations", {"date": "2024-11-20", "all_plays": True})
+    assert status == 200
+    assert report["tickets"] == 5
+
+
+def test_locked_database_is_service_unavailable(db_path, monkeypatch):
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(service, "place_order", locked)
+    status, _ = _request(db_path, "POST", "/orders", ORDER)
+    assert status == 503
+
+
+def test_unknown_path_and_method(db_path):
+    assert _request(db_path, "GET", "/nowhere")[0] == 404
+    assert _request(db_path, "PUT", "/orders")[0] == 405
+
+
+def test_hold_is_confirmed(db_path):
+    status, hold = _request(db_path, "POST", "/holds", ORDER)
+    assert status == 201
+    status, order = _request(db_path, "POST", f"/holds/{hold['hold_id']}/confirm")
+    assert status == 201
+    assert order["order_id"] > 0
+
+
+def test_expired_hold_is_gone(db_path):
+    status, hold = _request(db_path, "POST", "/holds", ORDER, hold_ttl=0)
+    assert status == 201
+    assert _request(db_path, "POST", f"/holds/{hold['hold_id']}/confirm")[0] == 410
+    assert _request(db_path, "POST", "/holds/999/confirm")[0] == 410
+    assert _request(db_path, "DELETE", "/holds/999")[0] == 404
+
+
+def test_malformed_numbers_are_bad_request(db_path):
+    assert _request(db_path, "GET", "/orders?email=guest@example.com&before_id=abc")[0] == 400
+    assert _request(db_path, "GET", "/orders?email=guest@example.com&before_id=5")[0] == 200
+    assert _request(db_path, "POST", "/orders", headers={"Content-Length": "abc"})[0] == 400
+    assert _request(db_path, "POST", "/orders", headers={"Content-Length": "-1"})[0] == 400
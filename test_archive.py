@@ -0,0 +1,70 @@
+"""Перенос прошедших сеансов в сжатый архив и история заказов из него."""
+import archive
+import booking
+import service
+
+
+def _daily_sales(conn):
+    return conn.execute("SELECT SUM(orders), SUM(tickets) FROM daily_sales").fetchone()
+
+
+def test_archive_round_trip(conn):
+    booking.book_tickets(conn, "example@example.com", "Гамлет", "2024-11-23", "Балкон", 1)
+    history = service.load_history_page(conn, "example@example.com")
+    sales = _daily_sales(conn)
+    assert len(history) == 2
+
+    assert archive.archive_before(conn, "2024-11-22") == {"2024-11": (4, 2)}
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 1
+    assert service.load_history_page(conn, "example@example.com") == history
+    assert service.load_history_page(conn, "user@domain.com")[0][1:5] == ("Ромео и Джульетта", "2024-11-20",
+                                                                          "Балкон", 3)
+    assert _daily_sales(conn) == sales
+    assert [month[:2] for month in archive.list_months(conn)] == [("2024-11", 2)]
+
+    # Повторный запуск с той же отсечкой ничего не переносит
+    assert archive.archive_before(conn, "2024-11-22") == {}
+    # Более поздняя отсечка дописывает тот же месяц
+    assert archive.archive_before(conn, "2024-11-24") == {"2024-11": (4, 1)}
+    assert service.load_history_page(conn, "example@example.com") == history
+    assert [month[:2] for month in archive.list_months(conn)] == [("2024-11", 3)]
+    assert _daily_sales(conn) == sales
+
+
+def test_order_cancelled_after_copy_is_not_archived(conn, db_path, monkeypatch):
+    order_id = booking.book_tickets(conn, "late@example.com", "Гамлет", "2024-11-20", "Балкон", 2)[0]
+    archive_month = archive._archive_month
+
+    def cancel_then_archive(*args):
+        # Заказ отменяют с другого соединения, когда месяц уже скопирован, но еще не сжат и не удален
+        other = booking.connect(db_path)
+        try:
+            booking.cancel_order(other, order_id)
+        finally:
+            other.close()
+        return archive_month(*args)
+
+    monkeypatch.setattr(archive, "_archive_month", cancel_then_archive)
+    assert archive.archive_before(conn, "2024-11-22") == {"2024-11": (4, 2)}
+    assert service.load_history_page(conn, "late@example.com") == []
+    assert conn.execute("SELECT email, orders FROM archive_index ORDER BY email").fetchall() == [
+        ("example@example.com", 1), ("user@domain.com", 1)]
+    month_conn = archive._open_month(archive.archive_dir(conn), "2024-11")
+    try:
+        assert month_conn.execute("SELECT id FROM orders ORDER BY id").fetchall() == [(1,), (2,)]
+        assert month_conn.execute("SELECT available_tickets, sold_orders FROM zones z JOIN showtimes s "
+                                  "ON s.id = z.showtime_id WHERE s.date = '2024-11-20' AND z.zone_name = 'Балкон' "
+                                  "AND s.play_name = 'Гамлет'").fetchone() == (30, 0)
+    finally:
+        month_conn.close()
+
+
+def test_history_pages_through_archive(conn):
+    for _ in range(3):
+        booking.book_tickets(conn, "example@example.com", "Гамлет", "2024-11-20", "Балкон", 1)
+    archive.archive_before(conn, "2024-11-21")
+    first = service.load_history_page(conn, "example@example.com", limit=2)
+    rest = service.load_history_page(conn, "example@example.com", before_id=first[-1][0], limit=2)
+    ids = [row[0] for row in first + rest]
+    assert len(ids) == 4
+    assert ids == sorted(ids, reverse=True)
@@ -0,0 +1,58 @@
+"""Резервные копии: проверенный снимок, выбор по времени и восстановление."""
+import datetime
+import sqlite3
+
+import pytest
+
+import backup
+import booking
+
+
+def _orders(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshot_is_checked_and_standalone(db_path):
+    snapshot, stats = backup.create_backup(db_path)
+    assert backup.check_snapshot(snapshot) == []
+    assert stats["pages"] > 0
+    assert _orders(snapshot) == 2
+    conn = sqlite3.connect(snapshot)
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    finally:
+        conn.close()
+    assert backup.list_snapshots(db_path) == [(backup.list_snapshots(db_path)[0][0], snapshot)]
+
+
+def test_damaged_snapshot_is_reported(tmp_path):
+    path = tmp_path / "broken.db"
+    path.write_bytes(b"SQLite format 3\x00" + b"\xff" * 4000)
+    assert backup.check_snapshot(str(path)) != []
+
+
+def test_restore_brings_back_snapshot_and_keeps_current_state(db_path, conn):
+    snapshot, _ = backup.create_backup(db_path)
+    booking.book_tickets(conn, "guest@example.com", "Гамлет", "2024-11-23", "Балкон", 2)
+    current = backup.restore(snapshot, db_path)
+    assert _orders(db_path) == 2
+    assert booking.get_available_tickets(conn, "Гамлет", "2024-11-23", "Балкон") == 35
+    # Состояние до восстановления сохранено отдельным снимком
+    assert _orders(current) == 3
+
+
+def test_find_snapshot_by_time_and_pruning(db_path):
+    first, _ = backup.create_backup(db_path)
+    second, _ = backup.create_backup(db_path)
+    (first_at, _), (second_at, _) = backup.list_snapshots(db_path)
+    assert backup.find_snapshot(db_path) == second
+    assert backup.find_snapshot(db_path, first_at) == first
+    with pytest.raises(booking.BookingError):
+        backup.find_snapshot(db_path, first_at - datetime.timedelta(seconds=1))
+
+    third, _ = backup.create_backup(db_path, keep=2)
+    assert [path for _, path in backup.list_snapshots(db_path)] == [second, third]
@@ -0,0 +1,20 @@
+"""Транзакции записи бронирования."""
+import pytest
+
+import booking
+
+SHOW = ("Гамлет", "2024-11-20", "Балкон")
+
+
+def test_open_transaction_is_not_committed(conn):
+    # Неявная транзакция вызывающего с незавершенным изменением
+    conn.execute("UPDATE plays SET description = 'черновик' WHERE name = 'Гамлет'")
+    assert conn.in_transaction
+    with pytest.raises(RuntimeError):
+        booking.book_tickets(conn, "guest@example.com", *SHOW, 1)
+    conn.rollback()
+    assert conn.execute("SELECT description FROM plays WHERE name = 'Гамлет'").fetchone()[0] != "черновик"
+    assert booking.get_available_tickets(conn, *SHOW) == 30
+
+    # Без открытой транзакции заказ проходит как обычно
+    assert booking.book_tickets(conn, "guest@example.com", *SHOW, 1)[1] == 29
@@ -0,0 +1,28 @@
+"""Кэш каталога и его обновление по изменениям в базе."""
+import booking
+from catalog import CatalogCache
+
+
+def test_catalog_follows_changes(db_path, conn):
+    cache = CatalogCache(db_path)
+    cache.reload()
+    assert cache.get_available_tickets("Гамлет", "2024-11-20", "Балкон") == 30
+    fingerprint = cache.fingerprint
+    assert not cache.refresh()
+
+    # Продажа меняет только остатки
+    booking.book_tickets(conn, "guest@example.com", "Гамлет", "2024-11-20", "Балкон", 2)
+    assert cache.refresh()
+    assert cache.get_available_tickets("Гамлет", "2024-11-20", "Балкон") == 28
+    assert cache.fingerprint == fingerprint
+
+    # Правка описания и времени начала, без новых строк, тоже видна кэшу
+    with conn:
+        conn.execute("UPDATE plays SET description = 'Новое описание' WHERE name = 'Гамлет'")
+        conn.execute("UPDATE showtimes SET start_time = '20:30' WHERE date = '2024-11-20' "
+                     "AND play_id = (SELECT id FROM plays WHERE name = 'Гамлет')")
+    assert cache.refresh()
+    assert cache.fingerprint != fingerprint
+    assert cache.get_description("Гамлет") == "Новое описание"
+    assert cache.get_showtime("Гамлет", "2024-11-20")[0] == "20:30"
+    cache.conn.close()
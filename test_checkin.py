@@ -0,0 +1,149 @@
+"""Подписанные коды билетов и проверка на входе."""
+import os
+
+import pytest
+
+import booking
+import checkin
+
+DATE = "2024-11-20"
+
+
+@pytest.fixture(autouse=True)
+def key_files_only(monkeypatch):
+    monkeypatch.delenv(checkin.KEY_ENV, raising=False)
+
+
+def test_sign_and_verify():
+    key = os.urandom(32)
+    code = checkin.sign(key, 1234)
+    assert code.startswith("1234-")
+    assert checkin.verify(key, code) == 1234
+    assert checkin.verify(os.urandom(32), code) is None
+    assert checkin.verify(key, code.replace("1234-", "1235-")) is None
+    assert checkin.verify(key, code[:-1] + ("A" if code[-1] != "A" else "B")) is None
+    assert checkin.verify(key, "not a code") is None
+    # Не ASCII-цифры в номере заказа — неверный код, а не исключение
+    assert checkin.verify(key, "1²-" + code.partition("-")[2]) is None
+    assert checkin.verify(key, "١٢٣٤-" + code.partition("-")[2]) is None
+
+
+def test_key_file_is_created_once_per_hall(db_path, tmp_path):
+    key = checkin.ticket_key(db_path)
+    assert os.path.exists(os.path.splitext(db_path)[0] + checkin.KEY_SUFFIX)
+    checkin._keys.clear()
+    assert checkin.ticket_key(db_path) == key
+    assert checkin.ticket_key(str(tmp_path / "small-hall.db")) != key
+
+
+def test_existing_key_file_is_kept(tmp_path):
+    key_path = str(tmp_path / f"hall{checkin.KEY_SUFFIX}")
+    checkin._create_key_file(key_path)
+    with open(key_path) as f:
+        first = f.read()
+    # Второй процесс, создающий ключ одновременно, не заменяет уже появившийся
+    checkin._create_key_file(key_path)
+    with open(key_path) as f:
+        assert f.read() == first
+    assert len(bytes.fromhex(first)) == 32
+    assert os.listdir(tmp_path) == [os.path.basename(key_path)]
+
+
+def test_key_file_without_hard_links(tmp_path, monkeypatch):
+    def no_links(source, target):
+        raise PermissionError(1, "Operation not permitted")
+
+    # На FAT и части сетевых папок os.link недоступен
+    monkeypatch.setattr(os, "link", no_links)
+    db_path = str(tmp_path / "fat.db")
+    key = checkin.ticket_key(db_path)
+    assert len(key) == 32
+    checkin._keys.clear()
+    assert checkin.ticket_key(db_path) == key
+    assert os.listdir(tmp_path) == [f"fat{checkin.KEY_SUFFIX}"]
+
+
+def test_short_key_is_refused(db_path, tmp_path, monkeypatch):
+    key_path = str(tmp_path / f"short{checkin.KEY_SUFFIX}")
+    with open(key_path, "w") as f:
+        f.write("00")
+    with pytest.raises(ValueError):
+        checkin.ticket_key(str(tmp_path / "short.db"))
+    monkeypatch.setenv(checkin.KEY_ENV, "short")
+    with pytest.raises(ValueError):
+        checkin.ticket_key(db_path)
+
+
+def test_shared_secret_gives_each_hall_its_own_key(tmp_path, monkeypatch):
+    monkeypatch.setenv(checkin.KEY_ENV, "a shared secret for every hall")
+    main_hall = checkin.ticket_key(str(tmp_path / "main.db"))
+    assert main_hall == checkin.ticket_key(str(tmp_path / "main.db"))
+    assert main_hall != checkin.ticket_key(str(tmp_path / "small.db"))
+    assert not os.path.exists(tmp_path / f"main{checkin.KEY_SUFFIX}")
+
+
+def _desk(db_path, door=""):
+    return checkin.CheckInDesk(db_path, DATE, door).load()
+
+
+def test_scan_results(db_path, conn):
+    later_show, _, _ = booking.book_tickets(conn, "guest@example.com", "Гамлет", "2024-11-23", "Балкон", 1)
+    desk = _desk(db_path)
+    try:
+        first = checkin.ticket_code(db_path, 1)
+        assert desk.scan(first)[0] == checkin.ADMITTED
+        assert desk.scan(first.lower() + "\n")[0] == checkin.ALREADY_USED
+        assert desk.scan(checkin.sign(os.urandom(32), 2))[0] == checkin.FORGED
+        assert desk.scan(checkin.ticket_code(db_path, later_show))[0] == checkin.WRONG_DATE
+        assert desk.scan(checkin.ticket_code(db_path, 10 ** 6)) == (checkin.UNKNOWN, None)
+
+        # Билет, купленный после загрузки списка, находится в базе
+        late, _, _ = booking.book_tickets(conn, "guest@example.com", "Гамлет", DATE, "Балкон", 1)
+        result, ticket = desk.scan(checkin.ticket_code(db_path, late))
+        assert result == checkin.ADMITTED
+        assert ticket[0] == late
+    finally:
+        desk.stop()
+
+
+def test_cancelled_order_is_not_admitted(db_path, conn):
+    desk = _desk(db_path)
+    try:
+        code = checkin.ticket_code(db_path, 1)
+        assert code in desk.tickets
+        # Заказ отменили уже после загрузки списка вечера
+        booking.cancel_order(conn, 1)
+        assert desk.scan(code) == (checkin.UNKNOWN, None)
+        assert code not in desk.tickets
+        assert desk.scan(checkin.ticket_code(db_path, 2))[0] == checkin.ADMITTED
+    finally:
+        desk.stop()
+
+
+def test_checkins_are_shared_between_doors(db_path, conn):
+    main_door = _desk(db_path, "Главный вход")
+    try:
+        assert main_door.scan(checkin.ticket_code(db_path, 1))[0] == checkin.ADMITTED
+        main_door.flush(main_door.conn)
+    finally:
+        main_door.stop()
+    assert conn.execute("SELECT order_id, door FROM checkins").fetchall() == [(1, "Главный вход")]
+
+    side_door = _desk(db_path, "Служебный вход")
+    try:
+        assert side_door.scan(checkin.ticket_code(db_path, 1))[0] == checkin.ALREADY_USED
+        assert side_door.scan(checkin.ticket_code(db_path, 2))[0] == checkin.ADMITTED
+        side_door.flush(side_door.conn)
+    finally:
+        side_door.stop()
+
+    # Отмена заказа удаляет и отметку о проходе
+    booking.cancel_order(conn, 1)
+    assert conn.execute("SELECT order_id FROM checkins").fetchall() == [(2,)]
+
+
+def test_background_thread_writes_on_stop(db_path, conn):
+    desk = _desk(db_path).start()
+    assert desk.scan(checkin.ticket_code(db_path, 2))[0] == checkin.ADMITTED
+    desk.stop()
+    assert conn.execute("SELECT order_id FROM checkins").fetchall() == [(2,)]
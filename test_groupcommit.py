@@ -0,0 +1,88 @@
+"""Очередь групповой фиксации: пачка в одной транзакции, ошибка одного запроса не задевает остальных."""
+import pytest
+
+import booking
+import groupcommit
+
+SHOW = ("Гамлет", "2024-11-20", "Балкон")
+
+
+def test_failed_request_does_not_roll_back_the_batch(db_path, conn):
+    queue = groupcommit.GroupCommitQueue(db_path)
+    # Запросы ставятся до запуска потока, поэтому попадают в одну пачку
+    first = queue.book_tickets("a@example.com", *SHOW, 10)
+    too_many = queue.book_tickets("b@example.com", *SHOW, 25)
+    second = queue.book_tickets("c@example.com", *SHOW, 20)
+    queue.start()
+    try:
+        assert first.result(5)[1] == 20
+        with pytest.raises(booking.NotEnoughTicketsError):
+            too_many.result(5)
+        assert second.result(5)[1] == 0
+    finally:
+        queue.stop()
+
+    assert booking.get_available_tickets(conn, *SHOW) == 0
+    emails = [row[0] for row in conn.execute("SELECT email FROM orders WHERE email LIKE '%@example.com' "
+                                             "AND email != 'example@example.com' ORDER BY id")]
+    assert emails == ["a@example.com", "c@example.com"]
+
+
+def test_unexpected_error_fails_only_its_request(db_path, conn):
+    def broken(conn):
+        conn.execute("INSERT INTO checkins (order_id, checked_in_at) VALUES (1, 0)")
+        raise KeyError("сбой в самой операции")
+
+    queue = groupcommit.GroupCommitQueue(db_path)
+    first = queue.book_tickets("a@example.com", *SHOW, 1)
+    failed = queue.submit(broken)
+    second = queue.book_tickets("b@example.com", *SHOW, 1)
+    queue.start()
+    try:
+        assert first.result(5)[1] == 29
+        with pytest.raises(KeyError):
+            failed.result(5)
+        assert second.result(5)[1] == 28
+    finally:
+        queue.stop()
+    # Запись упавшего запроса откатилась до его точки сохранения
+    assert conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0] == 0
+
+
+def test_hold_and_confirm_through_queue(db_path, conn):
+    queue = groupcommit.GroupCommitQueue(db_path).start()
+    try:
+        hold_id, available, _, _ = queue.hold_tickets("a@example.com", *SHOW, 2).result(5)
+        assert available == 28
+        order_id, _ = queue.confirm_hold(hold_id).result(5)
+        with pytest.raises(booking.HoldExpiredError):
+            queue.confirm_hold(hold_id).result(5)
+    finally:
+        queue.stop()
+    assert conn.execute("SELECT email FROM orders WHERE id = ?", (order_id,)).fetchone() == ("a@example.com",)
+
+
+def test_stop_commits_accepted_requests(db_path, conn):
+    queue = groupcommit.GroupCommitQueue(db_path).start()
+    futures = [queue.book_tickets("a@example.com", *SHOW, 1) for _ in range(5)]
+    queue.stop()
+    assert all(future.done() for future in futures)
+    assert booking.get_available_tickets(conn, *SHOW) == 25
+
+
+def test_no_requests_after_stop(db_path, conn):
+    # Поток так и не запустили: принятый запрос выполнить некому
+    queue = groupcommit.GroupCommitQueue(db_path)
+    pending = queue.book_tickets("a@example.com", *SHOW, 1)
+    queue.stop()
+    with pytest.raises(RuntimeError):
+        pending.result(5)
+    with pytest.raises(RuntimeError):
+        queue.book_tickets("a@example.com", *SHOW, 1)
+    assert booking.get_available_tickets(conn, *SHOW) == 30
+
+
+def test_non_positive_count_is_refused(db_path):
+    queue = groupcommit.GroupCommitQueue(db_path)
+    with pytest.raises(booking.BookingError):
+        queue.book_tickets("a@example.com", *SHOW, 0)
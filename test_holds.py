@@ -0,0 +1,57 @@
+"""Брони с ограниченным сроком и их снятие планировщиком."""
+import time
+
+import pytest
+
+import booking
+import holds
+
+SHOW = ("Гамлет", "2024-11-20", "Балкон")
+
+
+def test_hold_takes_tickets_until_confirmed(conn):
+    hold_id, available, seats, expires_at = booking.hold_tickets(conn, "guest@example.com", *SHOW, 3)
+    assert available == 27
+    assert seats is None
+    assert expires_at > time.time()
+    order_id, _ = booking.confirm_hold(conn, hold_id)
+    assert order_id > 0
+    assert booking.get_available_tickets(conn, *SHOW) == 27
+    # Подтвержденная бронь второй раз не подтверждается
+    with pytest.raises(booking.HoldExpiredError):
+        booking.confirm_hold(conn, hold_id)
+
+
+def test_released_hold_returns_tickets(conn):
+    hold_id, _, _, _ = booking.hold_tickets(conn, "guest@example.com", *SHOW, 3)
+    assert booking.release_hold(conn, hold_id) == (*SHOW, 30)
+    assert booking.release_hold(conn, hold_id) is None
+
+
+def test_expired_hold_is_not_confirmed(conn):
+    hold_id, _, _, _ = booking.hold_tickets(conn, "guest@example.com", *SHOW, 3, ttl=0)
+    with pytest.raises(booking.HoldExpiredError):
+        booking.confirm_hold(conn, hold_id)
+
+
+def test_release_expired_holds_only_takes_due_ones(conn):
+    for ttl in (10, 20, 1000):
+        booking.hold_tickets(conn, "guest@example.com", *SHOW, 2, ttl=ttl)
+    count, zones = booking.release_expired_holds(conn, time.time() + 30)
+    assert count == 2
+    # Одна зона — одно обновление с итоговым остатком
+    assert zones == [(*SHOW, 28)]
+    assert booking.release_expired_holds(conn, time.time() + 30)[0] == 0
+
+
+def test_scheduler_releases_expired_hold(db_path, conn):
+    scheduler = holds.HoldScheduler(db_path).start()
+    try:
+        hold_id, _, _, expires_at = booking.hold_tickets(conn, "guest@example.com", *SHOW, 4, ttl=0.2)
+        scheduler.add(hold_id, expires_at)
+        deadline = time.time() + 5
+        while booking.get_available_tickets(conn, *SHOW) != 30 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        scheduler.stop()
+    assert booking.get_available_tickets(conn, *SHOW) == 30
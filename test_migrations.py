@@ -0,0 +1,36 @@
+"""Миграции схемы и планы горячих запросов на свежей базе и на базе с заказами."""
+import bench
+import booking
+import migrations
+
+
+def test_migrations_bring_schema_to_latest_version(conn):
+    assert migrations.schema_version(conn) == migrations.MIGRATIONS[-1][0]
+    # Повторный запуск ничего не меняет
+    migrations.migrate(conn)
+    assert migrations.schema_version(conn) == migrations.MIGRATIONS[-1][0]
+
+
+def test_hot_queries_use_indexes_on_new_database(conn):
+    assert migrations.check_query_plans(conn) == {}
+
+
+def test_hot_queries_use_indexes_with_orders(tmp_path):
+    path = str(tmp_path / "bench.db")
+    bench.generate_database(path, plays=20, showtimes=200, orders=5000)
+    conn = booking.connect(path)
+    try:
+        migrations.migrate(conn)
+        assert migrations.check_query_plans(conn) == {}
+    finally:
+        conn.close()
+
+
+def test_full_scans_are_reported(conn):
+    problems = migrations.check_query_plans(conn, {
+        "table_scan": ("SELECT id FROM orders WHERE ticket_count = ?", (1,)),
+        "index_scan": ("SELECT name FROM plays ORDER BY name", ()),
+        "sort": ("SELECT id FROM orders WHERE email = ? ORDER BY ticket_count", ("",)),
+        "lookup": ("SELECT id FROM orders WHERE email = ?", ("",)),
+    })
+    assert set(problems) == {"table_scan", "index_scan", "sort"}
@@ -0,0 +1,70 @@
+"""Массовая отмена заказов и отчет о возвратах."""
+import csv
+
+import pytest
+
+import booking
+import refunds
+
+
+def _book(conn, email, play_name, date, zone_name, ticket_count):
+    return booking.book_tickets(conn, email, play_name, date, zone_name, ticket_count)[0]
+
+
+def test_cancel_showtime_returns_tickets_and_reports_customers(conn):
+    _book(conn, "a@example.com", "Гамлет", "2024-11-23", "Балкон", 2)
+    _book(conn, "b@example.com", "Гамлет", "2024-11-23", "Балкон", 3)
+    _book(conn, "a@example.com", "Гамлет", "2024-11-23", "Партер", 4)
+    other = _book(conn, "a@example.com", "Макбет", "2024-11-24", "Балкон", 1)
+
+    report = refunds.build_report(*booking.cancel_orders(conn, play_name="Гамлет", date="2024-11-23"))
+    assert report["tickets"] == 9
+    assert report["customers"] == [{"email": "a@example.com", "orders": 2, "tickets": 6},
+                                   {"email": "b@example.com", "orders": 1, "tickets": 3}]
+    assert sorted((zone["zone_name"], zone["available_tickets"]) for zone in report["zones"]) == \
+        [("Балкон", 35), ("Партер", 55)]
+    # Заказ другого спектакля не тронут
+    assert booking.cancel_orders(conn, order_ids=[other])[0][0][0] == other
+
+
+def test_cancel_by_ids_ignores_unknown(conn):
+    first = _book(conn, "a@example.com", "Гамлет", "2024-11-23", "Балкон", 2)
+    orders, zones = booking.cancel_orders(conn, order_ids=[first, 10 ** 9])
+    assert [order[0] for order in orders] == [first]
+    assert zones == [("Гамлет", "2024-11-23", "Балкон", 35)]
+    assert booking.cancel_orders(conn, order_ids=[first]) == ([], [])
+
+
+def test_cancel_without_conditions_is_refused(conn):
+    with pytest.raises(booking.BookingError):
+        booking.cancel_orders(conn)
+
+
+def test_report_csv(conn, tmp_path):
+    _book(conn, "a@example.com", "Гамлет", "2024-11-23", "Балкон", 2)
+    report = refunds.build_report(*booking.cancel_orders(conn, email="a@example.com"))
+    path = tmp_path / "refunds.csv"
+    refunds.write_csv(report, path)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["email"] for row in rows] == ["a@example.com"]
+    assert rows[0]["ticket_count"] == "2"
+
+
+def test_play_without_date_needs_all_dates(conn):
+    _book(conn, "a@example.com", "Гамлет", "2024-11-23", "Балкон", 2)
+    with pytest.raises(booking.BookingError):
+        booking.cancel_orders(conn, play_name="Гамлет")
+    assert booking.get_available_tickets(conn, "Гамлет", "2024-11-23", "Балкон") == 33
+    orders, _ = booking.cancel_orders(conn, play_name="Гамлет", all_dates=True)
+    # Заказы на оба показа «Гамлета», включая тестовый заказ на 2024-11-20
+    assert sorted(order[3] for order in orders) == ["2024-11-20", "2024-11-23"]
+
+
+def test_date_without_play_needs_all_plays(conn):
+    with pytest.raises(booking.BookingError):
+        booking.cancel_orders(conn, date="2024-11-20")
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 2
+    orders, _ = booking.cancel_orders(conn, date="2024-11-20", all_plays=True)
+    # Оба тестовых заказа — на разные спектакли 2024-11-20
+    assert sorted(order[2] for order in orders) == ["Гамлет", "Ромео и Джульетта"]
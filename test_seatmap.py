@@ -0,0 +1,61 @@
+"""Карта мест битовой маской и выбор мест рядом."""
+import pytest
+
+import booking
+import seatmap
+
+
+def test_seats_round_trip_through_text():
+    assert seatmap.encode_seats(2, 4, 4) == "3:5-8"
+    assert seatmap.decode_seats("3:5-8") == (2, 4, 4)
+    assert seatmap.format_seats("3:5-8") == "ряд 3, места 5–8"
+    assert seatmap.format_seats("1:2-2") == "ряд 1, место 2"
+    assert seatmap.format_seats(None) == ""
+
+
+def test_set_seats_marks_bits():
+    seat_map = seatmap.empty_map(3, 5)
+    assert len(seat_map) == 2
+    taken = seatmap.set_seats(seat_map, 5, 1, 2, 3)
+    assert seatmap.free_count(taken, 3, 5) == 12
+    # Первое место второго ряда — бит 5, занятые места 2–4 — биты 7–9
+    assert int.from_bytes(taken, "little") == 0b1110000000
+    assert seatmap.set_seats(taken, 5, 1, 2, 3, taken=False) == seat_map
+
+
+def test_best_row_and_centered_block():
+    # Лучший ряд — треть зала от сцены, в нем блок ближе к центру
+    assert seatmap.row_order(6) == [2, 1, 3, 0, 4, 5]
+    assert seatmap.find_adjacent(seatmap.empty_map(6, 10), 6, 10, 4) == (2, 3)
+
+
+def test_taken_seats_are_skipped():
+    seat_map = seatmap.set_seats(seatmap.empty_map(6, 10), 10, 2, 2, 6)
+    # В лучшем ряду свободны только места 0–1 и 8–9: четыре рядом ищем в следующем ряду
+    assert seatmap.find_adjacent(seat_map, 6, 10, 4) == (1, 3)
+    assert seatmap.find_adjacent(seat_map, 6, 10, 2) == (2, 0)
+
+
+def test_no_block_fits():
+    seat_map = seatmap.empty_map(2, 4)
+    for row in range(2):
+        seat_map = seatmap.set_seats(seat_map, 4, row, 1, 1)
+    assert seatmap.find_adjacent(seat_map, 2, 4, 3) is None
+    assert seatmap.find_adjacent(seat_map, 2, 4, 5) is None
+    assert seatmap.find_adjacent(seat_map, 2, 4, 0) is None
+
+
+def test_booking_assigns_and_cancel_frees_seats(conn):
+    order_id, available, seats = booking.book_tickets(conn, "guest@example.com", "Гамлет", "2024-11-23",
+                                                      "Партер", 3)
+    assert available == 52
+    assert seats == "2:5-7"
+    booking.cancel_order(conn, order_id)
+    # Освобожденные места снова лучшие
+    assert booking.book_tickets(conn, "guest@example.com", "Гамлет", "2024-11-23", "Партер", 3)[1:] == (52, "2:5-7")
+
+
+def test_no_adjacent_seats_rolls_back(conn):
+    with pytest.raises(booking.NoAdjacentSeatsError):
+        booking.book_tickets(conn, "guest@example.com", "Гамлет", "2024-11-23", "Партер", 12)
+    assert booking.get_available_tickets(conn, "Гамлет", "2024-11-23", "Партер") == 55
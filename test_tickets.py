@@ -0,0 +1,35 @@
+"""Печать билетов с кодом для проверки на входе."""
+import os
+
+import booking
+import checkin
+import tickets
+
+
+def test_tickets_with_codes(db_path, conn, tmp_path, monkeypatch):
+    monkeypatch.delenv(checkin.KEY_ENV, raising=False)
+    orders = tickets.load_orders(conn, "2024-11-20")
+    assert [order[0] for order in orders] == [1, 2]
+    path = str(tmp_path / "tickets.pdf")
+    assert tickets.render_combined(path, orders, checkin.ticket_key(db_path)) == 2
+    with open(path, "rb") as f:
+        pdf = f.read()
+    assert pdf.startswith(b"%PDF")
+    assert b"/Count 2" in pdf
+
+
+def test_single_ticket_is_signed_in_the_task(db_path, tmp_path, monkeypatch):
+    monkeypatch.delenv(checkin.KEY_ENV, raising=False)
+    path = str(tmp_path / "ticket_1.pdf")
+    assert tickets.render_order_ticket(path, db_path, 1, "example@example.com", "Гамлет", "2024-11-20", "Партер",
+                                       2, "3:5-6") == path
+    with open(path, "rb") as f:
+        assert f.read().startswith(b"%PDF")
+    # Ключ зала создан при печати
+    assert os.path.exists(os.path.splitext(db_path)[0] + checkin.KEY_SUFFIX)
+
+
+def test_orders_for_one_play(conn):
+    booking.book_tickets(conn, "guest@example.com", "Гамлет", "2024-11-23", "Балкон", 1)
+    orders = tickets.load_orders(conn, "2024-11-20", "2024-11-23", "Гамлет")
+    assert [(order[2], order[3]) for order in orders] == [("Гамлет", "2024-11-20"), ("Гамлет", "2024-11-23")]
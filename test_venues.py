@@ -0,0 +1,32 @@
+"""Залы в отдельных базах и чтения по всем залам через ATTACH."""
+import addinfo
+import booking
+import migrations
+import venues
+
+
+def test_halls_are_prepared_before_attach(db_path, tmp_path, monkeypatch):
+    # База зала со схемой до нормализации: в ней еще нет order_details
+    old_hall = str(tmp_path / "old_hall.db")
+    new_hall = str(tmp_path / "new_hall.db")
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:5])
+        conn = booking.connect(old_hall)
+        addinfo.create_tables(conn)
+        conn.close()
+
+    router = venues.VenueRouter({"Большой зал": db_path, "Старый зал": old_hall, "Новый зал": new_hall})
+    conn = router.connect()
+    try:
+        assert router.list_dates(conn)[0] == ("2024-11-20", ["Большой зал"])
+        history = router.load_history_page(conn, "example@example.com")
+        assert [(row[0], row[7]) for row in history] == [(1, "Большой зал")]
+    finally:
+        conn.close()
+
+    for path in (old_hall, new_hall):
+        hall = booking.connect(path)
+        try:
+            assert migrations.schema_version(hall) == migrations.MIGRATIONS[-1][0]
+        finally:
+            hall.close()
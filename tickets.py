@@ -0,0 +1,215 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import booking
+import checkin
+import seatmap
+
+FONT_NAME = "DejaVuSans"
+FONT_SIZE = 12
+# Шрифт лежит рядом с программой (в сборке PyInstaller — во временной папке распаковки)
+FONT_PATH = os.path.join(getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__))), "DejaVuSans.ttf")
+
+# Имя шаблона страницы (XObject), общего для всех билетов одного документа
+TEMPLATE_NAME = "ticket"
+
+# Подписи полей билета: (y, подпись). Значение печатается сразу после подписи
+LABELS = [
+    (750, "Билет на спектакль: "),
+    (730, "Дата: "),
+    (710, "Зона: "),
+    (690, "Количество билетов: "),
+    (670, "Email покупателя: "),
+]
+LEFT = 100
+# Строка с назначенными местами печатается только для зон с местами
+SEATS_Y = 650
+THANKS_Y = 630
+# Код билета для проверки на входе (checkin.py): строкой под благодарностью и QR-кодом справа
+CODE_Y = 610
+QR_X = 440
+QR_Y = 640
+QR_SIZE = 120
+# Пустая рамка вокруг QR-кода в модулях (по стандарту не меньше 4)
+QR_BORDER = 4
+
+# Сколько билетов отдавать одному процессу за раз
+CHUNK_SIZE = 50
+
+ORDER_COLUMNS = "id, email, play_name, date, zone_name, ticket_count, seats"
+
+
+# ReportLab импортируется при первой печати (_load_reportlab): окну кассы он нужен только после покупки,
+# а его импорт заметно удлиняет запуск
+canvas = pdfmetrics = TTFont = letter = qrencoder = None
+
+
+def _load_reportlab():
+    global canvas, pdfmetrics, TTFont, letter, qrencoder
+    if canvas is None:
+        from reportlab.graphics.barcode import qrencoder
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.pdfgen import canvas
+
+
+def register_font():
+    """Загружает ReportLab и регистрирует шрифт один раз на процесс."""
+    _load_reportlab()
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def _define_template(c):
+    """Рисует статичную часть билета один раз на документ; страницы ссылаются на нее через doForm."""
+    c.beginForm(TEMPLATE_NAME)
+    c.setFont(FONT_NAME, FONT_SIZE)
+    for y, label in LABELS:
+        c.drawString(LEFT, y, label)
+    c.drawString(LEFT, THANKS_Y, "Спасибо за покупку!")
+    c.endForm()
+
+
+# Отступы значений от левого края, считаются один раз после регистрации шрифта
+_value_offsets = None
+
+
+def _draw_code(c, code):
+    """Печатает код строкой и QR-кодом. Модули QR рисуются одним контуром прямо на холсте: через
+    QrCodeWidget и renderPDF каждый темный отрезок становился отдельным объектом, и билет с кодом
+    рендерился в десятки раз дольше билета без него."""
+    c.drawString(LEFT, CODE_Y, f"Код билета: {code}")
+    qr = qrencoder.QRCode(None, qrencoder.QRErrorCorrectLevel.L)
+    qr.addData(code)
+    qr.make()
+    module = QR_SIZE / (qr.getModuleCount() + QR_BORDER * 2)
+    path = c.beginPath()
+    for row_index, row in enumerate(qr.modules):
+        y = QR_Y + QR_SIZE - (row_index + QR_BORDER + 1) * module
+        column = 0
+        # Соседние темные модули строки — один прямоугольник
+        for dark, run in itertools.groupby(row):
+            count = len(list(run))
+            if dark:
+                path.rect(QR_X + (column + QR_BORDER) * module, y, count * module, module)
+            column += count
+    c.drawPath(path, stroke=0, fill=1)
+
+
+def _draw_ticket(c, email, play_name, date, zone_name, ticket_count, seats=None, code=None):
+    global _value_offsets
+    if _value_offsets is None:
+        _value_offsets = [LEFT + pdfmetrics.stringWidth(label, FONT_NAME, FONT_SIZE) for _, label in LABELS]
+
+    c.doForm(TEMPLATE_NAME)
+    c.setFont(FONT_NAME, FONT_SIZE)
+    values = (play_name, date, zone_name, ticket_count, email)
+    for (y, _), x, value in zip(LABELS, _value_offsets, values):
+        c.drawString(x, y, str(value))
+    if seats:
+        c.drawString(LEFT, SEATS_Y, f"Места: {seatmap.format_seats(seats)}")
+    if code:
+        _draw_code(c, code)
+    c.showPage()
+
+
+def render_ticket(file_name, email, play_name, date, zone_name, ticket_count, seats=None, code=None):
+    """Сохраняет один билет в PDF. code — код билета (checkin.ticket_code) для QR-кода."""
+    register_font()
+    c = canvas.Canvas(file_name, pagesize=letter)
+    _define_template(c)
+    _draw_ticket(c, email, play_name, date, zone_name, ticket_count, seats, code)
+    c.save()
+    return file_name
+
+
+def render_order_ticket(file_name, db_path, order_id, email, play_name, date, zone_name, ticket_count, seats=None):
+    """render_ticket с кодом заказа order_id из базы db_path. Для рабочего потока: при первом обращении
+    ключ читается (или создается) на диске."""
+    return render_ticket(file_name, email, play_name, date, zone_name, ticket_count, seats,
+                         checkin.ticket_code(db_path, order_id))
+
+
+def render_combined(file_name, orders, key=None):
+    """Сохраняет все билеты в один PDF, по странице на заказ. С ключом (checkin.ticket_key) на билетах
+    печатаются коды для проверки на входе."""
+    register_font()
+    c = canvas.Canvas(file_name, pagesize=letter)
+    _define_template(c)
+    for order_id, email, play_name, date, zone_name, ticket_count, seats in orders:
+        code = checkin.sign(key, order_id) if key else None
+        _draw_ticket(c, email, play_name, date, zone_name, ticket_count, seats, code)
+    c.save()
+    return len(orders)
+
+
+def _render_chunk(jobs):
+    """Рендерит пачку отдельных билетов в процессе пула."""
+    for file_name, (_, email, play_name, date, zone_name, ticket_count, seats), code in jobs:
+        render_ticket(file_name, email, play_name, date, zone_name, ticket_count, seats, code)
+    return len(jobs)
+
+
+def render_individual(out_dir, orders, workers=None, key=None):
+    """Сохраняет каждый заказ в отдельный файл ticket_<id>.pdf параллельно в пуле процессов."""
+    os.makedirs(out_dir, exist_ok=True)
+    # Коды подписываются здесь, чтобы ключ не передавать в процессы пула
+    jobs = [(os.path.join(out_dir, f"ticket_{order[0]}.pdf"), order, checkin.sign(key, order[0]) if key else None)
+            for order in orders]
+    chunks = [jobs[i:i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+
+    if len(chunks) <= 1:
+        return sum(_render_chunk(chunk) for chunk in chunks)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=register_font) as pool:
+        return sum(pool.map(_render_chunk, chunks))
+
+
+def orders_query(date_from, date_to=None, play_name=None):
+    """Запрос заказов для печати и его параметры: (sql, params)."""
+    sql = f"SELECT {ORDER_COLUMNS} FROM order_details WHERE date BETWEEN ? AND ?"
+    params = [date_from, date_to or date_from]
+    if play_name:
+        sql += " AND play_name = ?"
+        params.append(play_name)
+    return sql, params
+
+
+def load_orders(conn, date_from, date_to=None, play_name=None):
+    """Заказы на дату (или диапазон дат включительно), при необходимости — только на один спектакль."""
+    # Порядок печати (дата, спектакль, зона) не совпадает ни с одним индексом; сортировка здесь
+    # вместо ORDER BY, чтобы запрос не строил временное B-дерево
+    orders = conn.execute(*orders_query(date_from, date_to, play_name)).fetchall()
+    return sorted(orders, key=lambda order: (order[3], order[2], order[4], order[0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакетная печать билетов на сеанс или диапазон дат.")
+    parser.add_argument("date", help="дата спектакля (ГГГГ-ММ-ДД) или начало диапазона")
+    parser.add_argument("--to", dest="date_to", help="конец диапазона дат включительно")
+    parser.add_argument("--play", help="только этот спектакль")
+    parser.add_argument("--db", default=booking.DB_PATH, help="путь к базе данных")
+    parser.add_argument("--workers", type=int, help="число процессов (по умолчанию — по числу ядер)")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--out", help="папка для отдельных файлов билетов")
+    output.add_argument("--combined", help="один PDF со всеми билетами")
+    args = parser.parse_args()
+
+    conn = booking.connect(args.db)
+    orders = load_orders(conn, args.date, args.date_to, args.play)
+    conn.close()
+    key = checkin.ticket_key(args.db)
+
+    started = time.perf_counter()
+    if args.combined:
+        count = render_combined(args.combined, orders, key)
+    else:
+        count = render_individual(args.out, orders, args.workers, key)
+    elapsed = time.perf_counter() - started
+
+    print(f"Напечатано билетов: {count} за {elapsed:.2f} с.")
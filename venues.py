@@ -0,0 +1,128 @@
+"""Залы театра: по базе данных (шарду) на зал и маршрутизация запросов между ними.
+
+Каждый зал — отдельный файл базы с полной схемой (спектакли, сеансы, зоны, заказы, брони), поэтому
+заказы в разных залах берут разные блокировки записи и не ждут друг друга. Список залов читается
+из venues.json (другой путь можно задать в THEATER_VENUES), пути к базам — относительно файла:
+
+    {"Большой зал": "theater.db", "Малый зал": "small_hall.db"}
+
+Без файла работает один зал с базой booking.DB_PATH. Запись и остатки всегда идут в базу своего
+зала (VenueRouter.path), а чтения по всем залам — список дат и история покупателя — выполняются
+одним запросом UNION ALL по подключению VenueRouter.connect, к которому базы остальных залов
+присоединены через ATTACH. Для записи это подключение не используется: BEGIN IMMEDIATE на нем
+заблокировал бы все присоединенные базы сразу.
+"""
+import json
+import os
+
+import archive
+import booking
+import service
+
+VENUES_FILE = "venues.json"
+DEFAULT_VENUE = "Основной зал"
+
+# SQLite по умолчанию позволяет присоединить не больше 10 баз
+MAX_ATTACHED = 10
+
+_HISTORY_SQL = """
+    SELECT * FROM (
+        SELECT id, play_name, date, zone_name, ticket_count, seats, order_date, {index} AS venue
+        FROM {schema}.order_details WHERE email = ? AND id < ? ORDER BY id DESC LIMIT ?
+    )
+"""
+
+
+def load_venues(path=None):
+    """Залы и пути к их базам: {зал: путь} в порядке из файла."""
+    path = path or os.environ.get("THEATER_VENUES") or VENUES_FILE
+    if not os.path.exists(path):
+        return {DEFAULT_VENUE: booking.DB_PATH}
+    with open(path, encoding="utf-8") as f:
+        venues = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    return {name: os.path.join(base, db_path) for name, db_path in venues.items()}
+
+
+class VenueRouter:
+    """Направляет запросы в базу нужного зала и собирает чтения по всем залам."""
+
+    def __init__(self, venues=None):
+        self.venues = venues or load_venues()
+        if len(self.venues) > MAX_ATTACHED + 1:
+            raise ValueError(f"Залов больше {MAX_ATTACHED + 1}: столько баз не присоединить к одному подключению")
+        self.names = list(self.venues)
+        # База первого зала открывается как main, остальные присоединяются как venue1, venue2, ...
+        self.schemas = ["main"] + [f"venue{index}" for index in range(1, len(self.names))]
+        # Базы залов, схема которых уже доведена до текущей версии
+        self.prepared = set()
+
+    def path(self, venue):
+        """Путь к базе зала."""
+        try:
+            return self.venues[venue]
+        except KeyError:
+            raise booking.BookingError(f"Нет такого зала: {venue}")
+
+    def _prepare(self, path):
+        """Создает схему в базе нового зала и применяет миграции (один раз на зал): запросы UNION ALL
+        по залам читают таблицы и представления текущей схемы."""
+        if path in self.prepared:
+            return
+        conn = booking.connect(path)
+        try:
+            service.prepare_database(conn)
+        finally:
+            conn.close()
+        self.prepared.add(path)
+
+    def connect(self, **kwargs):
+        """Подключение только для чтений по всем залам: базы залов присоединены через ATTACH.
+        Базы, которые еще не подготовлены (новый зал, старая схема), сначала доводятся до текущей схемы."""
+        for path in self.venues.values():
+            self._prepare(path)
+        conn = booking.connect(self.venues[self.names[0]], **kwargs)
+        for schema, name in zip(self.schemas[1:], self.names[1:]):
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (self.venues[name],))
+        return conn
+
+    def list_dates(self, conn):
+        """Даты спектаклей во всех залах: [(дата, [залы])]."""
+        sql = " UNION ALL ".join(f"SELECT DISTINCT date, {index} FROM {schema}.showtimes"
+                                 for index, schema in enumerate(self.schemas))
+        dates = {}
+        for date, index in conn.execute(f"SELECT * FROM ({sql}) ORDER BY 1, 2"):
+            dates.setdefault(date, []).append(self.names[index])
+        return list(dates.items())
+
+    def history_cursor(self, orders):
+        """Позиция для следующей страницы истории по уже прочитанным строкам: {зал: наименьший id}.
+        У каждого зала своя нумерация заказов, поэтому продолжать нужно с отдельного id для каждого."""
+        cursor = {}
+        for order in orders:
+            venue, order_id = order[7], order[0]
+            if order_id < cursor.get(venue, order_id + 1):
+                cursor[venue] = order_id
+        return cursor
+
+    def load_history_page(self, conn, email, before=None, limit=service.HISTORY_PAGE_SIZE):
+        """Страница истории покупателя по всем залам, от новых заказов к старым: строки как у
+        service.load_history_page с названием зала восьмым полем. before — history_cursor прочитанных строк.
+        Внутри зала порядок по id совпадает с порядком оформления, поэтому в каждом зале берется
+        не больше limit заказов после его позиции, а страницы залов сливаются по дате оформления."""
+        before = before or {}
+        no_limit = 2 ** 63 - 1
+        sql = " UNION ALL ".join(_HISTORY_SQL.format(index=index, schema=schema)
+                                 for index, schema in enumerate(self.schemas))
+        params = []
+        for name in self.names:
+            params += [email, before.get(name, no_limit), limit]
+        rows = [(*row[:7], self.names[row[7]]) for row in conn.execute(sql, params)]
+
+        # Заказы прошедших сеансов, перенесенные в архив зала
+        for schema, name in zip(self.schemas, self.names):
+            rows += [(*row, name) for row in archive.load_orders(conn, email, before.get(name), limit,
+                                                                 schema=schema)]
+
+        rows.sort(key=lambda row: (row[6] or "", -self.names.index(row[7]), row[0]), reverse=True)
+        return rows[:limit]
@@ -0,0 +1,128 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import booking
+
+# Рабочих потоков немного: SQLite все равно пишет по одному, а чтения в WAL идут параллельно
+MAX_WORKERS = 4
+
+_local = threading.local()
+
+
+def get_connection(path=booking.DB_PATH):
+    """Возвращает подключение текущего рабочего потока (одно на поток и базу). path — путь к базе
+    или функция, открывающая подключение (например, venues.VenueRouter.connect)."""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    if path not in connections:
+        connections[path] = path() if callable(path) else booking.connect(path)
+    return connections[path]
+
+
+class TaskSignals(QObject):
+    """Сигналы задачи; доставляются в поток интерфейса через очередь событий Qt."""
+    finished = pyqtSignal(object, object)
+    failed = pyqtSignal(object, object)
+
+
+class Task(QRunnable):
+    """Задача для пула потоков. Отмененная задача не запускается, а ее результат не доставляется."""
+
+    def __init__(self, func, args, db_path=None, on_result=None, on_error=None, channel=None):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.db_path = db_path
+        self.on_result = on_result
+        self.on_error = on_error
+        self.channel = channel
+        self.cancelled = False
+        self.signals = TaskSignals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        # Сигнал отправляется всегда, чтобы исполнитель забыл задачу; отмененный результат отбросит он сам
+        if self.cancelled:
+            self.signals.finished.emit(self, None)
+            return
+        try:
+            if self.db_path is not None:
+                result = self.func(get_connection(self.db_path), *self.args)
+            else:
+                result = self.func(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self, e)
+        else:
+            self.signals.finished.emit(self, result)
+
+
+class Executor(QObject):
+    """Выполняет работу с базой и PDF в пуле потоков, чтобы окно не зависало.
+
+    Задачи с одинаковым channel вытесняют друг друга: при новом запросе предыдущий
+    отменяется, и устаревший результат каскада не попадет в интерфейс.
+    """
+
+    def __init__(self, db_path=booking.DB_PATH, max_workers=MAX_WORKERS, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        # Потоки живут все время работы приложения, чтобы не переоткрывать их подключения
+        self.pool.setExpiryTimeout(-1)
+        self.channels = {}
+        self.active = set()
+
+    def submit(self, func, *args, on_result=None, on_error=None, channel=None, db=True):
+        """Ставит func в очередь. При db=True первым аргументом передается подключение рабочего потока
+        к базе исполнителя, а если db — путь к другой базе (или функция подключения), то к ней.
+        Колбэки вызываются в потоке интерфейса."""
+        if channel is not None:
+            self.cancel(channel)
+
+        task = Task(func, args, self.db_path if db is True else (db or None), on_result, on_error, channel)
+        task.setAutoDelete(False)
+        self.active.add(task)
+        if channel is not None:
+            self.channels[channel] = task
+
+        # Слоты — методы объекта из потока интерфейса, поэтому Qt доставит сигнал через очередь событий
+        task.signals.finished.connect(self._on_finished)
+        task.signals.failed.connect(self._on_failed)
+        self.pool.start(task)
+        return task
+
+    def cancel(self, channel):
+        """Отменяет последнюю задачу канала, если она еще не завершилась."""
+        task = self.channels.pop(channel, None)
+        if task is not None:
+            task.cancel()
+            if self.pool.tryTake(task):
+                self.active.discard(task)
+
+    def _forget(self, task):
+        self.active.discard(task)
+        if task.channel is not None and self.channels.get(task.channel) is task:
+            del self.channels[task.channel]
+
+    def _on_finished(self, task, result):
+        self._forget(task)
+        # Задачу могли отменить, пока результат ждал в очереди событий
+        if task.on_result is not None and not task.cancelled:
+            task.on_result(result)
+
+    def _on_failed(self, task, error):
+        self._forget(task)
+        if task.on_error is not None and not task.cancelled:
+            task.on_error(error)
+
+    def shutdown(self):
+        """Отменяет задачи в очереди и дожидается выполняющихся."""
+        for channel in list(self.channels):
+            self.cancel(channel)
+        self.pool.clear()
+        self.pool.waitForDone()